@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.translation import gettext_lazy as _
+from common.pagination import EstimatedCountPaginator
 from .models import User, OTP
 
 
@@ -11,9 +12,13 @@ class UserAdmin(BaseUserAdmin):
     list_display = ('email', 'username',
                     'is_staff', 'is_active', 'date_joined')
     list_filter = ('is_staff', 'is_active', 'date_joined')
-    search_fields = ('email', 'username',)
-    ordering = ('-date_joined',)
+    # Prefix search, served by the UPPER(...) pattern indexes on User
+    search_fields = ('^email', '^username',)
+    ordering = ('-date_joined', '-id')
     readonly_fields = ('date_joined', 'last_login')
+    # Avoid COUNT(*) over the whole table on every changelist page
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     fieldsets = (
         (None, {'fields': ('email', 'username', 'password')}),
@@ -37,6 +42,11 @@ class OTPAdmin(admin.ModelAdmin):
 
     list_display = ('user', 'code', 'is_used', 'created_at')
     list_filter = ('is_used', 'created_at')
-    search_fields = ('user__email', 'user__username', 'code')
+    list_select_related = ('user',)
+    # Prefix search on the user's indexed columns; codes aren't searchable
+    search_fields = ('^user__email', '^user__username')
     ordering = ('-created_at',)
     readonly_fields = ('created_at',)
+    raw_id_fields = ('user',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -8,3 +8,4 @@ class AccountsConfig(AppConfig):
     def ready(self):
         """Import signal handlers when the app is ready."""
         import accounts.signals
+        import common.db  # counts opened database connections
@@ -0,0 +1,253 @@
+"""
+Async (ASGI-native) versions of the password reset and user details views.
+
+DRF's ``APIView`` is sync-only, so under an ASGI server every request to the
+views in ``accounts.views`` is funnelled through ``sync_to_async``. The views
+here are plain async Django views that use the async ORM, the async cache API
+and the async mail path, while keeping the same request and response formats.
+They are enabled with ``settings.ASYNC_AUTH_VIEWS`` (see ``accounts.urls``).
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse, JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django_ratelimit.exceptions import Ratelimited
+from rest_framework import exceptions, status
+from rest_framework.settings import api_settings
+
+from common.exceptions import Conflict, custom_exception_handler
+from common.ratelimit import is_ratelimited
+from common.serializers import compile_serializer
+from .authentication import CachedJWTAuthentication
+from .models import User
+from .otp_issuance import IDEMPOTENCY_HEADER, aissue_otp
+from .otp_store import OTPConflict, OTPError, get_otp_store
+from .reset_tokens import (
+    INVALID_RESET_TOKEN,
+    RESET_TOKEN_USED,
+    acheck_reset_token,
+    areset_password,
+    make_reset_token,
+)
+from .serializers import (
+    RequestPasswordResetSerializer,
+    ResetPasswordSerializer,
+    UserSerializer,
+    VerifyOTPSerializer,
+)
+from .tasks import aqueue_otp_email
+
+
+def fields_only(serializer_class, skip=()):
+    """
+    Return a subclass of ``serializer_class`` that only runs field validation.
+
+    The checks that hit the database (e.g. consuming the OTP) are done by the
+    async views themselves, so ``is_valid()`` never touches the sync ORM.
+    Validators named in ``skip`` are replaced with no-ops.
+    """
+    attrs = {name: lambda self, value: value for name in skip}
+    attrs['validate'] = lambda self, attrs: attrs
+    return type(serializer_class.__name__, (serializer_class,), attrs)
+
+
+# Set by DRF's exception handler for 401s, 429s and 405s
+EXCEPTION_HEADERS = ('WWW-Authenticate', 'Retry-After', 'Allow')
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncAPIView(View):
+    """
+    Minimal async counterpart of DRF's ``APIView``: JSON parsing, JWT
+    authentication, throttling and the project's error envelopes.
+    """
+
+    permission_required = False
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+    ratelimit_rate = None
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            await self.initial(request)
+            return await super().dispatch(request, *args, **kwargs)
+        except Exception as exc:
+            return self.handle_exception(exc)
+
+    async def initial(self, request):
+        request.user = AnonymousUser()
+        request.auth = None
+
+        authenticator = CachedJWTAuthentication()
+        result = await authenticator.aauthenticate(request)
+        if result is not None:
+            request.user, request.auth = result
+        elif self.permission_required:
+            raise exceptions.NotAuthenticated()
+
+        self.check_throttles(request)
+
+    def check_throttles(self, request):
+        if self.ratelimit_rate and request.method == 'POST' and is_ratelimited(
+                request, group=f'{type(self).__module__}.{type(self).__name__}',
+                key='ip', rate=self.ratelimit_rate, increment=True):
+            raise Ratelimited()
+
+        for throttle_class in self.throttle_classes:
+            throttle = throttle_class()
+            if not throttle.allow_request(request, self):
+                raise exceptions.Throttled(throttle.wait())
+
+    def handle_exception(self, exc):
+        if isinstance(exc, (exceptions.NotAuthenticated,
+                            exceptions.AuthenticationFailed)):
+            exc.auth_header = CachedJWTAuthentication().authenticate_header(None)
+
+        response = custom_exception_handler(exc, {'view': self})
+        if response is None:
+            raise exc
+
+        content = getattr(response, 'prerendered', None)
+        if content is not None:
+            json_response = HttpResponse(
+                content, content_type='application/json', status=response.status_code)
+        else:
+            json_response = JsonResponse(response.data, status=response.status_code)
+        # Only the headers DRF's handler adds; its Content-Type is text/html
+        for header in EXCEPTION_HEADERS:
+            if header in response:
+                json_response[header] = response[header]
+        return json_response
+
+    def get_data(self, request):
+        if request.content_type == 'application/json':
+            try:
+                return json.loads(request.body or b'{}')
+            except ValueError as exc:
+                raise exceptions.ParseError(f'JSON parse error - {exc}')
+        return request.POST
+
+    def validation_error(self, errors):
+        return JsonResponse(errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class AsyncRequestPasswordResetView(AsyncAPIView):
+    """
+    Request a password reset and send OTP code to the user's email.
+    """
+    ratelimit_rate = '3/h'
+    serializer_class = fields_only(
+        RequestPasswordResetSerializer, skip=['validate_email'])
+
+    async def post(self, request, *args, **kwargs):
+        serializer = self.serializer_class(data=self.get_data(request))
+        if not serializer.is_valid():
+            return self.validation_error(serializer.errors)
+
+        user = await User.objects.filter(
+            email=serializer.validated_data['email']).afirst()
+        if user is None:
+            return self.validation_error(
+                {"email": ["No user with this email address exists."]})
+
+        otp_code = await aissue_otp(user, request.headers.get(IDEMPOTENCY_HEADER))
+        if otp_code is not None:
+            await aqueue_otp_email(user.id, otp_code)
+
+        return JsonResponse(
+            {"detail": "OTP has been sent to your email address."},
+            status=status.HTTP_200_OK
+        )
+
+
+class AsyncVerifyOTPView(AsyncAPIView):
+    """
+    Verify the OTP code sent to the user's email.
+    """
+    ratelimit_rate = '10/m'
+    serializer_class = fields_only(VerifyOTPSerializer)
+
+    async def post(self, request, *args, **kwargs):
+        serializer = self.serializer_class(data=self.get_data(request))
+        if not serializer.is_valid():
+            return self.validation_error(serializer.errors)
+
+        try:
+            user = await get_otp_store().aconsume(
+                serializer.validated_data['email'],
+                serializer.validated_data['otp_code'],
+                with_user=True,
+            )
+        except OTPConflict as exc:
+            raise Conflict(exc.message)
+        except OTPError as exc:
+            return self.validation_error({exc.field: [exc.message]})
+
+        return JsonResponse(
+            {"detail": "OTP verified successfully.",
+             "reset_token": make_reset_token(user)},
+            status=status.HTTP_200_OK
+        )
+
+
+class AsyncResetPasswordView(AsyncAPIView):
+    """
+    Reset the user's password with the token returned by OTP verification.
+    """
+    ratelimit_rate = '3/h'
+    serializer_class = fields_only(ResetPasswordSerializer)
+
+    async def post(self, request, *args, **kwargs):
+        serializer = self.serializer_class(data=self.get_data(request))
+        if not serializer.is_valid():
+            return self.validation_error(serializer.errors)
+
+        data = serializer.validated_data
+        if data['new_password'] != data['confirm_password']:
+            return self.validation_error(
+                {"confirm_password": ["Passwords do not match."]})
+
+        user = await acheck_reset_token(data['reset_token'])
+        if user is None:
+            return self.validation_error({"reset_token": [INVALID_RESET_TOKEN]})
+
+        if not await areset_password(user, data['new_password']):
+            raise Conflict(RESET_TOKEN_USED)
+
+        return JsonResponse(
+            {"detail": "Password has been reset successfully."},
+            status=status.HTTP_200_OK
+        )
+
+
+class AsyncUserDetailsView(AsyncAPIView):
+    """
+    Retrieve or update the authenticated user's details.
+    """
+    permission_required = True
+
+    async def get(self, request, *args, **kwargs):
+        return JsonResponse(compile_serializer(UserSerializer).to_representation(request.user))
+
+    async def put(self, request, *args, **kwargs):
+        return await self.update(request, partial=False)
+
+    async def patch(self, request, *args, **kwargs):
+        return await self.update(request, partial=True)
+
+    async def update(self, request, partial):
+        user = request.user
+        if not isinstance(user, User):
+            # Snapshot users are only issued for safe methods
+            user = await User.objects.aget(pk=user.pk)
+
+        serializer = UserSerializer(user, data=self.get_data(request), partial=partial)
+        # Uniqueness validators and save() use the sync ORM
+        if not await sync_to_async(serializer.is_valid)():
+            return self.validation_error(serializer.errors)
+        await sync_to_async(serializer.save)()
+
+        return JsonResponse(serializer.data)
@@ -0,0 +1,87 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .tokens import SnapshotUser, is_snapshot_current, snapshot_enabled
+from .user_cache import get_user_cache
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that resolves ``user_id`` through the user cache
+    instead of querying the database on every request.
+
+    With ``JWT_USER_SNAPSHOT`` enabled, safe requests carrying a current
+    snapshot are authenticated from the token alone (see ``accounts.tokens``).
+    """
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+
+        if (snapshot_enabled() and request.method in SAFE_METHODS
+                and is_snapshot_current(validated_token)):
+            return SnapshotUser(validated_token), validated_token
+
+        return self.get_user(validated_token), validated_token
+
+    def get_user(self, validated_token):
+        user = get_user_cache().get(self._get_user_id(validated_token))
+        return self._check_user(user, validated_token)
+
+    async def aauthenticate(self, request):
+        """
+        Async counterpart of ``authenticate`` for async views; token checks
+        are CPU-only and the user comes from the async cache/ORM path.
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+
+        if (snapshot_enabled() and request.method in SAFE_METHODS
+                and is_snapshot_current(validated_token)):
+            return SnapshotUser(validated_token), validated_token
+
+        user = await get_user_cache().aget(self._get_user_id(validated_token))
+        return self._check_user(user, validated_token), validated_token
+
+    def _get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(
+                _("Token contained no recognizable user identification")
+            ) from e
+
+    def _check_user(self, user, validated_token):
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        return user
@@ -0,0 +1,54 @@
+"""
+Rendering of transactional emails.
+
+Every message has a hand-written plain-text template next to its HTML one,
+``email_templates/<name>.txt`` and ``<name>.html``, extending ``base.txt`` and
+``base.html`` for the shared layout. No HTML is stripped at send time.
+
+Both templates are compiled once per process (behind the cached template
+loader), so rendering a message is two ``Template.render`` calls. To add a
+message, write the two templates and add its subject to ``SUBJECTS``.
+"""
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.template.loader import get_template
+
+from common.instrumentation import timed
+
+SUBJECTS = {
+    'password_reset': 'Password Reset OTP',
+    'welcome': 'Welcome to Our App!',
+}
+
+
+@lru_cache(maxsize=None)
+def get_templates(name):
+    """Return the compiled (text, HTML) templates for a message."""
+    return (get_template(f'email_templates/{name}.txt'),
+            get_template(f'email_templates/{name}.html'))
+
+
+@receiver(setting_changed)
+def _reset_templates(setting, **kwargs):
+    if setting == 'TEMPLATES':
+        get_templates.cache_clear()
+
+
+def render_email(name, context):
+    """Render a message's (text, HTML) bodies."""
+    text_template, html_template = get_templates(name)
+    with timed('template'):
+        return text_template.render(context), html_template.render(context)
+
+
+def build_message(name, to, context, connection=None):
+    """Build a ready-to-send message with text and HTML alternatives."""
+    text, html = render_email(name, context)
+    message = EmailMultiAlternatives(
+        SUBJECTS[name], text, settings.DEFAULT_FROM_EMAIL, to, connection=connection)
+    message.attach_alternative(html, 'text/html')
+    return message
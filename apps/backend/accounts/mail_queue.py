@@ -0,0 +1,294 @@
+"""
+Background delivery for transactional email.
+
+Views and signals hand messages off with ``enqueue`` and return immediately.
+``settings.EMAIL_QUEUE['BACKEND']`` selects how they are delivered:
+
+- ``sync``: deliver inline, in the calling thread (tests, local development).
+- ``thread``: deliver from an in-process thread pool.
+- ``database``: store an ``EmailJob`` row that the ``run_email_worker``
+  management command picks up, so mail survives process restarts.
+
+Secrets in a payload (the OTP code) are only kept until the job is sent or
+given up on, and sent jobs are deleted after ``RETENTION_DAYS`` days.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.signals import setting_changed
+from django.db import connection, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from common.instrumentation import timed
+from .models import EmailJob
+from .tasks import build_email, deliver_email
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BACKEND': 'thread',
+    'CONCURRENCY': 4,
+    'MAX_RETRIES': 5,
+    'RETRY_BACKOFF': 2,
+    'BATCH_SIZE': 50,
+    'LEASE_SECONDS': 300,
+    'RETENTION_DAYS': 7,
+}
+
+# Payload entries dropped from a job once it no longer needs them
+SECRET_PAYLOAD_KEYS = ('otp_code',)
+
+
+def get_queue_settings():
+    """Return the EMAIL_QUEUE settings merged over the defaults."""
+    return {**DEFAULTS, **getattr(settings, 'EMAIL_QUEUE', {})}
+
+
+def scrub_payload(payload):
+    """Return ``payload`` without its ``SECRET_PAYLOAD_KEYS``."""
+    return {key: value for key, value in payload.items() if key not in SECRET_PAYLOAD_KEYS}
+
+
+def retry_delay(attempts, options):
+    """Seconds to wait before the next attempt (exponential backoff)."""
+    return options['RETRY_BACKOFF'] ** attempts
+
+
+class SyncQueue:
+    """Deliver messages immediately in the calling thread."""
+
+    def __init__(self, options):
+        self.options = options
+
+    def enqueue(self, kind, payload):
+        deliver_email(kind, payload)
+
+    def enqueue_many(self, kind, payloads):
+        for payload in payloads:
+            self.enqueue(kind, payload)
+
+    async def aenqueue(self, kind, payload):
+        message = await sync_to_async(build_email)(kind, payload)
+        if message is not None:
+            # SMTP needs no database connection, so it can leave the shared
+            # thread and many deliveries can wait on the server at once
+            with timed('email'):
+                await sync_to_async(message.send, thread_sensitive=False)(
+                    fail_silently=False)
+
+
+class ThreadQueue:
+    """Deliver messages from an in-process pool of worker threads."""
+
+    def __init__(self, options):
+        self.options = options
+        self.executor = ThreadPoolExecutor(
+            max_workers=options['CONCURRENCY'],
+            thread_name_prefix='email-queue',
+        )
+
+    def enqueue(self, kind, payload):
+        self.executor.submit(self._run, kind, payload)
+
+    def enqueue_many(self, kind, payloads):
+        for payload in payloads:
+            self.enqueue(kind, payload)
+
+    async def aenqueue(self, kind, payload):
+        self.enqueue(kind, payload)
+
+    def _run(self, kind, payload):
+        try:
+            for attempt in range(self.options['MAX_RETRIES'] + 1):
+                try:
+                    deliver_email(kind, payload)
+                    return
+                except Exception as e:
+                    if attempt == self.options['MAX_RETRIES']:
+                        logger.error("Giving up on %s email: %s", kind, e)
+                        return
+                    delay = retry_delay(attempt + 1, self.options)
+                    logger.warning(
+                        "Error sending %s email, retrying in %ss: %s", kind, delay, e)
+                    time.sleep(delay)
+        finally:
+            # Worker threads each hold their own database connection.
+            connection.close()
+
+
+class DatabaseQueue:
+    """Persist messages as ``EmailJob`` rows for ``run_email_worker``."""
+
+    def __init__(self, options):
+        self.options = options
+
+    def enqueue(self, kind, payload):
+        EmailJob.objects.create(kind=kind, payload=payload)
+
+    def enqueue_many(self, kind, payloads):
+        EmailJob.objects.bulk_create(
+            [EmailJob(kind=kind, payload=payload) for payload in payloads],
+            batch_size=self.options['BATCH_SIZE'],
+        )
+
+    async def aenqueue(self, kind, payload):
+        await EmailJob.objects.acreate(kind=kind, payload=payload)
+
+    def claim(self, batch_size):
+        """
+        Lock and lease up to ``batch_size`` due jobs.
+
+        Jobs stay in ``sending`` until their lease runs out, after which a
+        crashed worker's jobs are picked up again.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            jobs = list(
+                EmailJob.objects.select_for_update(skip_locked=True)
+                .filter(status__in=[EmailJob.STATUS_PENDING, EmailJob.STATUS_SENDING],
+                        run_after__lte=now)
+                .order_by('run_after')[:batch_size]
+            )
+            EmailJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                status=EmailJob.STATUS_SENDING,
+                run_after=now + timedelta(seconds=self.options['LEASE_SECONDS']),
+            )
+        return jobs
+
+    def run_job(self, job, connection=None):
+        """Deliver one claimed job and record the outcome."""
+        try:
+            deliver_email(job.kind, job.payload, connection=connection)
+        except Exception as e:
+            job.attempts += 1
+            job.last_error = str(e)
+            if job.attempts > self.options['MAX_RETRIES']:
+                job.status = EmailJob.STATUS_FAILED
+                job.payload = scrub_payload(job.payload)
+                logger.error("Giving up on %s email %s: %s", job.kind, job.pk, e)
+            else:
+                job.status = EmailJob.STATUS_PENDING
+                job.run_after = timezone.now() + timedelta(
+                    seconds=retry_delay(job.attempts, self.options))
+            job.save(update_fields=['status', 'payload', 'attempts', 'last_error', 'run_after'])
+            return False
+
+        job.status = EmailJob.STATUS_SENT
+        job.payload = scrub_payload(job.payload)
+        job.save(update_fields=['status', 'payload'])
+        return True
+
+    def purge_sent(self):
+        """
+        Delete jobs sent more than ``RETENTION_DAYS`` days ago. Returns the
+        number deleted.
+
+        A sent job's ``run_after`` is the end of the lease it was sent under,
+        so this uses the (status, run_after) index.
+        """
+        cutoff = timezone.now() - timedelta(days=self.options['RETENTION_DAYS'])
+        deleted, _ = EmailJob.objects.filter(
+            status=EmailJob.STATUS_SENT, run_after__lt=cutoff).delete()
+        return deleted
+
+    def _open(self, mail_connection):
+        try:
+            mail_connection.open()
+        except Exception as e:
+            # Each send retries the connection and records its own failure
+            logger.warning("Could not open mail connection: %s", e)
+
+    def run_jobs(self, jobs):
+        """
+        Deliver jobs in order over a single SMTP connection, replaced as soon
+        as a send finds it dead so the rest of the jobs don't fail on it.
+        """
+        mail_connection = get_connection()
+        try:
+            self._open(mail_connection)
+            for job in jobs:
+                self.run_job(job, connection=mail_connection)
+                if getattr(mail_connection, '_broken', False):
+                    try:
+                        mail_connection.close()
+                    except Exception as e:
+                        logger.warning("Could not close broken mail connection: %s", e)
+                    self._open(mail_connection)
+        finally:
+            mail_connection.close()
+
+    def process_batch(self, executor=None, batch_size=None, concurrency=1):
+        """
+        Claim and deliver one batch of jobs. Returns the number claimed.
+
+        With an executor the batch is split into ``concurrency`` chunks, each
+        flushed over its own connection from a worker thread.
+        """
+        jobs = self.claim(batch_size or self.options['BATCH_SIZE'])
+        if not jobs:
+            return 0
+
+        if executor is None:
+            self.run_jobs(jobs)
+        else:
+            chunks = [jobs[i::concurrency]
+                      for i in range(min(concurrency, len(jobs)))]
+            list(executor.map(self._run_jobs_in_thread, chunks))
+        return len(jobs)
+
+    def _run_jobs_in_thread(self, jobs):
+        try:
+            return self.run_jobs(jobs)
+        finally:
+            connection.close()
+
+
+BACKENDS = {
+    'sync': SyncQueue,
+    'thread': ThreadQueue,
+    'database': DatabaseQueue,
+}
+
+_queue = None
+
+
+def get_queue():
+    """Return the process-wide queue for the configured backend."""
+    global _queue
+    if _queue is None:
+        options = get_queue_settings()
+        _queue = BACKENDS[options['BACKEND']](options)
+    return _queue
+
+
+@receiver(setting_changed)
+def _reset_queue(setting, **kwargs):
+    global _queue
+    if setting == 'EMAIL_QUEUE':
+        _queue = None
+
+
+def enqueue(kind, **payload):
+    """Queue an email of the given kind for background delivery."""
+    get_queue().enqueue(kind, payload)
+
+
+def enqueue_many(kind, payloads):
+    """Queue many emails of one kind at once (one INSERT per batch for ``database``)."""
+    get_queue().enqueue_many(kind, list(payloads))
+
+
+async def aenqueue(kind, **payload):
+    """Async version of ``enqueue`` for async views."""
+    await get_queue().aenqueue(kind, payload)
+
+
+def enqueue_on_commit(kind, **payload):
+    """Queue an email once the current transaction (if any) has committed."""
+    transaction.on_commit(lambda: enqueue(kind, **payload))
@@ -0,0 +1,187 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from accounts.models import User
+from accounts.serializers import UserCreateSerializer
+from accounts.tasks import queue_welcome_emails
+from common.utils import allocate_usernames
+
+# Errors printed before the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+
+class ImportUserSerializer(UserCreateSerializer):
+    """
+    ``UserCreateSerializer`` rules without the per-row uniqueness queries.
+
+    Existing emails and usernames are skipped with one lookup per batch, and
+    missing usernames are allocated for the whole batch at once.
+    """
+
+    class Meta(UserCreateSerializer.Meta):
+        extra_kwargs = {
+            **UserCreateSerializer.Meta.extra_kwargs,
+            'email': {'validators': []},
+            'username': {
+                **UserCreateSerializer.Meta.extra_kwargs['username'],
+                # Empty CSV cells and JSON nulls get an allocated username
+                'allow_blank': True,
+                'allow_null': True,
+                'validators': User._meta.get_field('username').validators,
+            },
+        }
+
+
+def read_rows(path, file_format):
+    """Yield ``(line_number, row)`` from a CSV or JSON Lines file, one at a time."""
+    with open(path, newline='', encoding='utf-8') as f:
+        if file_format == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except json.JSONDecodeError:
+                    yield line_number, None
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = ('Create users in bulk from a CSV or JSON Lines file of email, username '
+            '(optional) and password')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Input format (default: from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Processes used to hash passwords (0 hashes inline)')
+        parser.add_argument('--send-welcome', action='store_true',
+                            help='Queue welcome emails for the created users')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or (
+            'jsonl' if options['path'].endswith(('.jsonl', '.ndjson')) else 'csv')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        executor = None
+        if options['workers'] > 0:
+            executor = ProcessPoolExecutor(
+                max_workers=options['workers'], initializer=django.setup)
+
+        self.counts = {'created': 0, 'skipped': 0, 'invalid': 0}
+        start = time.perf_counter()
+        try:
+            rows = read_rows(options['path'], file_format)
+            for batch in batched(rows, options['batch_size']):
+                self.import_batch(batch, executor, options)
+        except (OSError, UnicodeDecodeError) as e:
+            raise CommandError(f"Could not read {options['path']}: {e}")
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        elapsed = time.perf_counter() - start
+        total = sum(self.counts.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {total} rows in {elapsed:.1f}s ({total / elapsed:.0f} rows/s): "
+            f"{self.counts['created']} created, {self.counts['skipped']} skipped, "
+            f"{self.counts['invalid']} invalid"))
+
+    def import_batch(self, batch, executor, options):
+        valid = []
+        for line_number, row in batch:
+            if not isinstance(row, dict):
+                self.report_invalid(line_number, 'Not a JSON object.')
+                continue
+            data = {**row, 'confirm_password': row.get('password')}
+            serializer = ImportUserSerializer(data=data)
+            if serializer.is_valid():
+                valid.append(serializer.validated_data)
+            else:
+                self.report_invalid(line_number, serializer.errors)
+
+        self.allocate_usernames(valid)
+        valid = self.skip_existing(valid)
+        if not valid:
+            return
+
+        passwords = [attrs['password'] for attrs in valid]
+        if executor is None:
+            hashes = [make_password(password) for password in passwords]
+        else:
+            chunksize = max(1, len(passwords) // (options['workers'] * 4))
+            hashes = list(executor.map(make_password, passwords, chunksize=chunksize))
+
+        # bulk_create sends no post_save signals, so no per-row welcome emails
+        users = [
+            User(email=attrs['email'], username=attrs['username'], password=password)
+            for attrs, password in zip(valid, hashes)
+        ]
+        with transaction.atomic():
+            User.objects.bulk_create(users, batch_size=options['batch_size'])
+            if options['send_welcome']:
+                queue_welcome_emails(user.id for user in users)
+        self.counts['created'] += len(users)
+
+    def allocate_usernames(self, rows):
+        """Generate usernames for rows that don't have one."""
+        missing = [attrs for attrs in rows if not attrs.get('username')]
+        if not missing:
+            return
+        given = {attrs['username'] for attrs in rows if attrs.get('username')}
+        usernames = allocate_usernames(
+            [attrs['email'] for attrs in missing], User, reserved=given)
+        for attrs, username in zip(missing, usernames):
+            attrs['username'] = username
+
+    def skip_existing(self, rows):
+        """Drop rows whose email or username exists in the database or earlier in the batch."""
+        for attrs in rows:
+            attrs['email'] = User.objects.normalize_email(attrs['email'])
+        emails = {attrs['email'] for attrs in rows}
+        usernames = {attrs['username'] for attrs in rows}
+
+        taken_emails, taken_usernames = set(), set()
+        for email, username in User.objects.filter(
+                Q(email__in=emails) | Q(username__in=usernames)).values_list('email', 'username'):
+            taken_emails.add(email)
+            taken_usernames.add(username)
+
+        new_rows = []
+        for attrs in rows:
+            if attrs['email'] in taken_emails or attrs['username'] in taken_usernames:
+                self.counts['skipped'] += 1
+                continue
+            taken_emails.add(attrs['email'])
+            taken_usernames.add(attrs['username'])
+            new_rows.append(attrs)
+        return new_rows
+
+    def report_invalid(self, line_number, errors):
+        self.counts['invalid'] += 1
+        if self.counts['invalid'] <= MAX_REPORTED_ERRORS:
+            self.stderr.write(f'Line {line_number}: {json.dumps(errors)}')
+        elif self.counts['invalid'] == MAX_REPORTED_ERRORS + 1:
+            self.stderr.write('Further invalid rows are counted but not shown')
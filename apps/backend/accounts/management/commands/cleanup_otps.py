@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.otp_cleanup import OTPCleaner, get_cleanup_settings, retire_duplicate_otps
+
+
+class Command(BaseCommand):
+    help = 'Delete expired and used OTP codes in small batches, optionally on a schedule'
+
+    def add_arguments(self, parser):
+        options = get_cleanup_settings()
+        parser.add_argument('--batch-size', type=int, default=options['BATCH_SIZE'])
+        parser.add_argument('--sleep', type=float, default=options['SLEEP'],
+                            help='Seconds to pause between batches')
+        parser.add_argument('--lock-budget', type=float, default=options['LOCK_BUDGET'],
+                            help='Longest a single batch may hold its locks, in seconds')
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help='Stop after this many batches; the next run resumes')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Run again every this many seconds instead of exiting')
+        parser.add_argument('--retire-duplicates', action='store_true',
+                            help='Only mark all but each user\'s newest unused code as used '
+                                 '(needed once before migrating to one live code per user)')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        if options['retire_duplicates']:
+            retired = retire_duplicate_otps()
+            self.stdout.write(self.style.SUCCESS(f'Retired {retired} duplicate OTPs'))
+            return
+
+        cleaner_options = {
+            **get_cleanup_settings(),
+            'BATCH_SIZE': options['batch_size'],
+            'SLEEP': options['sleep'],
+            'LOCK_BUDGET': options['lock_budget'],
+        }
+        cleaner_options['MIN_BATCH_SIZE'] = min(
+            cleaner_options['MIN_BATCH_SIZE'], options['batch_size'])
+
+        while True:
+            stats = OTPCleaner(cleaner_options).run_exclusive(
+                max_batches=options['max_batches'])
+            if stats is None:
+                self.stdout.write('Another cleanup is running; skipped')
+            else:
+                rate = stats['deleted'] / stats['elapsed'] if stats['elapsed'] else 0
+                self.stdout.write(self.style.SUCCESS(
+                    f"Deleted {stats['deleted']} OTPs in {stats['batches']} batches "
+                    f"({rate:.0f} rows/s, slowest batch {stats['slowest'] * 1000:.1f}ms)"))
+
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
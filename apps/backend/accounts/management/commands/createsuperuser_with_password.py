@@ -11,15 +11,11 @@ class Command(BaseCommand):
         parser.add_argument('--email', required=True)
         parser.add_argument('--username', required=True)
         parser.add_argument('--password', required=True)
-        parser.add_argument('--first_name', default='')
-        parser.add_argument('--last_name', default='')
 
     def handle(self, *args, **options):
         email = options['email']
         username = options['username']
         password = options['password']
-        first_name = options['first_name']
-        last_name = options['last_name']
 
         # Check if user already exists
         if User.objects.filter(email=email).exists():
@@ -28,12 +24,10 @@ class Command(BaseCommand):
             return
 
         # Create superuser
-        user = User.objects.create_superuser(
+        User.objects.create_superuser(
             email=email,
             username=username,
             password=password,
-            first_name=first_name,
-            last_name=last_name
         )
 
         self.stdout.write(self.style.SUCCESS(
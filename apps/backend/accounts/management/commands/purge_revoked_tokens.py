@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.revocation import purge_expired, warm
+
+
+class Command(BaseCommand):
+    help = 'Delete expired outstanding/blacklisted refresh tokens and optionally warm the revocation cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--warm', action='store_true',
+                            help='Load unexpired revoked JTIs into the cache')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        deleted = purge_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} expired tokens in {time.perf_counter() - start:.2f}s'))
+
+        if options['warm']:
+            start = time.perf_counter()
+            loaded = warm(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Loaded {loaded} revoked tokens into the cache '
+                f'in {time.perf_counter() - start:.2f}s'))
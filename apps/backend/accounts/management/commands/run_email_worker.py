@@ -0,0 +1,59 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.mail_queue import DatabaseQueue, get_queue_settings
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued emails from the database-backed email queue'
+
+    def add_arguments(self, parser):
+        options = get_queue_settings()
+        parser.add_argument('--concurrency', type=int,
+                            default=options['CONCURRENCY'])
+        parser.add_argument('--batch-size', type=int,
+                            default=options['BATCH_SIZE'])
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Process the queue until empty, then exit')
+        parser.add_argument('--purge-interval', type=float, default=3600,
+                            help='Seconds between deletions of old sent jobs')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be at least 1')
+
+        queue = DatabaseQueue(get_queue_settings())
+        self.stdout.write(
+            f"Email worker started with concurrency {options['concurrency']}")
+
+        # A single worker delivers inline; more fan out over a thread pool
+        executor = None
+        if options['concurrency'] > 1:
+            executor = ThreadPoolExecutor(max_workers=options['concurrency'],
+                                          thread_name_prefix='email-worker')
+        next_purge = 0
+        try:
+            while True:
+                claimed = queue.process_batch(
+                    executor, batch_size=options['batch_size'],
+                    concurrency=options['concurrency'])
+                if claimed:
+                    continue
+                # Purge while idle, so it never delays mail
+                if time.monotonic() >= next_purge:
+                    purged = queue.purge_sent()
+                    if purged:
+                        self.stdout.write(f'Deleted {purged} sent emails')
+                    next_purge = time.monotonic() + options['purge_interval']
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        self.stdout.write(self.style.SUCCESS('Email queue drained'))
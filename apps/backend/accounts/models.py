@@ -1,10 +1,13 @@
 import os
 import uuid
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import RegexValidator
+from common.hashers import get_hashing_service
+from common.indexes import PrefixSearchIndex
 
 
 class UserManager(BaseUserManager):
@@ -71,7 +74,14 @@ class User(AbstractBaseUser, PermissionsMixin):
     class Meta:
         verbose_name = _('user')
         verbose_name_plural = _('users')
-        ordering = ['-date_joined']
+        ordering = ['-date_joined', '-id']
+        indexes = [
+            # Keyset pagination of the user list (scanned backwards)
+            models.Index(fields=['date_joined', 'id']),
+            # Admin prefix search (^email, ^username)
+            PrefixSearchIndex('email', name='accounts_user_email_prefix'),
+            PrefixSearchIndex('username', name='accounts_user_username_prefix'),
+        ]
 
     def __str__(self):
         return self.email
@@ -81,6 +91,38 @@ class User(AbstractBaseUser, PermissionsMixin):
         user_name = f"{self.username}"
         return user_name.strip()
 
+    # Password hashing runs on the bounded pool in common.hashers
+
+    def set_password(self, raw_password):
+        self.password = get_hashing_service().make_password(raw_password)
+        self._password = raw_password
+
+    async def aset_password(self, raw_password):
+        self.password = await get_hashing_service().amake_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        """Check the password, upgrading the stored hash if the hasher changed."""
+
+        def setter(raw_password):
+            self.set_password(raw_password)
+            # Password hash upgrades shouldn't be considered password changes.
+            self._password = None
+            self.save(update_fields=['password'])
+
+        return get_hashing_service().check_password(raw_password, self.password, setter)
+
+    async def acheck_password(self, raw_password):
+        """See check_password()."""
+
+        async def setter(raw_password):
+            await self.aset_password(raw_password)
+            self._password = None
+            await self.asave(update_fields=['password'])
+
+        return await get_hashing_service().acheck_password(
+            raw_password, self.password, setter)
+
 
 class OTP(models.Model):
     """One-Time Password model for password reset."""
@@ -95,12 +137,60 @@ class OTP(models.Model):
         verbose_name = _('OTP')
         verbose_name_plural = _('OTPs')
         ordering = ['-created_at']
+        indexes = [
+            # Batched cleanup of expired and used codes
+            models.Index(fields=['created_at']),
+            models.Index(fields=['id'], condition=models.Q(is_used=True),
+                         name='accounts_otp_used_idx'),
+        ]
+        constraints = [
+            # At most one live code per user; issuing re-arms it (see otp_store).
+            # Also serves the live-code lookup.
+            models.UniqueConstraint(fields=['user'], condition=models.Q(is_used=False),
+                                    name='accounts_otp_one_active'),
+        ]
 
     def __str__(self):
         return f"OTP for {self.user.email}"
 
     @property
     def is_expired(self):
-        """Check if the OTP is expired (valid for 10 minutes)."""
-        expiry_time = self.created_at + timezone.timedelta(minutes=10)
+        """Check if the OTP is expired (valid for OTP_STORE['TTL'] seconds)."""
+        ttl = getattr(settings, 'OTP_STORE', {}).get('TTL', 600)
+        expiry_time = self.created_at + timezone.timedelta(seconds=ttl)
         return timezone.now() > expiry_time
+
+
+class EmailJob(models.Model):
+    """Transactional email waiting to be delivered by the background worker."""
+
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, _('Pending')),
+        (STATUS_SENDING, _('Sending')),
+        (STATUS_SENT, _('Sent')),
+        (STATUS_FAILED, _('Failed')),
+    )
+
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('email job')
+        verbose_name_plural = _('email jobs')
+        ordering = ['run_after']
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} email ({self.status})"
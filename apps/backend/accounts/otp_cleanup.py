@@ -0,0 +1,174 @@
+"""
+Incremental cleanup of expired and used OTP codes.
+
+Rows are deleted in primary-key order, ``BATCH_SIZE`` at a time, each batch
+in its own short transaction with a pause of ``SLEEP`` seconds between them,
+so the job never competes with password resets for long. The last deleted
+primary key is kept in the cache as a cursor: an interrupted or
+``max_batches``-bounded run resumes where it stopped, and the scan never
+revisits the dead rows a previous run left behind.
+
+On PostgreSQL each batch is a single ``DELETE ... WHERE pk IN (SELECT ...
+LIMIT n) RETURNING pk``, so ``LOCK_BUDGET`` caps how long the whole batch
+holds its locks, enforced with ``statement_timeout``/``lock_timeout``. Other
+databases select the batch's primary keys, then delete them. Everywhere the
+batch size shrinks when a batch runs over budget (or is cancelled) and grows
+back while batches stay well under it.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import OperationalError, connection, transaction
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .models import OTP
+
+DEFAULTS = {
+    'BATCH_SIZE': 1000,
+    'MIN_BATCH_SIZE': 10,
+    'SLEEP': 0.1,
+    'LOCK_BUDGET': 0.5,
+    'CACHE_ALIAS': 'default',
+}
+
+CURSOR_KEY = 'otp-cleanup:cursor'
+LOCK_KEY = 'otp-cleanup:lock'
+
+
+def get_cleanup_settings():
+    """Return the OTP_CLEANUP settings merged over the defaults."""
+    return {**DEFAULTS, **getattr(settings, 'OTP_CLEANUP', {})}
+
+
+def _set_lock_budget(budget):
+    if connection.vendor != 'postgresql':
+        return
+    timeout = f'{max(1, int(budget * 1000))}ms'
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT set_config('statement_timeout', %s, true), "
+                       "set_config('lock_timeout', %s, true)", [timeout, timeout])
+
+
+def retire_duplicate_otps():
+    """
+    Mark all but each user's newest unused OTP as used; return how many.
+
+    Databases created before ``accounts_otp_one_active`` (one live code per
+    user) can hold several; run this before migrating to the constraint.
+    """
+    newest = (OTP.objects.filter(user=OuterRef('user'), is_used=False)
+              .order_by('-created_at', '-pk').values('pk')[:1])
+    return (OTP.objects.filter(is_used=False)
+            .exclude(pk=Subquery(newest)).update(is_used=True))
+
+
+class OTPCleaner:
+    """Delete expired and used OTPs in bounded, resumable batches."""
+
+    def __init__(self, options=None):
+        self.options = options or get_cleanup_settings()
+        self.cache = caches[self.options['CACHE_ALIAS']]
+        self.batch_size = self.options['BATCH_SIZE']
+
+    @property
+    def cursor(self):
+        return self.cache.get(CURSOR_KEY, 0)
+
+    @cursor.setter
+    def cursor(self, pk):
+        self.cache.set(CURSOR_KEY, pk, timeout=None)
+
+    def deletable(self, cutoff):
+        # Served by the created_at index and the partial index on used rows
+        return OTP.objects.filter(Q(created_at__lt=cutoff) | Q(is_used=True))
+
+    def delete_batch(self, cutoff, after):
+        """Delete one batch past ``after``; return (deleted, last pk, seconds)."""
+        start = time.perf_counter()
+        with transaction.atomic():
+            _set_lock_budget(self.options['LOCK_BUDGET'])
+            if connection.vendor == 'postgresql':
+                ids = self._delete_returning(cutoff, after)
+            else:
+                ids = list(self.deletable(cutoff).filter(pk__gt=after).order_by('pk')
+                           .values_list('pk', flat=True)[:self.batch_size])
+                if ids:
+                    # Re-check the predicate so a row that changed since is kept
+                    self.deletable(cutoff).filter(pk__in=ids).delete()
+        if not ids:
+            return 0, None, time.perf_counter() - start
+        return len(ids), max(ids), time.perf_counter() - start
+
+    def _delete_returning(self, cutoff, after):
+        # OTP deletes cascade to nothing and send no signals, so this is what
+        # the ORM would run, plus RETURNING. The outer predicate is re-checked
+        # against rows a concurrent issue() re-armed
+        quote = connection.ops.quote_name
+        table = quote(OTP._meta.db_table)
+        pk = quote(OTP._meta.pk.column)
+        deletable = (f'({quote(OTP._meta.get_field("created_at").column)} < %s '
+                     f'OR {quote(OTP._meta.get_field("is_used").column)})')
+        cutoff = connection.ops.adapt_datetimefield_value(cutoff)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE {pk} IN ('
+                f'SELECT {pk} FROM {table} WHERE {pk} > %s AND {deletable} '
+                f'ORDER BY {pk} LIMIT %s) AND {deletable} RETURNING {pk}',
+                [after, cutoff, self.batch_size, cutoff])
+            return [row[0] for row in cursor.fetchall()]
+
+    def _adjust(self, seconds):
+        budget = self.options['LOCK_BUDGET']
+        if seconds > budget:
+            self.batch_size = max(self.options['MIN_BATCH_SIZE'], self.batch_size // 2)
+        elif seconds < budget / 4:
+            self.batch_size = min(self.options['BATCH_SIZE'], self.batch_size * 2)
+
+    def run(self, max_batches=None):
+        """
+        Delete batches until nothing is left (or ``max_batches`` ran).
+
+        Returns a dict with the rows deleted, batches run, elapsed seconds
+        and the slowest batch's duration.
+        """
+        ttl = getattr(settings, 'OTP_STORE', {}).get('TTL', 600)
+        cutoff = timezone.now() - timezone.timedelta(seconds=ttl)
+        stats = {'deleted': 0, 'batches': 0, 'elapsed': 0.0, 'slowest': 0.0}
+
+        start = time.perf_counter()
+        after = self.cursor
+        while max_batches is None or stats['batches'] < max_batches:
+            try:
+                deleted, last, seconds = self.delete_batch(cutoff, after)
+            except OperationalError:
+                # Cancelled by the lock budget; retry with a smaller batch
+                if self.batch_size <= self.options['MIN_BATCH_SIZE']:
+                    raise
+                self.batch_size = max(self.options['MIN_BATCH_SIZE'], self.batch_size // 2)
+                continue
+
+            stats['batches'] += 1
+            stats['slowest'] = max(stats['slowest'], seconds)
+            if last is None:
+                # Reached the end; the next run starts from the beginning
+                self.cursor = 0
+                break
+
+            stats['deleted'] += deleted
+            after = self.cursor = last
+            self._adjust(seconds)
+            time.sleep(self.options['SLEEP'])
+
+        stats['elapsed'] = time.perf_counter() - start
+        return stats
+
+    def run_exclusive(self, max_batches=None, lock_timeout=3600):
+        """Like ``run``, but return None if another process is already cleaning up."""
+        if not self.cache.add(LOCK_KEY, True, timeout=lock_timeout):
+            return None
+        try:
+            return self.run(max_batches=max_batches)
+        finally:
+            self.cache.delete(LOCK_KEY)
@@ -0,0 +1,77 @@
+"""
+Issuance policy for password reset OTPs.
+
+``issue_otp`` decides whether a reset request results in a new code and an
+email:
+
+- A request carrying an ``Idempotency-Key`` header that was already seen for
+  the same user (within ``OTP_STORE['IDEMPOTENCY_TTL']`` seconds) is a
+  duplicate submission: nothing is issued or sent.
+- Otherwise the OTP store issues a code, unless the user's live code is still
+  within ``RESEND_COOLDOWN`` (retries, double clicks), in which case the live
+  code stands and nothing is sent.
+
+Either way the caller answers the request the same, so duplicates are
+indistinguishable from the original to the client.
+"""
+import hashlib
+import random
+import string
+
+from django.core.cache import caches
+
+from .otp_store import get_otp_store, get_store_settings
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def generate_otp():
+    """Generate a 6-digit OTP code."""
+    return ''.join(random.choices(string.digits, k=6))
+
+
+def _idempotency_key(user, key):
+    # Hashed: client-chosen keys can be any length or character set
+    digest = hashlib.sha256(f'{user.pk}:{key}'.encode()).hexdigest()
+    return f'otp-idempotency:{digest}'
+
+
+def issue_otp(user, idempotency_key=None):
+    """Issue a code for ``user``; return it if it must be sent, else None."""
+    options = get_store_settings()
+    cache = caches[options['CACHE_ALIAS']]
+    cache_key = None
+    if idempotency_key:
+        cache_key = _idempotency_key(user, idempotency_key)
+        if not cache.add(cache_key, True, timeout=options['IDEMPOTENCY_TTL']):
+            return None
+
+    code = generate_otp()
+    try:
+        issued = get_otp_store().issue(user, code)
+    except Exception:
+        if cache_key is not None:
+            # Let the client retry with the same key
+            cache.delete(cache_key)
+        raise
+    return code if issued else None
+
+
+async def aissue_otp(user, idempotency_key=None):
+    """Async version of ``issue_otp``."""
+    options = get_store_settings()
+    cache = caches[options['CACHE_ALIAS']]
+    cache_key = None
+    if idempotency_key:
+        cache_key = _idempotency_key(user, idempotency_key)
+        if not await cache.aadd(cache_key, True, timeout=options['IDEMPOTENCY_TTL']):
+            return None
+
+    code = generate_otp()
+    try:
+        issued = await get_otp_store().aissue(user, code)
+    except Exception:
+        if cache_key is not None:
+            await cache.adelete(cache_key)
+        raise
+    return code if issued else None
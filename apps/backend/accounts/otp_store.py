@@ -0,0 +1,260 @@
+"""
+Storage for password reset OTP codes.
+
+``settings.OTP_STORE['BACKEND']`` selects the implementation:
+
+- ``model``: ``OTP`` rows in the database (the default).
+- ``cache``: one entry per email in Django's cache, expired by its TTL. Verify
+  and consume need no database queries at all.
+
+Both keep at most one live code per user. ``issue`` replaces it with a new
+code, except within ``RESEND_COOLDOWN`` seconds of the last one, when the live
+code is kept and ``issue`` returns False (nothing new to send). Both stores
+raise ``OTPError`` when a code cannot be verified, and its subclass
+``OTPConflict`` when a concurrent request consumed it first.
+"""
+import hmac
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import IntegrityError, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import OTP, User
+
+DEFAULTS = {
+    'BACKEND': 'model',
+    'TTL': 600,
+    'RESEND_COOLDOWN': 60,
+    # How long an Idempotency-Key is remembered (see accounts.otp_issuance)
+    'IDEMPOTENCY_TTL': 3600,
+    # Lifetime of the token a verified OTP is exchanged for (see accounts.reset_tokens)
+    'RESET_TOKEN_TTL': 600,
+    'CACHE_ALIAS': 'default',
+}
+
+NO_USER = "No user with this email address exists."
+NO_ACTIVE_OTP = "No active OTP found. Please request a new one."
+EXPIRED_OTP = "OTP has expired. Please request a new one."
+INVALID_OTP = "Invalid OTP code."
+OTP_TAKEN = "This OTP has just been used. Please request a new one."
+
+
+def get_store_settings():
+    """Return the OTP_STORE settings merged over the defaults."""
+    return {**DEFAULTS, **getattr(settings, 'OTP_STORE', {})}
+
+
+def _codes_match(expected, given):
+    # Constant time, so response timing doesn't reveal matching digits
+    return hmac.compare_digest(expected.encode(), given.encode())
+
+
+class OTPError(Exception):
+    """An OTP could not be verified; ``field`` names the offending input."""
+
+    def __init__(self, field, message):
+        super().__init__(message)
+        self.field = field
+        self.message = message
+
+
+class OTPConflict(OTPError):
+    """The code checked out, but another request consumed it first."""
+
+
+class ModelOTPStore:
+    """Keep codes as ``OTP`` rows; the user's one unused row is live."""
+
+    def __init__(self, options):
+        self.ttl = options['TTL']
+        self.cooldown = options['RESEND_COOLDOWN']
+
+    def issue(self, user, code):
+        """Make ``code`` the user's live code unless one was issued within the cooldown."""
+        now = timezone.now()
+        # Re-arm the live row past its cooldown; the old code dies in the same UPDATE
+        rearmed = OTP.objects.filter(
+            user=user, is_used=False,
+            created_at__lte=now - timezone.timedelta(seconds=self.cooldown),
+        ).update(code=code, created_at=now)
+        if rearmed:
+            return True
+        try:
+            with transaction.atomic():
+                OTP.objects.create(user=user, code=code)
+        except IntegrityError:
+            # accounts_otp_one_active: a live code is still within its cooldown
+            # (possibly issued by a concurrent request just now)
+            return False
+        return True
+
+    def _live(self, email):
+        # One query joined on the user's email, served by the email index and
+        # the accounts_otp_one_active partial index
+        return OTP.objects.select_related('user').filter(user__email=email, is_used=False)
+
+    def _match(self, email, code):
+        otp = self._live(email).first()
+        if otp is None:
+            if not User.objects.filter(email=email).exists():
+                raise OTPError('email', NO_USER)
+            raise OTPError('otp_code', NO_ACTIVE_OTP)
+
+        self._check(otp, code)
+        return otp
+
+    def _check(self, otp, code):
+        if timezone.now() > otp.created_at + timezone.timedelta(seconds=self.ttl):
+            raise OTPError('otp_code', EXPIRED_OTP)
+
+        if not _codes_match(otp.code, code):
+            raise OTPError('otp_code', INVALID_OTP)
+
+    def verify(self, email, code, with_user=False):
+        """Check a code without using it up."""
+        otp = self._match(email, code)
+        return otp.user if with_user else otp.user_id
+
+    def _consumable(self, otp):
+        # What the read checked, re-checked by the UPDATE itself
+        cutoff = timezone.now() - timezone.timedelta(seconds=self.ttl)
+        return OTP.objects.filter(pk=otp.pk, is_used=False, created_at__gt=cutoff)
+
+    def consume(self, email, code, with_user=False):
+        """Check a code and mark it used in one conditional UPDATE; only one caller can win."""
+        otp = self._match(email, code)
+        if not self._consumable(otp).update(is_used=True):
+            raise OTPConflict('otp_code', OTP_TAKEN)
+        return otp.user if with_user else otp.user_id
+
+    async def aissue(self, user, code):
+        # The savepoint around the insert needs the sync API
+        return await sync_to_async(self.issue)(user, code)
+
+    async def aconsume(self, email, code, with_user=False):
+        """Async version of ``consume`` using the async ORM."""
+        otp = await self._live(email).afirst()
+        if otp is None:
+            if not await User.objects.filter(email=email).aexists():
+                raise OTPError('email', NO_USER)
+            raise OTPError('otp_code', NO_ACTIVE_OTP)
+
+        self._check(otp, code)
+
+        if not await self._consumable(otp).aupdate(is_used=True):
+            raise OTPConflict('otp_code', OTP_TAKEN)
+        return otp.user if with_user else otp.user_id
+
+
+class CacheOTPStore:
+    """Keep one live code per email in the cache; expiry is the entry's TTL."""
+
+    key_prefix = 'otp:'
+    cooldown_prefix = 'otp-cooldown:'
+
+    def __init__(self, options):
+        self.ttl = options['TTL']
+        self.cooldown = options['RESEND_COOLDOWN']
+        self.cache = caches[options['CACHE_ALIAS']]
+
+    def _key(self, email):
+        return f'{self.key_prefix}{email}'
+
+    def _cooldown_key(self, email):
+        return f'{self.cooldown_prefix}{email}'
+
+    def issue(self, user, code):
+        """Make ``code`` the user's live code unless one was issued within the cooldown."""
+        # Only the caller that claims the cooldown window issues a code
+        if self.cooldown and not self.cache.add(
+                self._cooldown_key(user.email), True, timeout=self.cooldown):
+            return False
+        self.cache.set(
+            self._key(user.email),
+            {'user_id': str(user.pk), 'code': code},
+            timeout=self.ttl,
+        )
+        return True
+
+    def _match(self, email, code):
+        return self._check(self.cache.get(self._key(email)), code)
+
+    def _check(self, entry, code):
+        if entry is None:
+            raise OTPError('otp_code', NO_ACTIVE_OTP)
+        if not _codes_match(entry['code'], code):
+            raise OTPError('otp_code', INVALID_OTP)
+        return entry['user_id']
+
+    def _result(self, user_id, with_user):
+        if not with_user:
+            return user_id
+        try:
+            return User.objects.get(pk=user_id)
+        except User.DoesNotExist:
+            raise OTPError('email', NO_USER)
+
+    def verify(self, email, code, with_user=False):
+        """Check a code without using it up."""
+        return self._result(self._match(email, code), with_user)
+
+    def consume(self, email, code, with_user=False):
+        """Check a code and delete it; only one caller can win the delete."""
+        user_id = self._match(email, code)
+        if not self.cache.delete(self._key(email)):
+            raise OTPConflict('otp_code', OTP_TAKEN)
+        # A used code doesn't hold back the next one
+        self.cache.delete(self._cooldown_key(email))
+        return self._result(user_id, with_user)
+
+    async def aissue(self, user, code):
+        if self.cooldown and not await self.cache.aadd(
+                self._cooldown_key(user.email), True, timeout=self.cooldown):
+            return False
+        await self.cache.aset(
+            self._key(user.email),
+            {'user_id': str(user.pk), 'code': code},
+            timeout=self.ttl,
+        )
+        return True
+
+    async def aconsume(self, email, code, with_user=False):
+        """Async version of ``consume`` using the async cache API."""
+        user_id = self._check(await self.cache.aget(self._key(email)), code)
+        if not await self.cache.adelete(self._key(email)):
+            raise OTPConflict('otp_code', OTP_TAKEN)
+        await self.cache.adelete(self._cooldown_key(email))
+        if not with_user:
+            return user_id
+        try:
+            return await User.objects.aget(pk=user_id)
+        except User.DoesNotExist:
+            raise OTPError('email', NO_USER)
+
+
+BACKENDS = {
+    'model': ModelOTPStore,
+    'cache': CacheOTPStore,
+}
+
+_store = None
+
+
+def get_otp_store():
+    """Return the process-wide OTP store for the configured backend."""
+    global _store
+    if _store is None:
+        options = get_store_settings()
+        _store = BACKENDS[options['BACKEND']](options)
+    return _store
+
+
+@receiver(setting_changed)
+def _reset_store(setting, **kwargs):
+    global _store
+    if setting == 'OTP_STORE':
+        _store = None
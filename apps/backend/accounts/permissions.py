@@ -11,8 +11,9 @@ class IsOwnerOrAdmin(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return True
 
-        # Write permissions only for the owner or admin
-        return obj == request.user or request.user.is_staff
+        # Write permissions only for the owner or admin. Compare primary keys
+        # so token-backed users (see accounts.tokens) match their User row.
+        return str(obj.pk) == str(request.user.pk) or request.user.is_staff
 
 
 class IsAdminUser(permissions.BasePermission):
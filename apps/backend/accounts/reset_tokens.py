@@ -0,0 +1,99 @@
+"""
+Short-lived signed tokens for the last step of a password reset.
+
+``VerifyOTPView`` consumes the OTP and answers with a reset token;
+``ResetPasswordView`` takes the token instead of the code, so setting the new
+password needs no OTP lookup: one query loads the user by primary key.
+
+A token carries the user's id and a fingerprint of their current password
+hash. It stops working after ``OTP_STORE['RESET_TOKEN_TTL']`` seconds, and once
+the password changes, so it can be used once: ``reset_password`` writes the
+new password only if the hash is still the one the token was checked against,
+in a single UPDATE, so of concurrent requests with one token exactly one wins.
+"""
+from asgiref.sync import sync_to_async
+from django.core import signing
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from .models import User
+from .otp_store import get_store_settings
+from .user_cache import get_user_cache
+
+SALT = 'accounts.reset_tokens'
+
+INVALID_RESET_TOKEN = "Invalid or expired reset token. Please request a new OTP."
+RESET_TOKEN_USED = "This reset token has just been used. Please request a new OTP."
+
+
+def _fingerprint(user):
+    return salted_hmac(SALT, user.password, algorithm='sha256').hexdigest()[:32]
+
+
+def make_reset_token(user):
+    """Return a reset token for ``user``."""
+    return signing.dumps({'uid': str(user.pk), 'pw': _fingerprint(user)}, salt=SALT)
+
+
+def _load(token):
+    try:
+        return signing.loads(token, salt=SALT,
+                             max_age=get_store_settings()['RESET_TOKEN_TTL'])
+    except signing.BadSignature:
+        # Also raised for expired tokens (SignatureExpired)
+        return None
+
+
+def _check(user, data):
+    if user is None or not constant_time_compare(data['pw'], _fingerprint(user)):
+        return None
+    return user
+
+
+def check_reset_token(token):
+    """Return the user a token was issued to, or None if it is invalid, expired or used."""
+    data = _load(token)
+    if data is None:
+        return None
+    return _check(User.objects.filter(pk=data['uid']).first(), data)
+
+
+async def acheck_reset_token(token):
+    """Async version of ``check_reset_token``."""
+    data = _load(token)
+    if data is None:
+        return None
+    return _check(await User.objects.filter(pk=data['uid']).afirst(), data)
+
+
+def _redeem(user, old_password):
+    # Only password and updated_at are written, and only if the password is
+    # still the one the token was checked against
+    return User.objects.filter(pk=user.pk, password=old_password), {
+        'password': user.password, 'updated_at': timezone.now()}
+
+
+def reset_password(user, raw_password):
+    """
+    Set the password of a user from ``check_reset_token``, unless a concurrent
+    reset changed it first; return whether it was set.
+    """
+    old_password = user.password
+    user.set_password(raw_password)
+    queryset, values = _redeem(user, old_password)
+    if not queryset.update(**values):
+        return False
+    # A queryset update sends no post_save
+    get_user_cache().invalidate(user.pk)
+    return True
+
+
+async def areset_password(user, raw_password):
+    """Async version of ``reset_password``."""
+    old_password = user.password
+    await user.aset_password(raw_password)
+    queryset, values = _redeem(user, old_password)
+    if not await queryset.aupdate(**values):
+        return False
+    await sync_to_async(get_user_cache().invalidate)(user.pk)
+    return True
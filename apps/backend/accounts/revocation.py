@@ -0,0 +1,130 @@
+"""
+Revocation of refresh tokens.
+
+Revoked JTIs are kept in the cache, each entry expiring together with the
+token it revokes, so the set never holds more than the tokens still alive and
+a refresh only pays for one cache lookup. simplejwt's blacklist tables stay
+the durable record: until ``purge_revoked_tokens --warm`` has loaded them into
+a shared cache, a cache miss falls back to the database.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken,
+    OutstandingToken,
+)
+
+from common.instrumentation import record_cache
+
+DEFAULTS = {
+    'CACHE_ALIAS': 'default',
+    # Only trust cache misses when every process shares the cache
+    'TRUST_CACHE': False,
+}
+
+KEY_PREFIX = 'revoked-jti:'
+WARM_KEY = 'revoked-jti:warm'
+
+
+def get_revocation_settings():
+    """Return the TOKEN_REVOCATION settings merged over the defaults."""
+    return {**DEFAULTS, **getattr(settings, 'TOKEN_REVOCATION', {})}
+
+
+def _cache():
+    return caches[get_revocation_settings()['CACHE_ALIAS']]
+
+
+def _seconds_left(expires_at):
+    return int((expires_at - timezone.now()).total_seconds()) + 1
+
+
+def _outstanding_fields(token):
+    return {
+        'user_id': token.get(api_settings.USER_ID_CLAIM),
+        'created_at': token.current_time,
+        'token': str(token),
+        'expires_at': datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc),
+    }
+
+
+def outstand(token):
+    """Record a freshly minted refresh token in the durable outstanding list."""
+    # Its JTI is new, so there is no row to look up first
+    return OutstandingToken.objects.create(
+        jti=token[api_settings.JTI_CLAIM], **_outstanding_fields(token))
+
+
+def revoke(token):
+    """Revoke a refresh token in the cache and in the blacklist tables."""
+    # Usually outstanding already (issued by login or a rotation), but tokens
+    # minted before the blacklist app was enabled are not
+    outstanding, _ = OutstandingToken.objects.get_or_create(
+        jti=token[api_settings.JTI_CLAIM], defaults=_outstanding_fields(token))
+    blacklisted, _ = BlacklistedToken.objects.get_or_create(token=outstanding)
+
+    seconds_left = _seconds_left(outstanding.expires_at)
+    if seconds_left > 0:
+        _cache().set(KEY_PREFIX + outstanding.jti, True, timeout=seconds_left)
+    return blacklisted
+
+
+def is_revoked(jti):
+    """Whether the refresh token with this JTI has been revoked."""
+    cache = _cache()
+    if cache.get(KEY_PREFIX + jti):
+        record_cache(hit=True)
+        return True
+    record_cache(hit=False)
+    if get_revocation_settings()['TRUST_CACHE'] and cache.get(WARM_KEY):
+        return False
+    return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+
+def warm(batch_size=1000):
+    """Load every unexpired revoked JTI into the cache. Returns the count."""
+    cache = _cache()
+    loaded = 0
+    batch = {}
+    batch_expiry = None
+
+    revoked = (
+        BlacklistedToken.objects
+        .filter(token__expires_at__gt=timezone.now())
+        .order_by('token__expires_at')
+        .values_list('token__jti', 'token__expires_at')
+    )
+    for jti, expires_at in revoked.iterator(chunk_size=batch_size):
+        batch[KEY_PREFIX + jti] = True
+        # Ordered by expiry, so the last token sets the batch timeout
+        batch_expiry = expires_at
+        if len(batch) >= batch_size:
+            cache.set_many(batch, timeout=_seconds_left(batch_expiry))
+            loaded += len(batch)
+            batch = {}
+
+    if batch:
+        cache.set_many(batch, timeout=_seconds_left(batch_expiry))
+        loaded += len(batch)
+
+    cache.set(WARM_KEY, True, timeout=None)
+    return loaded
+
+
+def purge_expired(batch_size=1000):
+    """Delete expired outstanding tokens (and their blacklist rows) in batches."""
+    deleted = 0
+    while True:
+        ids = list(
+            OutstandingToken.objects
+            .filter(expires_at__lte=timezone.now())
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        BlacklistedToken.objects.filter(token_id__in=ids).delete()
+        deleted += OutstandingToken.objects.filter(pk__in=ids).delete()[0]
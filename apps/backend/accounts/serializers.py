@@ -1,14 +1,29 @@
-import re
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError
 from rest_framework import serializers
 from djoser.serializers import UserCreateSerializer as BaseUserCreateSerializer
 from djoser.serializers import UserSerializer as BaseUserSerializer
-from .models import OTP
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer as BaseTokenObtainPairSerializer,
+    TokenRefreshSerializer as BaseTokenRefreshSerializer,
+)
+from rest_framework_simplejwt.settings import api_settings
+from common.routers import read_from_replica
+from common.utils import allocate_usernames
+from common.exceptions import Conflict
+from .otp_store import OTPConflict, OTPError, get_otp_store
+from .reset_tokens import INVALID_RESET_TOKEN, check_reset_token
+from .tokens import RefreshToken, snapshot_claims, snapshot_enabled
+from .user_cache import get_user_cache
 
 User = get_user_model()
 
+# Times to re-allocate a generated username that lost a race to another signup
+USERNAME_ATTEMPTS = 3
+
 
 class UserCreateSerializer(BaseUserCreateSerializer):
     """Serializer for creating user instances."""
@@ -25,7 +40,8 @@ class UserCreateSerializer(BaseUserCreateSerializer):
                   'confirm_password', ]
         extra_kwargs = {
             'password': {'write_only': True},
-
+            # Generated from the email when omitted
+            'username': {'required': False},
         }
 
     def validate_password(self, value):
@@ -44,6 +60,20 @@ class UserCreateSerializer(BaseUserCreateSerializer):
             })
         return attrs
 
+    def perform_create(self, validated_data):
+        if validated_data.get('username'):
+            return super().perform_create(validated_data)
+
+        for attempt in range(USERNAME_ATTEMPTS):
+            username = allocate_usernames([validated_data['email']], User)[0]
+            try:
+                return super().perform_create({**validated_data, 'username': username})
+            except IntegrityError:
+                # Retry only if it was the username that was taken meanwhile
+                if (attempt == USERNAME_ATTEMPTS - 1
+                        or User.objects.filter(email=validated_data['email']).exists()):
+                    raise
+
 
 class UserSerializer(BaseUserSerializer):
     """Serializer for user instances."""
@@ -55,6 +85,55 @@ class UserSerializer(BaseUserSerializer):
         read_only_fields = ['id', 'email', 'date_joined']
 
 
+class TokenObtainPairSerializer(BaseTokenObtainPairSerializer):
+    """Issue token pairs that carry the user snapshot when it is enabled."""
+
+    token_class = RefreshToken
+
+
+class TokenRefreshSerializer(BaseTokenRefreshSerializer):
+    """
+    Refresh tokens with the user loaded through the cache, re-embedding a
+    current user snapshot when it is enabled.
+    """
+
+    token_class = RefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+
+        user = get_user_cache().get(refresh.payload.get(api_settings.USER_ID_CLAIM))
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(
+                self.error_messages['no_active_account'],
+                'no_active_account',
+            )
+
+        if snapshot_enabled():
+            refresh.payload.update(snapshot_claims(user))
+
+        data = {'access': str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                try:
+                    # Attempt to blacklist the given refresh token
+                    refresh.blacklist()
+                except AttributeError:
+                    # If blacklist app not installed, `blacklist` method will
+                    # not be present
+                    pass
+
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            refresh.outstand()
+
+            data['refresh'] = str(refresh)
+
+        return data
+
+
 class RequestPasswordResetSerializer(serializers.Serializer):
     """Serializer for requesting a password reset."""
 
@@ -62,7 +141,10 @@ class RequestPasswordResetSerializer(serializers.Serializer):
 
     def validate_email(self, value):
         """Validate the email exists."""
-        if not User.objects.filter(email=value).exists():
+        # A read-only check; fine on a replica unless this client just wrote
+        with read_from_replica():
+            exists = User.objects.filter(email=value).exists()
+        if not exists:
             raise serializers.ValidationError(
                 "No user with this email address exists.")
         return value
@@ -75,43 +157,22 @@ class VerifyOTPSerializer(serializers.Serializer):
     otp_code = serializers.CharField(required=True, max_length=6, min_length=6)
 
     def validate(self, attrs):
-        """Validate the OTP code."""
-        email = attrs.get('email')
-        otp_code = attrs.get('otp_code')
-
+        """Validate the OTP code and mark it as used."""
         try:
-            user = User.objects.get(email=email)
-        except User.DoesNotExist:
-            raise serializers.ValidationError(
-                {"email": "No user with this email address exists."})
-
-        # Get the latest non-used OTP for the user
-        latest_otp = OTP.objects.filter(
-            user=user, is_used=False).order_by('-created_at').first()
-
-        if not latest_otp:
-            raise serializers.ValidationError(
-                {"otp_code": "No active OTP found. Please request a new one."})
-
-        if latest_otp.is_expired:
-            raise serializers.ValidationError(
-                {"otp_code": "OTP has expired. Please request a new one."})
-
-        if latest_otp.code != otp_code:
-            raise serializers.ValidationError(
-                {"otp_code": "Invalid OTP code."})
-
-        attrs['user'] = user
-        attrs['otp'] = latest_otp
+            attrs['user'] = get_otp_store().consume(
+                attrs.get('email'), attrs.get('otp_code'), with_user=True)
+        except OTPConflict as exc:
+            raise Conflict(exc.message)
+        except OTPError as exc:
+            raise serializers.ValidationError({exc.field: exc.message})
 
         return attrs
 
 
 class ResetPasswordSerializer(serializers.Serializer):
-    """Serializer for resetting the password."""
+    """Serializer for resetting the password with the token from OTP verification."""
 
-    email = serializers.EmailField(required=True)
-    otp_code = serializers.CharField(required=True, max_length=6, min_length=6)
+    reset_token = serializers.CharField(required=True)
     new_password = serializers.CharField(required=True, write_only=True)
     confirm_password = serializers.CharField(required=True, write_only=True)
 
@@ -121,18 +182,10 @@ class ResetPasswordSerializer(serializers.Serializer):
             validate_password(value)
         except ValidationError as exc:
             raise serializers.ValidationError(str(exc))
-
-        # Check if password is exactly 8 digits
-        if not re.match(r'^\d{8}$', value):
-            raise serializers.ValidationError(
-                "Password must be exactly 8 digits.")
-
         return value
 
     def validate(self, attrs):
-        """Validate OTP and that passwords match."""
-        email = attrs.get('email')
-        otp_code = attrs.get('otp_code')
+        """Validate the reset token and that passwords match."""
         new_password = attrs.get('new_password')
         confirm_password = attrs.get('confirm_password')
 
@@ -141,29 +194,11 @@ class ResetPasswordSerializer(serializers.Serializer):
             raise serializers.ValidationError(
                 {"confirm_password": "Passwords do not match."})
 
-        try:
-            user = User.objects.get(email=email)
-        except User.DoesNotExist:
-            raise serializers.ValidationError(
-                {"email": "No user with this email address exists."})
-
-        # Get the latest non-used OTP for the user
-        latest_otp = OTP.objects.filter(
-            user=user, is_used=False).order_by('-created_at').first()
-
-        if not latest_otp:
-            raise serializers.ValidationError(
-                {"otp_code": "No active OTP found. Please request a new one."})
-
-        if latest_otp.is_expired:
-            raise serializers.ValidationError(
-                {"otp_code": "OTP has expired. Please request a new one."})
-
-        if latest_otp.code != otp_code:
-            raise serializers.ValidationError(
-                {"otp_code": "Invalid OTP code."})
+        # No OTP lookup: the token was issued when the OTP was consumed
+        user = check_reset_token(attrs.get('reset_token'))
+        if user is None:
+            raise serializers.ValidationError({"reset_token": INVALID_RESET_TOKEN})
 
         attrs['user'] = user
-        attrs['otp'] = latest_otp
 
         return attrs
@@ -1,56 +1,117 @@
-from django.conf import settings
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
-from django.utils import timezone
-from .models import OTP, User
+import logging
 
+from django.db import transaction
+from common.instrumentation import timed
+from .emails import build_message
+from .models import User
+from .otp_store import get_store_settings
 
-def send_otp_email(user_id, otp_code):
-    """
-    Send OTP code to user's email for password reset.
+logger = logging.getLogger(__name__)
 
-    Note: In a production environment, this would be an async task using Celery.
-    For this implementation, we'll use it as a regular function.
-    """
+
+def build_otp_email(user_id, otp_code):
+    """Build the password reset OTP message, or None if the user is gone."""
     try:
         user = User.objects.get(id=user_id)
+    except User.DoesNotExist:
+        return None
 
-        # Send the OTP to the user's email
-        subject = 'Password Reset OTP'
-        html_message = render_to_string('password_reset.html', {
-            'user': user,
-            'otp_code': otp_code,
-        })
-        plain_message = strip_tags(html_message)
-
-        send_mail(
-            subject,
-            plain_message,
-            settings.DEFAULT_FROM_EMAIL,
-            [user.email],
-            html_message=html_message,
-            fail_silently=False,
-        )
-
-        return True
+    return build_message('password_reset', [user.email], {
+        'user': user,
+        'otp_code': otp_code,
+        # Rounded down, so the email never promises more time than the code has
+        'expiry_minutes': max(1, get_store_settings()['TTL'] // 60),
+    })
+
+
+def build_welcome_email(user_id):
+    """Build the welcome message for a new user, or None if the user is gone."""
+    try:
+        user = User.objects.get(id=user_id)
     except User.DoesNotExist:
+        return None
+
+    return build_message('welcome', [user.email], {'user': user})
+
+
+# Message builders the background queue can run, keyed by job kind.
+EMAIL_BUILDERS = {
+    'otp': build_otp_email,
+    'welcome': build_welcome_email,
+}
+
+
+def build_email(kind, payload):
+    """Build the message for a queued job of the given kind."""
+    return EMAIL_BUILDERS[kind](**payload)
+
+
+def deliver_email(kind, payload, connection=None):
+    """
+    Build and send a single queued message.
+
+    Returns False when there is nothing to send (e.g. the user was deleted).
+    Delivery errors are raised so the queue can retry them.
+    """
+    message = build_email(kind, payload)
+    if message is None:
         return False
+
+    message.connection = connection
+    with timed('email'):
+        message.send(fail_silently=False)
+    return True
+
+
+def send_otp_email(user_id, otp_code):
+    """
+    Send OTP code to user's email for password reset.
+
+    This sends synchronously; request handlers should use ``queue_otp_email``.
+    """
+    try:
+        return deliver_email('otp', {'user_id': str(user_id), 'otp_code': otp_code})
     except Exception as e:
-        print(f"Error sending OTP email: {str(e)}")
+        logger.exception("Error sending OTP email: %s", e)
         return False
 
 
-def cleanup_expired_otps():
-    """
-    Clean up expired OTP codes.
-    In a production environment, this would be a scheduled task using Celery beat.
+def queue_otp_email(user_id, otp_code):
+    """Hand the OTP email to the background queue once the transaction commits."""
+    from .mail_queue import enqueue_on_commit
+
+    enqueue_on_commit('otp', user_id=str(user_id), otp_code=otp_code)
+
+
+async def aqueue_otp_email(user_id, otp_code):
+    """Async version of ``queue_otp_email`` for async views."""
+    from .mail_queue import aenqueue
+
+    await aenqueue('otp', user_id=str(user_id), otp_code=otp_code)
+
+
+def queue_welcome_email(user_id):
+    """Hand the welcome email to the background queue once the transaction commits."""
+    from .mail_queue import enqueue_on_commit
+
+    enqueue_on_commit('welcome', user_id=str(user_id))
+
+
+def queue_welcome_emails(user_ids):
+    """Queue welcome emails for many users at once, after the transaction commits."""
+    from .mail_queue import enqueue_many
+
+    payloads = [{'user_id': str(user_id)} for user_id in user_ids]
+    transaction.on_commit(lambda: enqueue_many('welcome', payloads))
+
+
+def cleanup_expired_otps(max_batches=None):
     """
-    # OTPs that are older than 10 minutes or have been used
-    expiry_time = timezone.now() - timezone.timedelta(minutes=10)
+    Delete expired and used OTP codes in small batches.
 
-    # Delete all expired OTPs
-    OTP.objects.filter(created_at__lt=expiry_time).delete()
+    Run it on a schedule with ``manage.py cleanup_otps --interval``; see
+    ``accounts.otp_cleanup`` for the batching and lock budget.
+    """
+    from .otp_cleanup import OTPCleaner
 
-    # Delete all used OTPs
-    OTP.objects.filter(is_used=True).delete()
+    return OTPCleaner().run_exclusive(max_batches=max_batches)
@@ -1,3 +1,1535 @@
-from django.test import TestCase
+import json
+import os
+import smtplib
+import uuid
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth.hashers import make_password
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied, ValidationError as DjangoValidationError
+from django.core.mail import send_mail
+from django.core.management import call_command
+from django.db import connection, connections, router
+from django.db.models import QuerySet
+from django.http import Http404, HttpResponse
+from django.template.loader import get_template
+from django.test import (
+    AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework import exceptions, serializers
+from rest_framework.permissions import AllowAny
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework.views import APIView
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken
+
+from common.email_backends import pool
+from common.fastjson import FastJSONParser, FastJSONRenderer
+from common.hashers import get_hashing_service
+from common.ratelimit import (
+    SlidingWindowLimiter, _key_value, client_ip, get_limiter_settings, split_rate,
+)
+from common.routers import ReplicaRoutingMiddleware, read_from_replica
+from common.serializers import compile_serializer
+from common.utils import allocate_usernames
+from .async_views import (
+    AsyncRequestPasswordResetView,
+    AsyncResetPasswordView,
+    AsyncUserDetailsView,
+    AsyncVerifyOTPView,
+)
+from .emails import build_message, get_templates, render_email
+from .models import EmailJob, OTP, User
+from .otp_cleanup import OTPCleaner, get_cleanup_settings
+from .otp_store import ModelOTPStore, OTPError, get_otp_store
+from .reset_tokens import check_reset_token, make_reset_token
+from .revocation import is_revoked, warm
+from .serializers import UserSerializer
+from .tasks import build_otp_email
+from .tokens import RefreshToken
+from .user_cache import get_user_cache
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    EMAIL_HOST_USER='mailer@example.com',
+    RATELIMIT_ENABLE=False,
+)
+class EmailQueueTests(TestCase):
+    """Password reset and welcome emails go through the background queue."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='jane@example.com', username='jane', password='12345678')
+        mail.outbox = []
+
+    @override_settings(EMAIL_QUEUE={'BACKEND': 'database'})
+    def test_password_reset_returns_before_delivery(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('password-reset'), {'email': self.user.email})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+        job = EmailJob.objects.get()
+        self.assertEqual(job.kind, 'otp')
+
+        call_command('run_email_worker', once=True, concurrency=1,
+                     stdout=StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, EmailJob.STATUS_SENT)
+        # The code is not kept once it has been sent
+        self.assertEqual(job.payload, {'user_id': str(self.user.id)})
+        self.assertEqual(len(mail.outbox), 1)
+        otp = OTP.objects.get(user=self.user)
+        self.assertIn(otp.code, mail.outbox[0].body)
+        self.assertEqual(mail.outbox[0].to, [self.user.email])
+
+    @override_settings(EMAIL_QUEUE={'BACKEND': 'database', 'RETENTION_DAYS': 7})
+    def test_old_sent_jobs_are_purged(self):
+        now = timezone.now()
+        old, recent, failed = [
+            EmailJob.objects.create(kind='welcome', status=status, run_after=run_after)
+            for status, run_after in [(EmailJob.STATUS_SENT, now - timedelta(days=8)),
+                                      (EmailJob.STATUS_SENT, now - timedelta(days=6)),
+                                      (EmailJob.STATUS_FAILED, now - timedelta(days=8))]]
+
+        out = StringIO()
+        call_command('run_email_worker', once=True, concurrency=1, stdout=out)
+
+        self.assertIn('Deleted 1 sent emails', out.getvalue())
+        self.assertCountEqual(EmailJob.objects.values_list('pk', flat=True),
+                              [recent.pk, failed.pk])
+
+    @override_settings(EMAIL_QUEUE={'BACKEND': 'database', 'MAX_RETRIES': 1})
+    def test_failed_delivery_is_retried_with_backoff(self):
+        job = EmailJob.objects.create(
+            kind='welcome', payload={'user_id': str(self.user.id)})
+
+        with mock.patch('django.core.mail.EmailMessage.send',
+                        side_effect=OSError('connection refused')):
+            call_command('run_email_worker', once=True, concurrency=1,
+                         stdout=StringIO())
+            job.refresh_from_db()
+            self.assertEqual(job.status, EmailJob.STATUS_PENDING)
+            self.assertEqual(job.attempts, 1)
+            self.assertGreater(job.run_after, timezone.now())
+
+            EmailJob.objects.filter(pk=job.pk).update(
+                run_after=timezone.now() - timedelta(seconds=1))
+            call_command('run_email_worker', once=True, concurrency=1,
+                         stdout=StringIO())
+            job.refresh_from_db()
+            self.assertEqual(job.status, EmailJob.STATUS_FAILED)
+            self.assertIn('connection refused', job.last_error)
+
+    @override_settings(
+        EMAIL_BACKEND='common.email_backends.PooledSMTPEmailBackend',
+        EMAIL_QUEUE={'BACKEND': 'database'},
+    )
+    def test_broken_connection_is_replaced_mid_batch(self):
+        pool.clear()
+        self.addCleanup(pool.clear)
+        jobs = [EmailJob.objects.create(kind='welcome', payload={'user_id': str(self.user.id)})
+                for _ in range(3)]
+        dead, fresh = mock.MagicMock(), mock.MagicMock()
+        dead.sendmail.side_effect = smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+
+        with mock.patch('smtplib.SMTP', side_effect=[dead, fresh]):
+            call_command('run_email_worker', once=True, concurrency=1, stdout=StringIO())
+
+        statuses = [EmailJob.objects.get(pk=job.pk).status for job in jobs]
+        self.assertEqual(sorted(statuses), [EmailJob.STATUS_PENDING] + [EmailJob.STATUS_SENT] * 2)
+        self.assertEqual(dead.sendmail.call_count, 1)
+        self.assertEqual(fresh.sendmail.call_count, 2)
+
+    @override_settings(EMAIL_QUEUE={'BACKEND': 'sync'}, OTP_STORE={'TTL': 300})
+    def test_otp_email_states_the_store_ttl(self):
+        build_otp_email(self.user.id, '123456').send()
+
+        self.assertIn('expire in 5 minutes', mail.outbox[0].body)
+        self.assertIn('expire in 5 minutes', mail.outbox[0].alternatives[0][0])
+
+    @override_settings(EMAIL_QUEUE={'BACKEND': 'sync'})
+    def test_welcome_email_sent_after_registration(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create_user(
+                email='john@example.com', username='john', password='12345678')
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['john@example.com'])
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+
+
+class EmailRenderingTests(SimpleTestCase):
+    """Emails are rendered from compiled templates with an authored text part."""
+
+    def setUp(self):
+        self.user = User(email='jane@example.com', username='jane')
+
+    def test_otp_email_has_text_and_html_parts(self):
+        message = build_message('password_reset', [self.user.email],
+                                {'user': self.user, 'otp_code': '123456', 'expiry_minutes': 10})
+
+        self.assertEqual(message.subject, 'Password Reset OTP')
+        self.assertIn('123456', message.body)
+        self.assertIn('expire in 10 minutes', message.body)
+        self.assertIn('jane', message.body)
+        self.assertNotIn('<', message.body)
+        html, mimetype = message.alternatives[0]
+        self.assertEqual(mimetype, 'text/html')
+        self.assertIn('<div class="otp-code">123456</div>', html)
+
+    def test_text_part_is_not_escaped(self):
+        self.user.username = "o'brien"
+        text, html = render_email('welcome', {'user': self.user})
+
+        self.assertIn("Welcome to Our App, o'brien!", text)
+        self.assertIn('o&#x27;brien', html)
+
+    def test_templates_compiled_once(self):
+        get_templates.cache_clear()
+        with mock.patch('accounts.emails.get_template',
+                        side_effect=get_template) as load:
+            for _ in range(3):
+                render_email('welcome', {'user': self.user})
+
+        self.assertEqual(load.call_count, 2)
+
+
+@override_settings(
+    EMAIL_BACKEND='common.email_backends.PooledSMTPEmailBackend',
+    EMAIL_USE_TLS=False,
+    EMAIL_HOST_USER='',
+)
+class PooledEmailBackendTests(SimpleTestCase):
+    """SMTP connections are reused across sends and dropped when dead."""
+
+    def setUp(self):
+        pool.clear()
+        self.addCleanup(pool.clear)
+
+    def send(self):
+        send_mail('Subject', 'Body', 'noreply@example.com', ['jane@example.com'])
+
+    def test_connection_reused_across_sends(self):
+        with mock.patch('smtplib.SMTP') as smtp:
+            for _ in range(3):
+                self.send()
+
+        self.assertEqual(smtp.call_count, 1)
+        self.assertEqual(smtp.return_value.sendmail.call_count, 3)
+
+    def test_closed_connection_is_replaced(self):
+        with mock.patch('smtplib.SMTP') as smtp:
+            self.send()
+            smtp.return_value.sock = None
+            self.send()
+
+        self.assertEqual(smtp.call_count, 2)
+
+
+@override_settings(RATELIMIT_ENABLE=False)
+class OTPStoreTests(TestCase):
+    """Both OTP stores verify and consume codes atomically."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='jane@example.com', username='jane', password='12345678')
+
+    def assert_store_behaviour(self):
+        store = get_otp_store()
+        store.issue(self.user, '123456')
+
+        with self.assertRaises(OTPError) as ctx:
+            store.consume(self.user.email, '654321')
+        self.assertEqual(ctx.exception.field, 'otp_code')
+
+        self.assertEqual(str(store.consume(self.user.email, '123456')),
+                         str(self.user.pk))
+        with self.assertRaises(OTPError):
+            store.consume(self.user.email, '123456')
+
+    @override_settings(OTP_STORE={'BACKEND': 'model', 'TTL': 600})
+    def test_model_store(self):
+        self.assert_store_behaviour()
+
+    @override_settings(OTP_STORE={'BACKEND': 'model', 'TTL': 600})
+    def test_model_store_consume_queries(self):
+        get_otp_store().issue(self.user, '123456')
+        # Joined lookup plus the conditional UPDATE
+        with self.assertNumQueries(2):
+            get_otp_store().consume(self.user.email, '123456')
+
+    @override_settings(OTP_STORE={'BACKEND': 'model', 'TTL': 0})
+    def test_model_store_expiry(self):
+        get_otp_store().issue(self.user, '123456')
+        with self.assertRaises(OTPError):
+            get_otp_store().verify(self.user.email, '123456')
+
+    @override_settings(OTP_STORE={'BACKEND': 'cache', 'TTL': 600})
+    def test_cache_store(self):
+        self.assert_store_behaviour()
+
+    @override_settings(OTP_STORE={'BACKEND': 'cache', 'TTL': 600})
+    def test_cache_store_consume_queries(self):
+        get_otp_store().issue(self.user, '123456')
+        with self.assertNumQueries(0):
+            get_otp_store().consume(self.user.email, '123456')
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    EMAIL_QUEUE={'BACKEND': 'sync'},
+    RATELIMIT_ENABLE=False,
+)
+class OTPIssuanceTests(TestCase):
+    """Repeated reset requests reuse the live code instead of sending new ones."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='jane@example.com', username='jane', password='12345678')
+        mail.outbox = []
+
+    def request_reset(self, **headers):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('password-reset'), {'email': self.user.email}, headers=headers)
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(OTP_STORE={'BACKEND': 'model', 'RESEND_COOLDOWN': 60})
+    def test_cooldown_reuses_live_code(self):
+        self.request_reset()
+        self.request_reset()
+        self.assertEqual(OTP.objects.count(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        first = OTP.objects.get()
+
+        # Past the cooldown the same row is re-armed with a new code
+        OTP.objects.update(created_at=timezone.now() - timedelta(seconds=61))
+        self.request_reset()
+        second = OTP.objects.get()
+        self.assertEqual(second.pk, first.pk)
+        self.assertGreater(second.created_at, first.created_at)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertIn(second.code, mail.outbox[1].body)
+
+    @override_settings(OTP_STORE={'BACKEND': 'model', 'RESEND_COOLDOWN': 0})
+    def test_used_code_is_not_rearmed(self):
+        self.request_reset()
+        get_otp_store().consume(self.user.email, OTP.objects.get().code)
+        self.request_reset()
+        self.assertEqual(OTP.objects.filter(is_used=False).count(), 1)
+        self.assertEqual(OTP.objects.count(), 2)
+
+    @override_settings(OTP_STORE={'BACKEND': 'model', 'RESEND_COOLDOWN': 0})
+    def test_idempotency_key_collapses_duplicates(self):
+        self.request_reset(**{'Idempotency-Key': 'a'})
+        self.request_reset(**{'Idempotency-Key': 'a'})
+        self.assertEqual(len(mail.outbox), 1)
+
+        self.request_reset(**{'Idempotency-Key': 'b'})
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(OTP.objects.count(), 1)
+
+    @override_settings(OTP_STORE={'BACKEND': 'model', 'RESEND_COOLDOWN': 60})
+    def test_race_loser_keeps_winners_code(self):
+        update = QuerySet.update
+
+        def lose_race(queryset, **kwargs):
+            rows = update(queryset, **kwargs)
+            # A concurrent request inserts between our UPDATE and INSERT
+            OTP.objects.create(user=self.user, code='111111')
+            return rows
+
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=lose_race):
+            self.assertFalse(get_otp_store().issue(self.user, '123456'))
+        self.assertEqual(list(OTP.objects.values_list('code', flat=True)), ['111111'])
+
+    @override_settings(OTP_STORE={'BACKEND': 'cache', 'RESEND_COOLDOWN': 60})
+    def test_cache_store_cooldown(self):
+        store = get_otp_store()
+        self.assertTrue(store.issue(self.user, '123456'))
+        self.assertFalse(store.issue(self.user, '654321'))
+        store.consume(self.user.email, '123456')
+        # A used code doesn't hold back the next one
+        self.assertTrue(store.issue(self.user, '654321'))
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    EMAIL_QUEUE={'BACKEND': 'sync'},
+    OTP_STORE={'BACKEND': 'model', 'RESEND_COOLDOWN': 60},
+    RATELIMIT_ENABLE=False,
+)
+@skipIf(connection.vendor == 'sqlite' and connection.is_in_memory_db(),
+        "SQLite's shared-cache test database raises 'table is locked' for concurrent writers")
+class ConcurrentOTPIssuanceTests(TransactionTestCase):
+    """Concurrent duplicate reset requests issue one code and send one email."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='jane@example.com', username='jane', password='12345678')
+        mail.outbox = []
+
+    def run_concurrently(self, count, **headers):
+        barrier = threading.Barrier(count)
+        statuses = []
+
+        def request():
+            try:
+                barrier.wait()
+                response = APIClient().post(
+                    reverse('password-reset'), {'email': self.user.email}, headers=headers)
+                statuses.append(response.status_code)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=request) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return statuses
+
+    def test_concurrent_duplicates(self):
+        statuses = self.run_concurrently(8)
+        self.assertEqual(statuses, [200] * 8)
+        self.assertEqual(OTP.objects.count(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(OTP.objects.get().code, mail.outbox[0].body)
+
+    @override_settings(OTP_STORE={'BACKEND': 'model', 'RESEND_COOLDOWN': 0})
+    def test_concurrent_idempotency_key(self):
+        statuses = self.run_concurrently(8, **{'Idempotency-Key': 'retry-1'})
+        self.assertEqual(statuses, [200] * 8)
+        self.assertEqual(OTP.objects.count(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    EMAIL_QUEUE={'BACKEND': 'sync'},
+    OTP_STORE={'BACKEND': 'model'},
+    RATELIMIT_ENABLE=False,
+)
+class PasswordResetFlowTests(TestCase):
+    """Request, verify and reset each take a fixed, small number of queries."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='jane@example.com', username='jane', password='Old-pass-123')
+        mail.outbox = []
+
+    def post(self, name, data, queries):
+        with self.assertNumQueries(queries):
+            response = self.client.post(reverse(name), data)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response
+
+    def test_flow_queries(self):
+        # Email check and user lookup, then the re-arm UPDATE and the
+        # savepointed INSERT of the one live code
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post('password-reset', {'email': self.user.email}, 6)
+        code = OTP.objects.get().code
+
+        # The OTP joined to its user by email, and the conditional UPDATE
+        response = self.post('verify-otp', {'email': self.user.email, 'otp_code': code}, 2)
+
+        # No OTP lookup: the user by primary key, and the password UPDATE
+        self.post('password-reset-confirm', {
+            'reset_token': response.data['reset_token'],
+            'new_password': 'New-pass-123', 'confirm_password': 'New-pass-123',
+        }, 2)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('New-pass-123'))
+
+    def test_reset_token_is_single_use(self):
+        get_otp_store().issue(self.user, '123456')
+        token = self.client.post(reverse('verify-otp'), {
+            'email': self.user.email, 'otp_code': '123456'}).data['reset_token']
+        data = {'reset_token': token, 'new_password': 'New-pass-123',
+                'confirm_password': 'New-pass-123'}
+
+        self.assertEqual(self.client.post(reverse('password-reset-confirm'), data).status_code, 200)
+        response = self.client.post(reverse('password-reset-confirm'), data)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('reset_token', response.data)
+
+    def test_tampered_reset_token_rejected(self):
+        token = make_reset_token(self.user)
+        response = self.client.post(reverse('password-reset-confirm'), {
+            'reset_token': token[:-1] + ('A' if token[-1] != 'A' else 'B'),
+            'new_password': 'New-pass-123', 'confirm_password': 'New-pass-123'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('reset_token', response.data)
+
+    @override_settings(OTP_STORE={'BACKEND': 'model', 'RESET_TOKEN_TTL': 0})
+    def test_expired_reset_token_rejected(self):
+        token = make_reset_token(self.user)
+        time.sleep(0.01)
+        response = self.client.post(reverse('password-reset-confirm'), {
+            'reset_token': token, 'new_password': 'New-pass-123',
+            'confirm_password': 'New-pass-123'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_verify_race_loser_gets_conflict(self):
+        get_otp_store().issue(self.user, '123456')
+        match = ModelOTPStore._match
+
+        def lose_race(store, email, code):
+            otp = match(store, email, code)
+            # A concurrent request consumes the code between our read and UPDATE
+            OTP.objects.filter(pk=otp.pk).update(is_used=True)
+            return otp
+
+        with mock.patch.object(ModelOTPStore, '_match', autospec=True, side_effect=lose_race):
+            response = self.client.post(reverse('verify-otp'), {
+                'email': self.user.email, 'otp_code': '123456'})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['code'], 'conflict')
+
+    def test_reset_race_loser_gets_conflict(self):
+        token = make_reset_token(self.user)
+
+        def lose_race(token):
+            user = check_reset_token(token)
+            # A concurrent request with the same token resets the password first
+            User.objects.filter(pk=user.pk).update(password='changed')
+            return user
+
+        with mock.patch('accounts.serializers.check_reset_token', side_effect=lose_race):
+            response = self.client.post(reverse('password-reset-confirm'), {
+                'reset_token': token, 'new_password': 'New-pass-123',
+                'confirm_password': 'New-pass-123'})
+        self.assertEqual(response.status_code, 409)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.password, 'changed')
+
+    def test_reset_writes_only_password(self):
+        token = make_reset_token(self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(reverse('password-reset-confirm'), {
+                'reset_token': token, 'new_password': 'New-pass-123',
+                'confirm_password': 'New-pass-123'})
+        update = ctx.captured_queries[-1]['sql']
+        self.assertTrue(update.startswith('UPDATE "accounts_user" SET "password" ='))
+        self.assertIn('"updated_at" =', update)
+        self.assertNotIn('"email" =', update.split('WHERE')[0])
+
+
+@skipIf(connection.vendor == 'sqlite' and connection.is_in_memory_db(),
+        "SQLite's shared-cache test database raises 'table is locked' for concurrent writers")
+@override_settings(OTP_STORE={'BACKEND': 'model'}, RATELIMIT_ENABLE=False)
+class ConcurrentPasswordResetTests(TransactionTestCase):
+    """Of many parallel requests with one code or token, exactly one succeeds."""
+
+    threads = 16
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='jane@example.com', username='jane', password='Old-pass-123')
+
+    def run_concurrently(self, name, data):
+        barrier = threading.Barrier(self.threads)
+        statuses = []
+
+        def request():
+            try:
+                barrier.wait()
+                statuses.append(APIClient().post(reverse(name), data).status_code)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=request) for _ in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(statuses)
+
+    def test_one_code_verified_once(self):
+        get_otp_store().issue(self.user, '123456')
+        statuses = self.run_concurrently(
+            'verify-otp', {'email': self.user.email, 'otp_code': '123456'})
+
+        self.assertEqual(statuses.count(200), 1)
+        # Losers either saw the code already used (400) or lost the UPDATE (409)
+        self.assertTrue(set(statuses) <= {200, 400, 409}, statuses)
+        self.assertTrue(OTP.objects.get().is_used)
+
+    def test_one_token_resets_once(self):
+        statuses = self.run_concurrently('password-reset-confirm', {
+            'reset_token': make_reset_token(self.user),
+            'new_password': 'New-pass-123', 'confirm_password': 'New-pass-123'})
+
+        self.assertEqual(statuses.count(200), 1)
+        self.assertTrue(set(statuses) <= {200, 400, 409}, statuses)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('New-pass-123'))
+
+
+class ExceptionHandlerTests(SimpleTestCase):
+    """Errors render in the project's envelope; static ones are pre-rendered once."""
+
+    def respond(self, exc, **headers):
+        class ErrorView(APIView):
+            authentication_classes = []
+            permission_classes = [AllowAny]
+            throttle_classes = []
+
+            def get(self, request):
+                raise exc
+
+        request = RequestFactory().get('/', **headers)
+        return ErrorView.as_view()(request).render()
+
+    def test_validation_error(self):
+        response = self.respond(exceptions.ValidationError({'email': ['Required.']}))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content), {
+            'success': False, 'message': 'Validation error.',
+            'errors': {'email': ['Required.']}, 'code': 'validation_error'})
+
+    def test_django_validation_error(self):
+        response = self.respond(DjangoValidationError({'username': ['Invalid.']}))
+        self.assertEqual(json.loads(response.content)['errors'], {'username': ['Invalid.']})
+
+        response = self.respond(DjangoValidationError('Invalid.'))
+        self.assertEqual(json.loads(response.content)['errors'],
+                         {'non_field_errors': ['Invalid.']})
+
+    def test_static_errors_reuse_rendered_envelope(self):
+        first = self.respond(Http404('No User matches the given query.'))
+        second = self.respond(Http404('No User matches the given query.'))
+        self.assertEqual(first.status_code, 404)
+        self.assertEqual(json.loads(first.content), {
+            'success': False, 'message': 'Not found.',
+            'detail': 'No User matches the given query.', 'code': 'not_found'})
+        self.assertEqual(first['Content-Type'], 'application/json')
+        self.assertIs(first.content, second.content)
+
+    def test_throttled_keeps_headers(self):
+        response = self.respond(exceptions.Throttled(wait=30))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        body = json.loads(response.content)
+        self.assertEqual(body['code'], 'throttled')
+        self.assertEqual(body['message'], 'Request was throttled.')
+
+    def test_permission_denied(self):
+        response = self.respond(PermissionDenied())
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(json.loads(response.content)['code'], 'permission_denied')
+
+    def test_media_type_parameters_render_normally(self):
+        response = self.respond(
+            exceptions.NotAuthenticated(), HTTP_ACCEPT='application/json; indent=2')
+        self.assertIn(b'\n  "success": false', response.content)
+
+
+class FastJSONTests(SimpleTestCase):
+    """The orjson renderer and parser match DRF's stdlib ones."""
+
+    def payload(self):
+        return {
+            'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+            'joined': datetime(2024, 1, 2, 3, 4, 5, 678000, tzinfo=dt_timezone.utc),
+            'local': datetime(2024, 1, 2, 3, 4, 5, tzinfo=dt_timezone(timedelta(hours=5, minutes=30))),
+            'day': date(2024, 1, 2),
+            'price': Decimal('1.50'),
+            'lazy': gettext_lazy('Not found.'),
+            'errors': exceptions.ValidationError({'email': ['Required.']}).detail,
+            'text': 'caf\u00e9 \u2028 line',
+            1: 'non-str key',
+        }
+
+    def test_renders_like_stdlib(self):
+        self.assertEqual(FastJSONRenderer().render(self.payload()),
+                         JSONRenderer().render(self.payload()))
+
+    def test_indent_and_missing_orjson_fall_back(self):
+        self.assertEqual(FastJSONRenderer().render({'a': 1}, 'application/json; indent=2'),
+                         b'{\n  "a": 1\n}')
+        with mock.patch('common.fastjson.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(self.payload()),
+                             JSONRenderer().render(self.payload()))
+
+    def test_parser(self):
+        data = FastJSONParser().parse(BytesIO('{"email": "caf\u00e9@example.com"}'.encode()))
+        self.assertEqual(data, {'email': 'caf\u00e9@example.com'})
+        for content in (b'{"a": ', b'{"a": NaN}'):
+            with self.assertRaises(exceptions.ParseError):
+                FastJSONParser().parse(BytesIO(content))
+
+    def test_api_uses_fast_json(self):
+        response = APIView.as_view()(RequestFactory().get('/'))
+        self.assertIsInstance(response.accepted_renderer, FastJSONRenderer)
+
+
+class CachedAuthenticationTests(TestCase):
+    """Authenticated requests load the user from the cache, not the database."""
+
+    def setUp(self):
+        cache.clear()
+        get_user_cache().cache.clear()
+        get_user_cache().local.clear()
+        self.user = User.objects.create_user(
+            email='jane@example.com', username='jane', password='12345678')
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_repeat_requests_hit_the_cache(self):
+        get_user_cache().reset_stats()
+        with self.assertNumQueries(1):
+            self.client.get(reverse('user-details'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('user-details'))
+
+        self.assertEqual(response.data['email'], self.user.email)
+        self.assertEqual(get_user_cache().stats['misses'], 1)
+        self.assertEqual(get_user_cache().stats['local_hits'], 1)
+
+    def test_saving_the_user_invalidates_the_cache(self):
+        self.client.get(reverse('user-details'))
+        self.user.username = 'jane_doe'
+        self.user.save()
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('user-details'))
+        self.assertEqual(response.data['username'], 'jane_doe')
+
+    def test_unshared_cache_reloads_after_local_ttl(self):
+        cached = get_user_cache().get(self.user.pk)
+        # Changed by another process: no invalidation reaches this one
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        get_user_cache().local.clear()
+
+        self.assertTrue(cached.is_active)
+        self.assertFalse(get_user_cache().get(self.user.pk).is_active)
+
+    @override_settings(USER_CACHE={'CACHE_ALIAS': 'users', 'SHARED': True})
+    def test_shared_tier(self):
+        get_user_cache().get(self.user.pk)
+        get_user_cache().local.clear()
+        with self.assertNumQueries(0):
+            get_user_cache().get(self.user.pk)
+        self.assertEqual(get_user_cache().stats['shared_hits'], 1)
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.get(reverse('user-details'))
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.get(reverse('user-details'))
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(JWT_USER_SNAPSHOT=True, USER_CACHE={'CACHE_ALIAS': 'users', 'SHARED': True})
+class UserSnapshotTokenTests(TestCase):
+    """Safe requests with a current token snapshot never touch the database."""
+
+    def setUp(self):
+        cache.clear()
+        get_user_cache().cache.clear()
+        get_user_cache().local.clear()
+        self.user = User.objects.create_user(
+            email='jane@example.com', username='jane', password='12345678')
+        response = APIClient().post(
+            '/api/auth/jwt/create/', {'email': self.user.email, 'password': '12345678'})
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+
+    def test_me_served_from_token(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('user-details'))
+
+        with override_settings(JWT_USER_SNAPSHOT=False):
+            expected = self.client.get(reverse('user-details'))
+        self.assertEqual(response.json(), expected.json())
+
+    def test_ignored_without_shared_cache(self):
+        with override_settings(USER_CACHE={'CACHE_ALIAS': 'users', 'SHARED': False}):
+            with self.assertNumQueries(1):
+                response = self.client.get(reverse('user-details'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_stale_snapshot_falls_back_to_database(self):
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.get(reverse('user-details'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_writes_load_the_user(self):
+        response = self.client.patch(reverse('user-details'), {'username': 'jane_doe'})
+
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.username, 'jane_doe')
+
+    def test_refresh_re_embeds_current_snapshot(self):
+        refresh = APIClient().post(
+            '/api/auth/jwt/create/', {'email': self.user.email, 'password': '12345678'}
+        ).data['refresh']
+        self.user.username = 'jane_doe'
+        self.user.save()
+
+        access = APIClient().post('/api/auth/jwt/refresh/', {'refresh': refresh}).data['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('user-details'))
+        self.assertEqual(response.data['username'], 'jane_doe')
+
+
+class RefreshTokenRevocationTests(TestCase):
+    """Rotated refresh tokens are revoked and checked through the cache."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='jane@example.com', username='jane', password='12345678')
+        self.refresh = RefreshToken.for_user(self.user)
+
+    def post_refresh(self, token):
+        return APIClient().post('/api/auth/jwt/refresh/', {'refresh': str(token)})
+
+    def test_rotated_token_cannot_be_reused(self):
+        self.assertEqual(self.post_refresh(self.refresh).status_code, 200)
+        self.assertTrue(is_revoked(self.refresh['jti']))
+
+        response = self.post_refresh(self.refresh)
+        self.assertEqual(response.status_code, 401)
+
+    def test_rotation_queries(self):
+        get_user_cache().get(self.user.pk)
+        # Blacklist check, then revoking: look up the outstanding row and the
+        # blacklist entry (inserted in a savepoint); the new token is a plain INSERT
+        with self.assertNumQueries(7):
+            self.assertEqual(self.post_refresh(self.refresh).status_code, 200)
+        self.assertEqual(OutstandingToken.objects.count(), 2)
+
+    def test_revoked_token_found_after_cache_flush(self):
+        self.post_refresh(self.refresh)
+        cache.clear()
+
+        self.assertTrue(is_revoked(self.refresh['jti']))
+
+    @override_settings(TOKEN_REVOCATION={'TRUST_CACHE': True})
+    def test_warm_cache_answers_without_queries(self):
+        self.post_refresh(self.refresh)
+        cache.clear()
+        self.assertEqual(warm(), 1)
+
+        with self.assertNumQueries(0):
+            self.assertTrue(is_revoked(self.refresh['jti']))
+            self.assertFalse(is_revoked('unknown-jti'))
+
+    def test_purge_deletes_expired_tokens(self):
+        self.post_refresh(self.refresh)
+        OutstandingToken.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        call_command('purge_revoked_tokens', stdout=StringIO())
+
+        self.assertFalse(OutstandingToken.objects.exists())
+
+
+
+@override_settings(RATELIMIT_ENABLE=False)
+class PasswordHashingTests(TestCase):
+    """Hashing goes through the bounded pool and hashes upgrade on login."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='jane@example.com', username='jane', password='12345678')
+
+    def login(self):
+        return APIClient().post(
+            '/api/auth/jwt/create/', {'email': self.user.email, 'password': '12345678'})
+
+    @override_settings(
+        PASSWORD_HASHERS=[
+            'common.hashers.ScryptPasswordHasher',
+            'django.contrib.auth.hashers.MD5PasswordHasher',
+        ],
+        PASSWORD_HASHING={'SCRYPT_WORK_FACTOR': 2 ** 10},
+    )
+    def test_login_upgrades_hash(self):
+        # setUp hashed with the default hasher; store a legacy hash to upgrade
+        self.user.password = make_password('12345678', hasher='md5')
+        self.user.save(update_fields=['password'])
+        self.assertTrue(self.user.password.startswith('md5$'))
+
+        self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('scrypt$1024$'))
+
+        with self.settings(PASSWORD_HASHING={'SCRYPT_WORK_FACTOR': 2 ** 11}):
+            self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('scrypt$2048$'))
+
+    @override_settings(PASSWORD_HASHING={'MAX_PENDING': 1, 'WAIT_TIMEOUT': 0})
+    def test_saturated_pool_sheds_load(self):
+        slots = get_hashing_service().slots
+        slots.acquire()
+        try:
+            response = self.login()
+        finally:
+            slots.release()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['code'], 'service_unavailable')
+        self.assertEqual(self.login().status_code, 200)
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    EMAIL_QUEUE={'BACKEND': 'sync'},
+    RATELIMIT_ENABLE=False,
+)
+class AsyncViewTests(TestCase):
+    """The async views keep the request and response formats of the sync ones."""
+
+    def setUp(self):
+        self.factory = AsyncRequestFactory()
+        self.user = User.objects.create_user(
+            email='jane@example.com', username='jane', password='12345678')
+        get_user_cache().cache.clear()
+        get_user_cache().local.clear()
+        mail.outbox = []
+
+    async def post(self, view, data):
+        request = self.factory.post('/', data, content_type='application/json')
+        response = await view.as_view()(request)
+        return response.status_code, json.loads(response.content)
+
+    async def test_password_reset_flow(self):
+        status_code, body = await self.post(
+            AsyncRequestPasswordResetView, {'email': self.user.email})
+        self.assertEqual(status_code, 200)
+        self.assertEqual(len(mail.outbox), 1)
+
+        otp = await OTP.objects.aget(user=self.user)
+        status_code, body = await self.post(
+            AsyncVerifyOTPView, {'email': self.user.email, 'otp_code': otp.code})
+        self.assertEqual(status_code, 200)
+
+        status_code, body = await self.post(AsyncResetPasswordView, {
+            'reset_token': body['reset_token'],
+            'new_password': 'New-pass-123',
+            'confirm_password': 'New-pass-123',
+        })
+        self.assertEqual(status_code, 200)
+
+        await self.user.arefresh_from_db()
+        self.assertTrue(self.user.check_password('New-pass-123'))
+
+    async def test_errors_match_sync_views(self):
+        status_code, body = await self.post(
+            AsyncRequestPasswordResetView, {'email': 'nobody@example.com'})
+        self.assertEqual(status_code, 400)
+        self.assertEqual(body, {'email': ['No user with this email address exists.']})
+
+        status_code, body = await self.post(
+            AsyncVerifyOTPView, {'email': self.user.email, 'otp_code': '123456'})
+        self.assertEqual(status_code, 400)
+        self.assertEqual(body, {'otp_code': ['No active OTP found. Please request a new one.']})
+
+    async def test_error_responses_are_json(self):
+        request = self.factory.post('/', '{broken', content_type='application/json')
+        response = await AsyncVerifyOTPView.as_view()(request)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(response.content)['code'], 'parse_error')
+
+    async def test_user_details_requires_token(self):
+        response = await AsyncUserDetailsView.as_view()(self.factory.get('/'))
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('WWW-Authenticate', response)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+        token = AccessToken.for_user(self.user)
+        request = self.factory.patch(
+            '/', {'username': 'janet'}, content_type='application/json',
+            headers={'Authorization': f'Bearer {token}'})
+        response = await AsyncUserDetailsView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['username'], 'janet')
+
+
+@override_settings(
+    EMAIL_HOST_USER='mailer@example.com',
+    EMAIL_QUEUE={'BACKEND': 'database'},
+)
+class BulkImportTests(TestCase):
+    """bulk_import_users validates, de-duplicates and inserts rows in batches."""
+
+    def setUp(self):
+        User.objects.create_user(
+            email='taken@example.com', username='taken', password='Secret-pass-1')
+        EmailJob.objects.all().delete()
+
+    def run_import(self, lines, suffix, **options):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False) as f:
+            f.write('\n'.join(lines) + '\n')
+        self.addCleanup(os.remove, f.name)
+        out, err = StringIO(), StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('bulk_import_users', f.name, workers=0, batch_size=2,
+                         stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_import_csv(self):
+        out, err = self.run_import([
+            'email,username,password',
+            'ann@example.com,ann,Secret-pass-1',
+            'taken@example.com,someone,Secret-pass-1',
+            'bob@example.com,taken,Secret-pass-1',
+            'ann@example.com,ann2,Secret-pass-1',
+            'not-an-email,carl,Secret-pass-1',
+            'dana@example.com,dana,short',
+            'erin@example.com,erin,Secret-pass-1',
+        ], '.csv')
+
+        self.assertIn('2 created, 3 skipped, 2 invalid', out)
+        self.assertIn('Line 6:', err)
+        self.assertEqual(
+            set(User.objects.values_list('username', flat=True)), {'taken', 'ann', 'erin'})
+        self.assertTrue(User.objects.get(username='ann').check_password('Secret-pass-1'))
+        # No per-row welcome emails from post_save
+        self.assertFalse(EmailJob.objects.exists())
+
+    def test_blank_usernames_are_allocated(self):
+        out, err = self.run_import([
+            'email,username,password',
+            'ann@example.com,,Secret-pass-1',
+            'taken@example.com,,Secret-pass-1',
+            'taken@example.org,,Secret-pass-1',
+        ], '.csv')
+
+        self.assertIn('2 created, 1 skipped, 0 invalid', out)
+        self.assertEqual(err, '')
+        usernames = set(User.objects.values_list('username', flat=True))
+        self.assertEqual(len(usernames), 3)
+        self.assertIn('ann', usernames)
+
+    def test_import_jsonl_queues_welcome_emails(self):
+        out, err = self.run_import([
+            json.dumps({'email': 'ann@example.com', 'username': 'ann',
+                        'password': 'Secret-pass-1'}),
+            '{broken',
+            json.dumps({'email': 'bob@example.com', 'username': 'bob',
+                        'password': 'Secret-pass-1'}),
+        ], '.jsonl', send_welcome=True)
+
+        self.assertIn('2 created, 0 skipped, 1 invalid', out)
+        self.assertEqual(EmailJob.objects.filter(kind='welcome').count(), 2)
+
+
+class UsernameAllocationTests(TestCase):
+    """Usernames are allocated in set-based rounds and retried on conflicts."""
+
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(
+            email='jane@example.com', username='jane', password='Secret-pass-1')
+
+    def test_batch_resolves_collisions_per_round(self):
+        emails = ['jane@a.com', 'jane@b.com', 'bob@a.com', 'bob@b.com', 'j.o+x@c.com']
+        with self.assertNumQueries(2):
+            usernames = allocate_usernames(emails, User)
+
+        self.assertEqual(len(set(usernames)), len(emails))
+        self.assertNotIn('jane', usernames)
+        self.assertEqual(usernames[2], 'bob')
+        self.assertEqual(usernames[4], 'j.ox')
+        self.assertTrue(usernames[3].startswith('bob_'))
+
+    def register(self):
+        return APIClient().post('/api/auth/users/', {
+            'email': 'jane@other.com',
+            'password': 'Secret-pass-1',
+            'confirm_password': 'Secret-pass-1',
+        })
+
+    def test_registration_generates_username(self):
+        response = self.register()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.data['username'].startswith('jane_'))
+
+    def test_registration_retries_lost_race(self):
+        # The first allocation raced with another signup that took "jane"
+        with mock.patch('accounts.serializers.allocate_usernames',
+                        side_effect=[['jane'], ['jane_2']]):
+            response = self.register()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['username'], 'jane_2')
+
+
+class RateLimitTests(TestCase):
+    """Decorators and throttles share the sliding-window limiter."""
+
+    def setUp(self):
+        cache.clear()
+        self.limiter = SlidingWindowLimiter(get_limiter_settings())
+        self.window = int(time.time() // 60)
+
+    def hit_at(self, seconds, limit, key='client'):
+        with mock.patch('time.time', return_value=self.window * 60 + seconds):
+            return self.limiter.hit(key, limit, 60)
+
+    def test_previous_window_slides_out(self):
+        self.assertTrue(all(self.hit_at(30, 3).allowed for _ in range(3)))
+        usage = self.hit_at(30, 3)
+        self.assertFalse(usage.allowed)
+        self.assertGreater(usage.wait, 0)
+
+        # Halfway into the next window, half of the previous 4 still count
+        self.assertTrue(self.hit_at(90, 3).allowed)
+        self.assertFalse(self.hit_at(90, 3).allowed)
+
+    def test_local_precheck_batches_increments(self):
+        with mock.patch.object(cache, 'incr', wraps=cache.incr) as incr:
+            for _ in range(11):
+                self.assertTrue(self.hit_at(0, 1000).allowed)
+
+        # The first hit and one flush of the next ten reach the shared cache
+        self.assertEqual(incr.call_count, 2)
+        self.assertEqual(cache.get(f'rl:client:60:{self.window}'), 11)
+
+    @override_settings(RATELIMIT_IPV6_MASK=64)
+    def test_rates_and_keys(self):
+        self.assertEqual(split_rate('3/h'), (3, 3600))
+        self.assertEqual(split_rate('100/5m'), (100, 300))
+        self.assertEqual(split_rate('10/s'), (10, 1))
+        self.assertEqual(split_rate((5, 30)), (5, 30))
+
+        request = RequestFactory().get('/?token=abc', HTTP_X_CLIENT='mobile',
+                                       REMOTE_ADDR='2001:db8::1:2:3:4')
+        self.assertEqual(client_ip(request), '2001:db8::')
+        self.assertEqual(_key_value('get:token', 'group', request), 'abc')
+        self.assertEqual(_key_value('header:x-client', 'group', request), 'mobile')
+        self.assertEqual(_key_value(lambda group, r: group, 'group', request), 'group')
+
+    def test_password_reset_is_rate_limited(self):
+        client = APIClient()
+        for _ in range(3):
+            response = client.post(reverse('password-reset'), {'email': 'nobody@example.com'})
+            self.assertEqual(response.status_code, 400)
+
+        response = client.post(reverse('password-reset'), {'email': 'nobody@example.com'})
+        self.assertEqual(response.status_code, 403)
+
+
+class DatabaseConnectionStatsTests(TestCase):
+    """Connection and pool stats are available to admins only."""
+
+    def test_admin_only(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(
+            email='jane@example.com', username='jane', password='Secret-pass-1'))
+        self.assertEqual(client.get(reverse('db-pool-stats')).status_code, 403)
+
+        client.force_authenticate(User.objects.create_superuser(
+            email='admin@example.com', username='admin', password='Secret-pass-1'))
+        response = client.get(reverse('db-pool-stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('connections_opened', response.data['default'])
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'], DATABASE_STICKY_SECONDS=5)
+class ReplicaRoutingTests(TestCase):
+    """Safe requests read from replicas unless they or the client wrote."""
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.reads = []
+        self.middleware = ReplicaRoutingMiddleware(self.view)
+
+    def view(self, request):
+        with read_from_replica():
+            self.reads.append(router.db_for_read(User))
+        self.reads.append(router.db_for_read(User))
+        if request.method == 'POST':
+            User.objects.create_user(
+                email='jane@example.com', username='jane', password='Secret-pass-1')
+            with read_from_replica():
+                self.reads.append(router.db_for_read(User))
+        return HttpResponse()
+
+    def request(self, method, ip='10.0.0.1', user=None):
+        self.reads = []
+        headers = {}
+        if user is not None:
+            headers['HTTP_AUTHORIZATION'] = f'Bearer {AccessToken.for_user(user)}'
+        self.middleware(getattr(self.factory, method)('/', REMOTE_ADDR=ip, **headers))
+        return self.reads
+
+    def test_routing(self):
+        self.assertEqual(self.request('get'), ['replica1', 'replica1'])
+        # Unsafe requests read from the primary, except lag-tolerant reads
+        # before the request has written anything
+        self.assertEqual(self.request('post'), ['replica1', 'default', 'default'])
+        # The writer sticks to the primary for a while; others don't
+        self.assertEqual(self.request('get'), ['default', 'default'])
+        self.assertEqual(self.request('get', ip='10.0.0.2'), ['replica1', 'replica1'])
+
+    def test_sticky_per_user(self):
+        writer = User.objects.create_user(
+            email='writer@example.com', username='writer', password='Secret-pass-1')
+        other = User.objects.create_user(
+            email='other@example.com', username='other', password='Secret-pass-1')
+        cache.clear()
+
+        # An authenticated write pins the user, whatever token or address it
+        # reads with next, and nobody else behind the same address
+        self.request('post', user=writer)
+        self.assertEqual(self.request('get', ip='10.0.0.9', user=writer), ['default', 'default'])
+        self.assertEqual(self.request('get', user=other), ['replica1', 'replica1'])
+
+    def test_anonymous_write_then_token_read(self):
+        # Registration or login, then a read with the new token
+        self.request('post')
+        user = User.objects.using('default').get(email='jane@example.com')
+        self.assertEqual(self.request('get', user=user), ['default', 'default'])
+
+    def test_no_replicas(self):
+        with self.settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(self.request('get'), ['default', 'default'])
+
+
+@override_settings(OTP_STORE={'TTL': 600}, OTP_CLEANUP={'SLEEP': 0})
+class OTPCleanupTests(TestCase):
+    """Expired and used OTPs are deleted in resumable batches."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='jane@example.com', username='jane', password='Secret-pass-1')
+
+    def create_otps(self, count, age=0, is_used=False):
+        # Unused codes need a user each (one live code per user)
+        users = User.objects.bulk_create(
+            User(email=f'user{i}-{age}-{is_used}@example.com',
+                 username=f'user{i}_{age}_{is_used}', password='!')
+            for i in range(count))
+        otps = OTP.objects.bulk_create(
+            [OTP(user=user, code='123456', is_used=is_used) for user in users])
+        OTP.objects.filter(pk__in=[otp.pk for otp in otps]).update(
+            created_at=timezone.now() - timedelta(seconds=age))
+
+    def test_cleanup(self):
+        self.create_otps(5, age=3600)
+        self.create_otps(3, is_used=True)
+        self.create_otps(2)
+
+        out = StringIO()
+        call_command('cleanup_otps', '--batch-size', '2', '--max-batches', '2', stdout=out)
+        self.assertIn('Deleted 4 OTPs in 2 batches', out.getvalue())
+        self.assertEqual(OTP.objects.count(), 6)
+
+        # The next run resumes from the cursor and finishes the job
+        call_command('cleanup_otps', '--batch-size', '2', stdout=out)
+        self.assertEqual(OTP.objects.count(), 2)
+        self.assertFalse(OTP.objects.filter(is_used=True).exists())
+
+    def statements(self, queries):
+        return [q['sql'] for q in queries.captured_queries
+                if not q['sql'].startswith(('BEGIN', 'COMMIT', 'SAVEPOINT', 'RELEASE'))]
+
+    def test_batch_selects_then_deletes(self):
+        self.create_otps(3, age=3600)
+        self.create_otps(1)
+        with CaptureQueriesContext(connection) as queries:
+            deleted, last, _ = OTPCleaner().delete_batch(
+                timezone.now() - timedelta(seconds=600), 0)
+
+        self.assertEqual(deleted, 3)
+        self.assertEqual(last, OTP.objects.order_by('pk').last().pk - 1)
+        self.assertEqual([sql.split()[0] for sql in self.statements(queries)],
+                         ['SELECT', 'DELETE'])
+        self.assertEqual(OTP.objects.count(), 1)
+
+    def test_postgresql_batch_is_one_statement(self):
+        # The PostgreSQL statement is plain SQL that SQLite runs as well
+        self.create_otps(3, age=3600)
+        self.create_otps(1)
+        cleaner = OTPCleaner({**get_cleanup_settings(), 'BATCH_SIZE': 2})
+        cutoff = timezone.now() - timedelta(seconds=600)
+        with CaptureQueriesContext(connection) as queries:
+            first = cleaner._delete_returning(cutoff, 0)
+
+        self.assertEqual(len(first), 2)
+        self.assertEqual([sql.split()[0] for sql in self.statements(queries)], ['DELETE'])
+        self.assertEqual(len(cleaner._delete_returning(cutoff, max(first))), 1)
+        self.assertEqual(OTP.objects.count(), 1)
+
+    def test_retire_duplicates(self):
+        # A database from before the constraint (a unique index on SQLite and
+        # PostgreSQL; dropped inside the test's transaction)
+        with connection.cursor() as cursor:
+            cursor.execute('DROP INDEX accounts_otp_one_active')
+        old = OTP.objects.create(user=self.user, code='111111')
+        OTP.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(minutes=5))
+        new = OTP.objects.create(user=self.user, code='222222')
+        self.create_otps(1)
+
+        out = StringIO()
+        call_command('cleanup_otps', '--retire-duplicates', stdout=out)
+
+        self.assertIn('Retired 1 duplicate OTPs', out.getvalue())
+        self.assertTrue(OTP.objects.get(pk=old.pk).is_used)
+        self.assertFalse(OTP.objects.get(pk=new.pk).is_used)
+        self.assertEqual(OTP.objects.filter(is_used=False).count(), 2)
+
+    def test_lock_budget_shrinks_batches(self):
+        self.create_otps(40, age=3600)
+        cleaner = OTPCleaner({**get_cleanup_settings(), 'BATCH_SIZE': 16,
+                              'MIN_BATCH_SIZE': 2, 'LOCK_BUDGET': 0})
+        stats = cleaner.run()
+        self.assertEqual(stats['deleted'], 40)
+        self.assertEqual(cleaner.batch_size, 2)
+
+
+class UserListPaginationTests(TestCase):
+    """Admins page through users by (date_joined, id) with a total count."""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            email='admin@example.com', username='admin', password='Secret-pass-1')
+        joined = timezone.now() - timedelta(days=1)
+        # Pairs of users share a join time, so the id breaks ties
+        User.objects.bulk_create(
+            User(email=f'user{i}@example.com', username=f'user{i}', password='!',
+                 date_joined=joined + timedelta(minutes=i // 2))
+            for i in range(7))
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_keyset_pages(self):
+        expected = [str(pk) for pk in User.objects.order_by(
+            '-date_joined', '-id').values_list('pk', flat=True)]
+
+        seen, pages = [], []
+        url = reverse('user-list') + '?page_size=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['count'], 8)
+            seen += [user['id'] for user in response.data['results']]
+            pages.append(response.data)
+            url = response.data['next']
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(pages), 3)
+
+        # Walking back from the last page returns the same pages
+        response = self.client.get(pages[-1]['previous'])
+        self.assertEqual(response.data['results'], pages[1]['results'])
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(response.data['results'], pages[0]['results'])
+        self.assertIsNone(response.data['previous'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('user-list') + '?cursor=bogus')
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(PAGINATION={'COUNT': 'none'})
+    def test_without_count(self):
+        response = self.client.get(reverse('user-list'))
+        self.assertNotIn('count', response.data)
+        self.assertEqual(len(response.data['results']), 8)
+
+    def test_admin_only(self):
+        # djoser hides the list from everyone else (HIDE_USERS)
+        self.client.force_authenticate(User.objects.get(username='user0'))
+        self.assertEqual(self.client.get(reverse('user-list')).status_code, 404)
+
+
+class CompiledSerializerTests(TestCase):
+    """The compiled read path renders exactly what UserSerializer does."""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            email='admin@example.com', username='admin', password='Secret-pass-1')
+        joined = datetime(2024, 1, 2, 3, 4, 5, tzinfo=dt_timezone.utc)
+        User.objects.bulk_create([
+            User(email='whole@example.com', username='whole', password='!', date_joined=joined),
+            User(email='micro@example.com', username='caf\u00e9', password='!',
+                 date_joined=joined + timedelta(microseconds=678)),
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.compiled = compile_serializer(UserSerializer)
+
+    def render(self, data):
+        return FastJSONRenderer().render(data)
+
+    def test_matches_serializer(self):
+        queryset = User.objects.order_by('email')
+        for tz in ('UTC', 'Asia/Kolkata'):
+            with timezone.override(tz):
+                self.assertEqual(
+                    self.render(self.compiled.to_representation_rows(self.compiled.values(queryset))),
+                    self.render(UserSerializer(queryset, many=True).data))
+                for user in queryset:
+                    self.assertEqual(self.render(self.compiled.to_representation(user)),
+                                     self.render(UserSerializer(user).data))
+
+    def test_endpoints_match_serializer(self):
+        urls = [
+            reverse('user-list'),
+            reverse('user-list') + '?page_size=1',
+            reverse('user-detail', args=[self.admin.pk]),
+            reverse('user-me'),
+            reverse('user-details'),
+        ]
+        for url in urls:
+            with mock.patch.object(UserSerializer, 'to_representation') as to_representation:
+                response = self.client.get(url)
+            to_representation.assert_not_called()
+            with mock.patch('common.serializers.compile_serializer', return_value=None):
+                expected = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, expected.content)
+
+    def test_only_plain_fields_compile(self):
+        class WithMethod(UserSerializer):
+            initials = serializers.SerializerMethodField()
+
+            class Meta(UserSerializer.Meta):
+                fields = UserSerializer.Meta.fields + ['initials']
+
+            def get_initials(self, user):
+                return user.username[:1]
+
+        self.assertIsNone(compile_serializer(WithMethod))
+        self.assertEqual(self.compiled.sources, ('id', 'email', 'username', 'date_joined'))
+
+
+class AdminChangelistTests(TestCase):
+    """Admin changelists run the same number of queries whatever the page size."""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            email='admin@example.com', username='admin', password='Secret-pass-1')
+        self.client.force_login(self.admin)
+        users = User.objects.bulk_create(
+            User(email=f'user{i}@example.com', username=f'user{i}', password='!')
+            for i in range(20))
+        OTP.objects.bulk_create(OTP(user=user, code='123456') for user in users)
+
+    def count_queries(self, url, per_page):
+        with CaptureQueriesContext(connection) as queries:
+            with mock.patch.object(admin.site._registry[self.model], 'list_per_page', per_page):
+                response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assert_constant(self, model, search):
+        self.model = model
+        url = reverse(f'admin:accounts_{model._meta.model_name}_changelist')
+        self.assertEqual(self.count_queries(url, 2), self.count_queries(url, 20))
+        self.assertEqual(self.count_queries(url + search, 2),
+                         self.count_queries(url + search, 20))
+
+    def test_user_changelist(self):
+        self.assert_constant(User, '?q=user')
+
+    def test_otp_changelist(self):
+        self.assert_constant(OTP, '?q=user1')
+
+
+@override_settings(
+    INSTRUMENTATION={'SAMPLE_RATE': 1, 'SERVER_TIMING': True},
+    EMAIL_QUEUE={'BACKEND': 'sync'},
+    RATELIMIT_ENABLE=False,
+)
+class InstrumentationTests(TestCase):
+    """Requests are timed per component and exported as Prometheus metrics."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='jane@example.com', username='jane', password='Secret-pass-1')
+
+    def test_server_timing_and_metrics(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('password-reset'), {'email': 'jane@example.com'})
+        self.assertEqual(response.status_code, 200)
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="[1-9]\d* queries"')
+
+        # The first lookup loads the user into the cache, the second hits it
+        token = str(AccessToken.for_user(self.user))
+        timings = [
+            self.client.get(reverse('user-details'),
+                            HTTP_AUTHORIZATION=f'Bearer {token}')['Server-Timing']
+            for _ in range(2)
+        ]
+        self.assertIn('cache;desc="0 hits, 1 misses"', timings[0])
+        self.assertIn('cache;desc="1 hits, 0 misses"', timings[1])
+
+        metrics = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('http_request_duration_seconds_count'
+                      '{view="password-reset",method="POST",status="2xx"} 1', metrics)
+        self.assertIn('http_request_cache_total{view="user-details",result="hit"} 1', metrics)
+        # The email was sent after the request committed
+        self.assertIn('http_request_component_seconds_count'
+                      '{view="background",component="email"} 1', metrics)
+        self.assertIn('db_queries_total{alias="default"}', metrics)
+
+    def test_unsampled(self):
+        with self.settings(INSTRUMENTATION={'SAMPLE_RATE': 0, 'SERVER_TIMING': True}):
+            response = self.client.get(reverse('metrics'))
+            self.assertNotIn('Server-Timing', response)
+            metrics = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('view="metrics",method="GET",status="2xx"} 1', metrics)
+        self.assertNotIn('http_request_db_queries_count', metrics)
+
+    def test_pool_metrics(self):
+        stats = {'default': {'connections_opened': 2, 'queries': 10, 'pool': {
+            'pool_size': 4, 'pool_available': 3, 'pool_max': 10, 'requests_waiting': 0,
+            'requests_num': 25, 'requests_wait_ms': 1500}}}
+        with mock.patch('common.db.connection_stats', return_value=stats):
+            metrics = self.client.get(reverse('metrics')).content.decode()
+
+        self.assertIn('# TYPE db_pool_size gauge\ndb_pool_size{alias="default"} 4', metrics)
+        self.assertIn('db_pool_checkouts_total{alias="default"} 25', metrics)
+        self.assertIn('db_pool_checkout_wait_seconds_total{alias="default"} 1.5', metrics)
+        self.assertIn('db_pool_checkout_errors_total{alias="default"} 0', metrics)
+
+    def test_metrics_token(self):
+        with self.settings(INSTRUMENTATION={'METRICS_TOKEN': 'secret'}):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, 200)
@@ -0,0 +1,95 @@
+"""
+JWT token classes.
+
+With ``settings.JWT_USER_SNAPSHOT`` enabled, tokens also carry a compact
+snapshot of the user: the claims permission checks and ``/me/`` need, plus the
+user's cache version (``ver``). While ``ver`` still matches the version in
+``accounts.user_cache``, safe requests are served from a ``SnapshotUser``
+without touching the database. Any save of the user bumps the version, so a
+deactivated user or a changed profile falls back to the normal lookup.
+
+That only holds if every process sees the bump, so snapshots are only
+trusted with a shared user cache (``USER_CACHE['SHARED']``, i.e. Redis);
+otherwise tokens are authenticated by loading the user as usual.
+
+Refresh tokens check and record revocation through ``accounts.revocation``
+instead of joining the blacklist tables on every refresh.
+"""
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken as BaseRefreshToken
+
+from . import revocation
+from .user_cache import get_user_cache, get_user_cache_settings
+
+VERSION_CLAIM = 'ver'
+
+
+def snapshot_enabled():
+    # Per-process caches would keep trusting snapshots another process
+    # invalidated, for as long as the access token lives
+    return (getattr(settings, 'JWT_USER_SNAPSHOT', False)
+            and get_user_cache_settings()['SHARED'])
+
+
+def snapshot_claims(user):
+    """Return the claims embedded in tokens for ``user``."""
+    from .serializers import UserSerializer
+
+    claims = dict(UserSerializer(user).data)
+    claims.pop('id', None)
+    claims.update({
+        'is_staff': user.is_staff,
+        'is_superuser': user.is_superuser,
+        VERSION_CLAIM: get_user_cache().get_version(user.pk),
+    })
+    return claims
+
+
+def is_snapshot_current(token):
+    """Whether the token's snapshot still matches the user's cache version."""
+    version = token.get(VERSION_CLAIM)
+    if version is None:
+        return False
+    return version == get_user_cache().get_version(token[api_settings.USER_ID_CLAIM])
+
+
+class SnapshotUser(TokenUser):
+    """
+    Stateless user backed by snapshot claims; other claims such as ``email``
+    and ``date_joined`` resolve through ``TokenUser.__getattr__``.
+    """
+
+    def __eq__(self, other):
+        # Compare equal to the real User it was issued for
+        return str(getattr(other, 'pk', None)) == str(self.pk)
+
+    def __hash__(self):
+        return hash(str(self.pk))
+
+
+class RefreshToken(BaseRefreshToken):
+    """
+    Refresh token that embeds the user snapshot when it is enabled and keeps
+    revoked JTIs in the cache.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        if snapshot_enabled():
+            token.payload.update(snapshot_claims(user))
+        return token
+
+    def check_blacklist(self):
+        if revocation.is_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        return revocation.revoke(self)
+
+    def outstand(self):
+        return revocation.outstand(self)
@@ -1,16 +1,32 @@
+from django.conf import settings
 from django.urls import path, include
+from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
 from .views import (
     RequestPasswordResetView,
     VerifyOTPView,
     ResetPasswordView,
     UserDetailsView,
+    DatabaseConnectionStatsView,
+    UserViewSet,
     hello_world,
 )
 
+if settings.ASYNC_AUTH_VIEWS:
+    from .async_views import (
+        AsyncRequestPasswordResetView as RequestPasswordResetView,
+        AsyncVerifyOTPView as VerifyOTPView,
+        AsyncResetPasswordView as ResetPasswordView,
+        AsyncUserDetailsView as UserDetailsView,
+    )
+
+# djoser's user endpoints, with a keyset-paginated list
+router = DefaultRouter()
+router.register('users', UserViewSet)
+
 urlpatterns = [
     # Djoser endpoints
-    path('', include('djoser.urls')),
+    path('', include(router.urls)),
     path('', include('djoser.urls.jwt')),
     # test
     path('hello/', hello_world),
@@ -26,6 +42,9 @@ urlpatterns = [
     # User details
     path('me/', UserDetailsView.as_view(), name='user-details'),
 
+    # Database connection / pool stats (admins only)
+    path('db/pool/', DatabaseConnectionStatsView.as_view(), name='db-pool-stats'),
+
     # JWT token refresh
     path('jwt/refresh/', TokenRefreshView.as_view(), name='token-refresh'),
 ]
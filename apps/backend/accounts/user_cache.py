@@ -0,0 +1,172 @@
+"""
+Cached user loading for authentication.
+
+Users are looked up in a process-local LRU first, then in the shared Django
+cache, and only then in the database. Shared entries are keyed by a per-user
+version that is bumped whenever the user changes, so a stale copy is never
+served once the bump is visible. Local entries live for ``LOCAL_TTL`` seconds,
+which bounds how long another process can serve an outdated user.
+
+The shared tier is only used with ``SHARED`` on, i.e. when the cache really is
+shared between processes (Redis): a per-process cache would only see the
+version bumps of the writes its own process made, and other processes would
+keep serving the old user for ``TIMEOUT`` seconds. Without it a deactivated
+user or a changed password is seen everywhere within ``LOCAL_TTL``.
+"""
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from common.cache import LocalLRUCache
+from common.instrumentation import record_cache
+from .models import User
+
+DEFAULTS = {
+    'CACHE_ALIAS': 'default',
+    # Only when every process shares the cache
+    'SHARED': False,
+    'TIMEOUT': 300,
+    'LOCAL_SIZE': 1024,
+    'LOCAL_TTL': 5,
+}
+
+
+def get_user_cache_settings():
+    """Return the USER_CACHE settings merged over the defaults."""
+    return {**DEFAULTS, **getattr(settings, 'USER_CACHE', {})}
+
+
+class UserCache:
+    """Two-tier user cache with hit/miss counters."""
+
+    def __init__(self, options):
+        self.cache = caches[options['CACHE_ALIAS']]
+        self.shared = options['SHARED']
+        self.timeout = options['TIMEOUT']
+        self.local = LocalLRUCache(options['LOCAL_SIZE'], options['LOCAL_TTL'])
+        self._lock = threading.Lock()
+        self.stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+        record_cache(hit=name != 'misses')
+
+    def _version_key(self, user_id):
+        return f'user:{user_id}:version'
+
+    def _user_key(self, user_id, version):
+        return f'user:{user_id}:v{version}'
+
+    def _new_version(self):
+        # Time based, so a version key lost to eviction never comes back
+        # with a number an older entry was stored under.
+        return time.time_ns()
+
+    def get_version(self, user_id):
+        key = self._version_key(user_id)
+        version = self.cache.get(key)
+        if version is None:
+            self.cache.add(key, self._new_version(), timeout=None)
+            version = self.cache.get(key)
+        return version
+
+    def get(self, user_id):
+        """Return the user with this id, or None if it does not exist."""
+        user_id = str(user_id)
+
+        user = self.local.get(user_id)
+        if user is not None:
+            self._count('local_hits')
+            return copy.copy(user)
+
+        user = user_key = None
+        if self.shared:
+            user_key = self._user_key(user_id, self.get_version(user_id))
+            user = self.cache.get(user_key)
+        if user is not None:
+            self._count('shared_hits')
+        else:
+            self._count('misses')
+            try:
+                user = User.objects.get(pk=user_id)
+            except (User.DoesNotExist, ValidationError):
+                return None
+            if user_key is not None:
+                self.cache.set(user_key, user, timeout=self.timeout)
+
+        self.local.set(user_id, user)
+        return copy.copy(user)
+
+    async def aget_version(self, user_id):
+        key = self._version_key(user_id)
+        version = await self.cache.aget(key)
+        if version is None:
+            await self.cache.aadd(key, self._new_version(), timeout=None)
+            version = await self.cache.aget(key)
+        return version
+
+    async def aget(self, user_id):
+        """Async version of ``get`` using the async cache API and ORM."""
+        user_id = str(user_id)
+
+        user = self.local.get(user_id)
+        if user is not None:
+            self._count('local_hits')
+            return copy.copy(user)
+
+        user = user_key = None
+        if self.shared:
+            user_key = self._user_key(user_id, await self.aget_version(user_id))
+            user = await self.cache.aget(user_key)
+        if user is not None:
+            self._count('shared_hits')
+        else:
+            self._count('misses')
+            try:
+                user = await User.objects.aget(pk=user_id)
+            except (User.DoesNotExist, ValidationError):
+                return None
+            if user_key is not None:
+                await self.cache.aset(user_key, user, timeout=self.timeout)
+
+        self.local.set(user_id, user)
+        return copy.copy(user)
+
+    def invalidate(self, user_id):
+        """Drop cached copies of a user after it changes."""
+        user_id = str(user_id)
+        self.local.delete(user_id)
+        try:
+            self.cache.incr(self._version_key(user_id))
+        except ValueError:
+            self.cache.set(self._version_key(user_id), self._new_version(), timeout=None)
+
+    def reset_stats(self):
+        with self._lock:
+            for name in self.stats:
+                self.stats[name] = 0
+
+
+_user_cache = None
+
+
+def get_user_cache():
+    """Return the process-wide user cache."""
+    global _user_cache
+    if _user_cache is None:
+        _user_cache = UserCache(get_user_cache_settings())
+    return _user_cache
+
+
+@receiver(setting_changed)
+def _reset_user_cache(setting, **kwargs):
+    global _user_cache
+    if setting in ('USER_CACHE', 'CACHES'):
+        _user_cache = None
@@ -1,23 +1,26 @@
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-import random
-import string
-from django.conf import settings
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
 from rest_framework import status, generics
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.views import APIView
-from django_ratelimit.decorators import ratelimit
+from common.db import connection_stats
+from common.exceptions import Conflict
+from common.mixins import ResponseWithMetadataMixin
+from common.pagination import KeysetPagination
+from common.ratelimit import ratelimit
+from common.serializers import CompiledReadMixin
 from django.utils.decorators import method_decorator
-from .models import User, OTP
+from djoser.views import UserViewSet as DjoserUserViewSet
+from .models import User
+from .otp_issuance import IDEMPOTENCY_HEADER, issue_otp
+from .reset_tokens import RESET_TOKEN_USED, make_reset_token, reset_password
 from .serializers import (
     RequestPasswordResetSerializer,
     VerifyOTPSerializer,
     ResetPasswordSerializer,
 )
+from .tasks import queue_otp_email
 
 
 @api_view(['GET'])
@@ -25,11 +28,6 @@ def hello_world(request):
     return Response({"message": "Hello, World!"})
 
 
-def generate_otp():
-    """Generate a 6-digit OTP code."""
-    return ''.join(random.choices(string.digits, k=6))
-
-
 class RequestPasswordResetView(APIView):
     """
     Request a password reset and send OTP code to the user's email.
@@ -46,28 +44,13 @@ class RequestPasswordResetView(APIView):
             try:
                 user = User.objects.get(email=email)
 
-                # Generate the OTP code
-                otp_code = generate_otp()
-
-                # Save the OTP to the database
-                OTP.objects.create(user=user, code=otp_code)
-
-                # Send the OTP to the user's email
-                subject = 'Password Reset OTP'
-                html_message = render_to_string('password_reset.html', {
-                    'user': user,
-                    'otp_code': otp_code,
-                })
-                plain_message = strip_tags(html_message)
-
-                send_mail(
-                    subject,
-                    plain_message,
-                    settings.DEFAULT_FROM_EMAIL,
-                    [email],
-                    html_message=html_message,
-                    fail_silently=False,
-                )
+                # None for duplicates (same Idempotency-Key, or within the
+                # resend cooldown): the code already sent stays valid
+                otp_code = issue_otp(user, request.headers.get(IDEMPOTENCY_HEADER))
+
+                # Queue the OTP email; delivery happens in the background
+                if otp_code is not None:
+                    queue_otp_email(user.id, otp_code)
 
                 return Response(
                     {"detail": "OTP has been sent to your email address."},
@@ -94,14 +77,12 @@ class VerifyOTPView(APIView):
     @method_decorator(ratelimit(key='ip', rate='10/m', method='POST', block=True))
     def post(self, request, *args, **kwargs):
         serializer = self.serializer_class(data=request.data)
+        # Validation also marks the OTP as used; the token stands in for it
+        # when the new password is set
         if serializer.is_valid():
-            # Mark the OTP as used
-            otp = serializer.validated_data['otp']
-            otp.is_used = True
-            otp.save()
-
             return Response(
-                {"detail": "OTP verified successfully."},
+                {"detail": "OTP verified successfully.",
+                 "reset_token": make_reset_token(serializer.validated_data['user'])},
                 status=status.HTTP_200_OK
             )
 
@@ -110,7 +91,7 @@ class VerifyOTPView(APIView):
 
 class ResetPasswordView(APIView):
     """
-    Reset the user's password after verifying the OTP.
+    Reset the user's password with the token returned by OTP verification.
     """
     permission_classes = [AllowAny]
     serializer_class = ResetPasswordSerializer
@@ -119,16 +100,13 @@ class ResetPasswordView(APIView):
     def post(self, request, *args, **kwargs):
         serializer = self.serializer_class(data=request.data)
         if serializer.is_valid():
+            # Validation checked the reset token and loaded its user
             user = serializer.validated_data['user']
-            otp = serializer.validated_data['otp']
-
-            # Set the new password
-            user.set_password(serializer.validated_data['new_password'])
-            user.save()
 
-            # Mark the OTP as used
-            otp.is_used = True
-            otp.save()
+            # One conditional UPDATE of password and updated_at; it fails if a
+            # concurrent request with the same token got there first
+            if not reset_password(user, serializer.validated_data['new_password']):
+                raise Conflict(RESET_TOKEN_USED)
 
             return Response(
                 {"detail": "Password has been reset successfully."},
@@ -138,7 +116,7 @@ class ResetPasswordView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class UserDetailsView(generics.RetrieveUpdateAPIView):
+class UserDetailsView(CompiledReadMixin, generics.RetrieveUpdateAPIView):
     """
     Retrieve or update the authenticated user's details.
     """
@@ -150,3 +128,23 @@ class UserDetailsView(generics.RetrieveUpdateAPIView):
     def get_serializer_class(self):
         from .serializers import UserSerializer
         return UserSerializer
+
+
+class UserViewSet(CompiledReadMixin, ResponseWithMetadataMixin, DjoserUserViewSet):
+    """
+    djoser's ``users/`` endpoints, listing users a keyset page at a time with
+    an (estimated) total count. Reads skip the serializer (see
+    ``common.serializers``).
+    """
+    pagination_class = KeysetPagination
+
+
+class DatabaseConnectionStatsView(APIView):
+    """
+    Connections opened per database and, when pooling is enabled, the pool's
+    checkout count, wait time and size. Admins only.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(connection_stats())
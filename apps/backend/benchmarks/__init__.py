@@ -0,0 +1,41 @@
+"""
+Benchmarks for the auth API.
+
+Run them from ``apps/backend`` as modules, e.g.::
+
+    python -m benchmarks.smtp_pool
+"""
+import os
+
+
+def setup_django(**env):
+    """Apply environment overrides and configure Django for a benchmark run."""
+    import django
+
+    os.environ.update({key: str(value) for key, value in env.items()})
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+    django.setup()
+
+
+def setup_test_database():
+    """
+    Create a throwaway test database (in-memory for SQLite) and return a
+    callable that destroys it.
+
+    Set ``DB_ENGINE=django.db.backends.sqlite3`` to run without PostgreSQL.
+    """
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    return lambda: connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def create_user(email='bench@example.com', username='bench', password='12345678'):
+    """Create a user for benchmarks that need an authenticated request."""
+    from accounts.models import User
+
+    return User.objects.create_user(email=email, username=username, password=password)
+
@@ -0,0 +1,153 @@
+"""
+Password reset throughput under uvicorn, sync views vs the async views.
+
+Creates a SQLite database file with ``--users`` users, starts the SMTP
+stand-in from ``benchmarks.smtp_pool`` with a slow handshake, then runs
+``uvicorn core.asgi:application`` twice (``ASYNC_AUTH_VIEWS`` off and on) and
+fires ``--requests`` password reset requests at it, ``--concurrency`` at a
+time. Rate limits are disabled for the run.
+
+With the default ``sync`` queue every request delivers its OTP email inline,
+so the handshake delay is paid inside the request:
+
+    python -m benchmarks.async_reset_load --requests 400 --concurrency 50
+
+Requires uvicorn (``pip install uvicorn``).
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import setup_django
+from benchmarks.smtp_pool import free_port, start_builtin_server
+
+
+def create_database(path, users):
+    setup_django(DB_ENGINE='django.db.backends.sqlite3', DB_NAME=path)
+    from django.contrib.auth.hashers import make_password
+    from django.core.management import call_command
+
+    from accounts.models import User
+
+    call_command('migrate', run_syncdb=True, verbosity=0)
+    password = make_password('12345678')
+    User.objects.bulk_create(
+        User(email=f'user{i}@example.com', username=f'user{i}', password=password)
+        for i in range(users)
+    )
+
+
+def start_server(env, port, app='core.asgi:application', interface='auto'):
+    """Start uvicorn serving ``app`` and wait until it answers."""
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', app, '--interface', interface,
+         '--port', str(port), '--log-level', 'warning', '--no-access-log'],
+        env=env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            asyncio.run(post(port, '/api/auth/hello/', None))
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('uvicorn did not start')
+
+
+async def post(port, path, data):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    body = json.dumps(data).encode() if data is not None else b''
+    method = 'POST' if data is not None else 'GET'
+    writer.write(
+        f'{method} {path} HTTP/1.1\r\nHost: localhost\r\n'
+        f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n'
+        f'Connection: close\r\n\r\n'.encode() + body)
+    await writer.drain()
+    status_line = await reader.readline()
+    await reader.read()
+    writer.close()
+    return int(status_line.split()[1])
+
+
+async def run_load(port, requests, concurrency, users):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def one(i):
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            status = await post(port, '/api/auth/password/reset/',
+                                {'email': f'user{i % users}@example.com'})
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return time.perf_counter() - start, latencies, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--connect-delay', type=float, default=0.2,
+                        help='Simulated SMTP handshake latency in seconds')
+    parser.add_argument('--queue', default='sync',
+                        choices=['sync', 'thread', 'database'],
+                        help='EMAIL_QUEUE backend used by the server')
+    args = parser.parse_args()
+
+    smtp_port = free_port()
+    start_builtin_server(smtp_port, args.connect_delay)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.sqlite3')
+        create_database(db_path, args.users)
+
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': 'core.settings',
+            'DB_ENGINE': 'django.db.backends.sqlite3',
+            'DB_NAME': db_path,
+            'DEBUG': 'False',
+            'RATELIMIT_ENABLE': 'False',
+            'EMAIL_QUEUE_BACKEND': args.queue,
+            'EMAIL_HOST': '127.0.0.1',
+            'EMAIL_PORT': str(smtp_port),
+            'EMAIL_USE_TLS': 'False',
+            'EMAIL_HOST_USER': '',
+            'EMAIL_HOST_PASSWORD': '',
+        }
+
+        print(f'{args.requests} requests, concurrency={args.concurrency}, '
+              f'queue={args.queue}, SMTP delay={args.connect_delay * 1000:.0f}ms')
+        for name, async_views in [('sync', 'False'), ('async', 'True')]:
+            port = free_port()
+            process = start_server({**env, 'ASYNC_AUTH_VIEWS': async_views}, port)
+            try:
+                elapsed, latencies, failures = asyncio.run(run_load(
+                    port, args.requests, args.concurrency, args.users))
+            finally:
+                process.terminate()
+                process.wait()
+
+            latencies.sort()
+            p99 = latencies[int(len(latencies) * 0.99) - 1]
+            print(f'{name:>6}: {args.requests / elapsed:8.1f} req/s  '
+                  f'p50={statistics.median(latencies) * 1000:7.1f}ms  '
+                  f'p99={p99 * 1000:7.1f}ms  errors={failures}')
+
+
+if __name__ == '__main__':
+    main()
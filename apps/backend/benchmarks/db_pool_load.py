@@ -0,0 +1,95 @@
+"""
+Request latency with and without database connection reuse.
+
+Runs the same load once per connection mode, each in a fresh process:
+
+- ``none``: a new connection per request (``DB_CONN_MAX_AGE=0``)
+- ``persistent``: connections kept for 60s (``DB_CONN_MAX_AGE=60``)
+- ``pool``: psycopg's connection pool (``DB_POOL=True``, needs ``psycopg[pool]``)
+
+Each run creates a throwaway test database on the server configured by the
+``DB_*`` variables, then sends ``--requests`` password reset requests for an
+unknown email (one query each) from ``--concurrency`` threads and reports
+p50/p99 latency and how many connections were opened. Rate limits are off.
+
+    DB_HOST=localhost DB_USER=postgres python -m benchmarks.db_pool_load --requests 2000
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import setup_django, setup_test_database
+
+MODES = {
+    'none': {'DB_CONN_MAX_AGE': '0'},
+    'persistent': {'DB_CONN_MAX_AGE': '60'},
+    'pool': {'DB_POOL': 'True'},
+}
+
+
+def run_mode(args):
+    """Run the load in this process and print the results as JSON."""
+    setup_django(RATELIMIT_ENABLE='False', **MODES[args.mode])
+    teardown = setup_test_database()
+    try:
+        from django.db import connections
+        from django.test import Client
+
+        from common.db import connection_stats
+
+        def worker(count):
+            client = Client()
+            latencies = []
+            for _ in range(count):
+                start = time.perf_counter()
+                client.post('/api/auth/password/reset/', {'email': 'nobody@example.com'})
+                latencies.append(time.perf_counter() - start)
+            connections.close_all()
+            return latencies
+
+        per_thread = args.requests // args.concurrency
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            latencies = sum(executor.map(worker, [per_thread] * args.concurrency), [])
+
+        print(json.dumps({'latencies': latencies, 'stats': connection_stats()['default']}))
+    finally:
+        teardown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    parser.add_argument('--mode', choices=list(MODES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        return run_mode(args)
+
+    print(f'{args.requests} requests from {args.concurrency} threads')
+    for mode in args.modes:
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.db_pool_load', '--mode', mode,
+             '--requests', str(args.requests), '--concurrency', str(args.concurrency)],
+            env=os.environ, capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+
+        latencies = sorted(result['latencies'])
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        pool = result['stats'].get('pool', {})
+        print(f'{mode:>10}: p50={statistics.median(latencies) * 1000:7.2f}ms  '
+              f'p99={p99 * 1000:7.2f}ms  '
+              f"connections opened={result['stats']['connections_opened']}"
+              + (f"  checkouts={pool.get('requests_num', 0)}"
+                 f"  wait={pool.get('requests_wait_ms', 0)}ms" if pool else ''))
+
+
+if __name__ == '__main__':
+    main()
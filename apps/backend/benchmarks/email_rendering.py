@@ -0,0 +1,84 @@
+"""
+Render time per transactional email.
+
+Renders each message ``--messages`` times the old way (templates loaded and
+compiled on every call with the cached loader off, HTML reduced to text with
+``strip_tags``; the welcome email built by f-string) and through
+``accounts.emails.render_email`` (compiled templates, authored text version),
+and reports microseconds per message.
+
+    python -m benchmarks.email_rendering --messages 2000
+"""
+import argparse
+import time
+
+from benchmarks import setup_django
+
+WELCOME_HTML = """
+    <html>
+    <body>
+        <h2>Welcome to Our App, {user.username}!</h2>
+        <p>Thank you for registering. Your account has been created successfully.</p>
+        <p>You can now login using your email address: {user.email}</p>
+        <p>If you have any questions, please feel free to contact us.</p>
+        <p>Best regards,</p>
+        <p>The Team</p>
+    </body>
+    </html>
+    """
+
+
+def measure(render, messages):
+    render()
+    start = time.perf_counter()
+    for _ in range(messages):
+        render()
+    return (time.perf_counter() - start) / messages * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--messages', type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.template import Context, engines
+    from django.template.engine import Engine
+    from django.utils.html import strip_tags
+
+    from accounts.emails import render_email
+    from accounts.models import User
+
+    user = User(email='bench@example.com', username='bench')
+    otp_context = {'user': user, 'otp_code': '123456', 'expiry_minutes': 10}
+    welcome_context = {'user': user}
+
+    django_engine = engines['django'].engine
+    uncached = Engine(
+        dirs=django_engine.dirs,
+        app_dirs=True,
+        context_processors=django_engine.context_processors,
+    )
+
+    def old_otp():
+        html = uncached.get_template('email_templates/password_reset.html').render(
+            Context(otp_context))
+        return strip_tags(html), html
+
+    def old_welcome():
+        html = WELCOME_HTML.format(user=user)
+        return strip_tags(html), html
+
+    runs = [
+        ('password_reset', 'old', old_otp),
+        ('password_reset', 'new', lambda: render_email('password_reset', otp_context)),
+        ('welcome', 'old', old_welcome),
+        ('welcome', 'new', lambda: render_email('welcome', welcome_context)),
+    ]
+    print(f'{args.messages} messages each')
+    for name, variant, render in runs:
+        print(f'{name:>15} {variant}: {measure(render, args.messages):8.1f}us/message')
+
+
+if __name__ == '__main__':
+    main()
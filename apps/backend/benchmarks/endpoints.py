@@ -0,0 +1,444 @@
+"""
+Endpoint benchmark suite for the auth API, with baseline regression checks.
+
+Runs each scenario ``--iterations`` times and reports throughput, p50/p95/p99
+latency and database queries per request:
+
+- ``register``: ``POST users/`` with a new email
+- ``jwt_create``: ``POST jwt/create/`` (password check)
+- ``jwt_refresh``: ``POST jwt/refresh/`` with a fresh refresh token
+- ``me_get`` / ``me_patch``: ``GET`` / ``PATCH me/``
+- ``password_reset``: request an OTP, verify it, then set a new password
+
+``--target`` selects where requests go:
+
+- ``inprocess``: Django's test client in this process (sequential)
+- ``wsgi`` / ``asgi``: a local uvicorn serving ``core.wsgi`` / ``core.asgi``,
+  driven by ``--concurrency`` keep-alive connections. Queries are read from
+  the server's ``/metrics``.
+
+The database is a fresh SQLite file, or with ``DB_ENGINE`` left at PostgreSQL
+a throwaway ``test_*`` database on the server the ``DB_*`` variables point at.
+Mail goes to the locmem backend and rate limits are off.
+
+``--save`` writes the results as JSON; ``--baseline`` compares against a saved
+run and exits non-zero if any scenario got slower (p95 or throughput) by more
+than ``--tolerance``, ran more queries per request, or failed more often:
+
+    python -m benchmarks.endpoints --save baseline.json
+    python -m benchmarks.endpoints --baseline baseline.json --tolerance 0.2
+    python -m benchmarks.endpoints --target asgi --concurrency 8 --iterations 500
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import platform
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import setup_django
+from benchmarks.async_reset_load import start_server
+from benchmarks.smtp_pool import free_port
+
+PASSWORD = 'Bench-pass-1'
+NEW_PASSWORD = 'Bench-pass-2'
+
+SERVER_APPS = {
+    'wsgi': ('core.wsgi:application', 'wsgi'),
+    'asgi': ('core.asgi:application', 'asgi3'),
+}
+
+SERVER_ENV = {
+    'DEBUG': 'False',
+    'RATELIMIT_ENABLE': 'False',
+    'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend',
+    'EMAIL_QUEUE_BACKEND': 'sync',
+    'INSTRUMENTATION_SAMPLE_RATE': '0',
+}
+
+
+class Request:
+    """
+    One HTTP request in a scenario; ``name`` groups its latencies. Scenarios
+    receive each response's decoded JSON body (or None) back from ``yield``.
+    """
+
+    def __init__(self, name, method, path, data=None, token=None, expect=(200,)):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.data = data
+        self.token = token
+        self.expect = expect
+
+
+class Fixtures:
+    """Users and tokens created before the timed run."""
+
+    def __init__(self, users, iterations):
+        from django.contrib.auth.hashers import make_password
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        from accounts.models import User
+        from accounts.tokens import RefreshToken
+
+        password = make_password(PASSWORD)
+        self.users = User.objects.bulk_create(
+            User(email=f'user{i}@example.com', username=f'user{i}', password=password)
+            for i in range(users))
+        self.access = [str(AccessToken.for_user(user)) for user in self.users]
+        # Refresh tokens rotate, so each iteration needs its own
+        self.refresh = [str(RefreshToken.for_user(self.users[i % users]))
+                        for i in range(iterations)]
+
+    def user(self, i):
+        return self.users[i % len(self.users)], self.access[i % len(self.users)]
+
+    def otp_code(self, email):
+        from accounts.models import OTP
+
+        return (OTP.objects.filter(user__email=email, is_used=False)
+                .order_by('-created_at').values_list('code', flat=True).first())
+
+
+def register(i, fx):
+    yield Request('register', 'POST', '/api/auth/users/', {
+        'email': f'new{i}@example.com', 'username': f'new{i}',
+        'password': PASSWORD, 'confirm_password': PASSWORD,
+    }, expect=(201,))
+
+
+def jwt_create(i, fx):
+    user, _ = fx.user(i)
+    yield Request('jwt_create', 'POST', '/api/auth/jwt/create/',
+                  {'email': user.email, 'password': PASSWORD})
+
+
+def jwt_refresh(i, fx):
+    yield Request('jwt_refresh', 'POST', '/api/auth/jwt/refresh/', {'refresh': fx.refresh[i]})
+
+
+def me_get(i, fx):
+    _, token = fx.user(i)
+    yield Request('me_get', 'GET', '/api/auth/me/', token=token)
+
+
+def me_patch(i, fx):
+    _, token = fx.user(i)
+    yield Request('me_patch', 'PATCH', '/api/auth/me/', {'username': f'renamed{i}'}, token=token)
+
+
+def password_reset(i, fx):
+    # One user per iteration, so codes from earlier iterations don't collide
+    user, _ = fx.user(i)
+    yield Request('reset_request', 'POST', '/api/auth/password/reset/', {'email': user.email})
+    code = fx.otp_code(user.email)
+    verified = yield Request('reset_verify', 'POST', '/api/auth/password/reset/verify-otp/',
+                             {'email': user.email, 'otp_code': code})
+    yield Request('reset_confirm', 'POST', '/api/auth/password/reset/confirm/', {
+        'reset_token': (verified or {}).get('reset_token', ''),
+        'new_password': NEW_PASSWORD, 'confirm_password': NEW_PASSWORD,
+    })
+
+
+SCENARIOS = {
+    'register': register,
+    'jwt_create': jwt_create,
+    'jwt_refresh': jwt_refresh,
+    'me_get': me_get,
+    'me_patch': me_patch,
+    'password_reset': password_reset,
+}
+
+
+class InProcessClient:
+    """Send requests through Django's test client, counting queries per request."""
+
+    def __init__(self):
+        from django.test import Client
+
+        self.client = Client()
+
+    def send(self, request):
+        from django.db import connections
+
+        queries = []
+
+        def count(execute, *args):
+            queries.append(1)
+            return execute(*args)
+
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {request.token}'} if request.token else {}
+        wrappers = [connections[alias].execute_wrapper(count) for alias in connections]
+        for wrapper in wrappers:
+            wrapper.__enter__()
+        try:
+            start = time.perf_counter()
+            response = getattr(self.client, request.method.lower())(
+                request.path, request.data, content_type='application/json', **headers)
+            elapsed = time.perf_counter() - start
+        finally:
+            for wrapper in reversed(wrappers):
+                wrapper.__exit__(None, None, None)
+        return response.status_code, elapsed, len(queries), decode(response.content)
+
+    def queries(self):
+        return None
+
+
+class HTTPClient:
+    """Send requests to a local server over one keep-alive connection per thread."""
+
+    def __init__(self, port):
+        self.port = port
+        self.local = threading.local()
+
+    def _connection(self):
+        if getattr(self.local, 'connection', None) is None:
+            self.local.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        return self.local.connection
+
+    def _request(self, method, path, body=b'', headers=None, retry=True):
+        connection = self._connection()
+        try:
+            connection.request(method, path, body=body, headers={
+                'Content-Type': 'application/json', **(headers or {})})
+            response = connection.getresponse()
+            return response.status, response.read()
+        except (http.client.HTTPException, OSError) as e:
+            connection.close()
+            self.local.connection = None
+            # The server drops idle keep-alive connections without a response
+            if retry and isinstance(e, (http.client.RemoteDisconnected, ConnectionResetError,
+                                        BrokenPipeError)):
+                return self._request(method, path, body, headers, retry=False)
+            raise
+
+    def send(self, request):
+        headers = {'Authorization': f'Bearer {request.token}'} if request.token else {}
+        body = json.dumps(request.data).encode() if request.data is not None else b''
+        start = time.perf_counter()
+        status, content = self._request(request.method, request.path, body, headers)
+        return status, time.perf_counter() - start, None, decode(content)
+
+    def queries(self):
+        """Total queries the server has run, from its Prometheus metrics."""
+        _, body = self._request('GET', '/metrics')
+        return sum(int(value) for value in re.findall(
+            r'^db_queries_total\{[^}]*\} (\d+)$', body.decode(), re.MULTILINE))
+
+
+def decode(content):
+    try:
+        return json.loads(content)
+    except ValueError:
+        return None
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def run_scenario(client, scenario, fixtures, iterations, concurrency):
+    latencies = defaultdict(list)
+    queries = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+
+    def iteration(i):
+        steps = scenario(i, fixtures)
+        body = None
+        while True:
+            try:
+                request = steps.send(body)
+            except StopIteration:
+                return
+            try:
+                status, elapsed, count, body = client.send(request)
+            except (http.client.HTTPException, OSError):
+                status, elapsed, count, body = None, None, None, None
+            with lock:
+                if elapsed is not None:
+                    latencies[request.name].append(elapsed)
+                if count is not None:
+                    queries[request.name].append(count)
+                if status not in request.expect:
+                    errors[request.name] += 1
+
+    before = client.queries()
+    start = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(iteration, range(iterations)))
+    else:
+        for i in range(iterations):
+            iteration(i)
+    elapsed = time.perf_counter() - start
+    after = client.queries()
+
+    requests = sum(len(values) for values in latencies.values())
+    if before is not None:
+        total_queries = after - before
+    else:
+        total_queries = sum(sum(values) for values in queries.values())
+
+    endpoints = {}
+    for name, values in latencies.items():
+        endpoints[name] = {
+            'requests': len(values),
+            'errors': errors[name],
+            'p50_ms': round(statistics.median(values) * 1000, 3),
+            'p95_ms': round(percentile(values, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(values, 0.99) * 1000, 3),
+            'queries_per_request': (round(statistics.mean(queries[name]), 2)
+                                    if queries[name] else None),
+        }
+    return {
+        'iterations': iterations,
+        'seconds': round(elapsed, 3),
+        'throughput': round(requests / elapsed, 1),
+        'errors': sum(errors.values()),
+        'queries_per_request': round(total_queries / requests, 2) if requests else 0,
+        'endpoints': endpoints,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of regressions of ``results`` against ``baseline``."""
+    regressions = []
+    for name, current in results['scenarios'].items():
+        previous = baseline['scenarios'].get(name)
+        if previous is None:
+            continue
+        if current['throughput'] < previous['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {current['throughput']}/s "
+                               f"< baseline {previous['throughput']}/s")
+        if current['queries_per_request'] > previous['queries_per_request'] + 0.01:
+            regressions.append(f"{name}: {current['queries_per_request']} queries/request "
+                               f"> baseline {previous['queries_per_request']}")
+        if current['errors'] > previous['errors']:
+            regressions.append(f"{name}: {current['errors']} errors "
+                               f"> baseline {previous['errors']}")
+        for endpoint, stats in current['endpoints'].items():
+            old = previous['endpoints'].get(endpoint)
+            if old and stats['p95_ms'] > old['p95_ms'] * (1 + tolerance):
+                regressions.append(f"{name}/{endpoint}: p95 {stats['p95_ms']}ms "
+                                   f"> baseline {old['p95_ms']}ms")
+    return regressions
+
+
+def prepare_database(tmp):
+    """Create the benchmark database and return the settings the server needs."""
+    env = dict(SERVER_ENV)
+    if 'sqlite' in os.environ.get('DB_ENGINE', ''):
+        env['DB_NAME'] = os.path.join(tmp, 'bench.sqlite3')
+        setup_django(**env)
+        from django.core.management import call_command
+
+        call_command('migrate', run_syncdb=True, verbosity=0)
+        return env, lambda: None
+
+    setup_django(**env)
+    from django.db import connection
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    env['DB_NAME'] = connection.settings_dict['NAME']
+    return env, lambda: connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def print_results(results):
+    meta = results['meta']
+    print(f"target={meta['target']} db={meta['database']} iterations={meta['iterations']} "
+          f"concurrency={meta['concurrency']}")
+    for name, scenario in results['scenarios'].items():
+        print(f"{name:>15}: {scenario['throughput']:8.1f} req/s  "
+              f"{scenario['queries_per_request']:5.2f} queries/req  errors={scenario['errors']}")
+        for endpoint, stats in scenario['endpoints'].items():
+            print(f"{'':>17}{endpoint:<14} p50={stats['p50_ms']:8.2f}ms  "
+                  f"p95={stats['p95_ms']:8.2f}ms  p99={stats['p99_ms']:8.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--target', choices=['inprocess', *SERVER_APPS], default='inprocess')
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS),
+                        default=list(SCENARIOS))
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='Parallel connections (server targets only)')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--save', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against results saved with --save')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed relative slowdown before a run fails')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env, teardown = prepare_database(tmp)
+        server = None
+        try:
+            from django.conf import settings
+            from django.db import connection
+            from django.test.utils import setup_test_environment
+
+            setup_test_environment()
+            fixtures = Fixtures(args.users, args.iterations)
+
+            if args.target == 'inprocess':
+                client, concurrency = InProcessClient(), 1
+            else:
+                # Let the server see the fixtures; it opens its own connection
+                connection.close()
+                port = free_port()
+                app, interface = SERVER_APPS[args.target]
+                server = start_server({**os.environ, 'DJANGO_SETTINGS_MODULE': 'core.settings',
+                                       **env}, port, app=app, interface=interface)
+                client, concurrency = HTTPClient(port), args.concurrency
+
+            results = {
+                'meta': {
+                    'target': args.target,
+                    'database': settings.DATABASES['default']['ENGINE'].rsplit('.', 1)[-1],
+                    'iterations': args.iterations,
+                    'concurrency': concurrency,
+                    'python': platform.python_version(),
+                },
+                'scenarios': {
+                    name: run_scenario(client, SCENARIOS[name], fixtures,
+                                       args.iterations, concurrency)
+                    for name in args.scenarios
+                },
+            }
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+            teardown()
+
+    print_results(results)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+        print('No regressions against the baseline')
+
+
+if __name__ == '__main__':
+    main()
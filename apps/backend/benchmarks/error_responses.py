@@ -0,0 +1,120 @@
+"""
+Error responses per second through the exception handler.
+
+Raises each error from a DRF view and renders the response (content
+negotiation, the exception handler and JSON rendering), once with the
+handler as it was before the validation fast path and cached envelopes
+(``legacy_exception_handler``, kept here for comparison) and once with
+``common.exceptions.custom_exception_handler``.
+
+    python -m benchmarks.error_responses --requests 20000
+"""
+import argparse
+import time
+
+from benchmarks import setup_django
+
+
+def legacy_exception_handler(exc, context):
+    from django.core.exceptions import ValidationError as DjangoValidationError
+    from django.http import Http404
+    from rest_framework.exceptions import ValidationError as DRFValidationError
+    from rest_framework.views import exception_handler
+
+    response = exception_handler(exc, context)
+
+    if isinstance(exc, DjangoValidationError):
+        exc = DRFValidationError(detail=exc.message_dict)
+        response = exception_handler(exc, context)
+
+    if response is None:
+        return None
+
+    if isinstance(exc, Http404):
+        response.data = {
+            'success': False,
+            'message': 'Not found.',
+            'detail': str(exc),
+            'code': 'not_found'
+        }
+    elif isinstance(exc, DRFValidationError):
+        response.data = {
+            'success': False,
+            'message': 'Validation error.',
+            'errors': response.data,
+            'code': 'validation_error'
+        }
+    else:
+        response.data = {
+            'success': False,
+            'message': getattr(exc, 'default_detail', str(exc)),
+            'detail': response.data.get('detail', str(exc)),
+            'code': getattr(exc, 'default_code', 'error')
+        }
+
+    return response
+
+
+def errors():
+    from django.core.exceptions import ValidationError as DjangoValidationError
+    from django.http import Http404
+    from rest_framework import exceptions
+
+    return {
+        'validation': lambda: exceptions.ValidationError(
+            {'email': ['No user with this email address exists.']}),
+        'django_validation': lambda: DjangoValidationError(
+            {'username': ['Username can only contain alphanumeric characters.']}),
+        'not_found': lambda: Http404('No User matches the given query.'),
+        'throttled': lambda: exceptions.Throttled(wait=30),
+        'not_authenticated': lambda: exceptions.NotAuthenticated(),
+    }
+
+
+def make_view(handler, make_error):
+    from rest_framework.permissions import AllowAny
+    from rest_framework.views import APIView
+
+    class ErrorView(APIView):
+        authentication_classes = []
+        permission_classes = [AllowAny]
+        throttle_classes = []
+
+        def get_exception_handler(self):
+            return handler
+
+        def get(self, request):
+            raise make_error()
+
+    return ErrorView.as_view()
+
+
+def measure(view, request, requests):
+    view(request).render()
+    start = time.perf_counter()
+    for _ in range(requests):
+        view(request).render()
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=20000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test import RequestFactory
+
+    from common.exceptions import custom_exception_handler
+
+    request = RequestFactory().get('/', HTTP_ACCEPT='application/json')
+    print(f'{args.requests} responses per error')
+    for name, make_error in errors().items():
+        before = measure(make_view(legacy_exception_handler, make_error), request, args.requests)
+        after = measure(make_view(custom_exception_handler, make_error), request, args.requests)
+        print(f'{name:>18}: {before:9.0f}/s before  {after:9.0f}/s after  '
+              f'({after / before:.2f}x)')
+
+
+if __name__ == '__main__':
+    main()
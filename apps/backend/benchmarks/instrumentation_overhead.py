@@ -0,0 +1,52 @@
+"""
+Per-request overhead of the instrumentation middleware.
+
+Sends ``--requests`` authenticated ``GET /api/auth/me/`` requests (one cache
+lookup, no queries once warm) through the full middleware stack with
+instrumentation off, on with nothing sampled, and on with every request
+sampled, and reports the mean latency of each.
+
+    DB_ENGINE=django.db.backends.sqlite3 python -m benchmarks.instrumentation_overhead
+"""
+import argparse
+import time
+
+from benchmarks import create_user, setup_django, setup_test_database
+
+RUNS = [
+    ('off', {'ENABLED': False}),
+    ('unsampled', {'SAMPLE_RATE': 0}),
+    ('sampled', {'SAMPLE_RATE': 1, 'SERVER_TIMING': True}),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    setup_django(RATELIMIT_ENABLE='False')
+    teardown = setup_test_database()
+    try:
+        from django.test import Client
+        from django.test.utils import override_settings
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        token = str(AccessToken.for_user(create_user()))
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+        client.get('/api/auth/me/')
+
+        print(f'{args.requests} requests to /api/auth/me/')
+        for name, options in RUNS:
+            with override_settings(INSTRUMENTATION=options):
+                start = time.perf_counter()
+                for _ in range(args.requests):
+                    client.get('/api/auth/me/')
+                elapsed = time.perf_counter() - start
+            print(f'{name:>10}: {elapsed / args.requests * 1e6:8.1f}us/request')
+    finally:
+        teardown()
+
+
+if __name__ == '__main__':
+    main()
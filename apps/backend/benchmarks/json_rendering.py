@@ -0,0 +1,69 @@
+"""
+Rendering and parsing 10k ``UserSerializer`` rows with each JSON backend.
+
+Serializes ``--rows`` users (built in memory, no database) once, then times
+DRF's stdlib ``JSONRenderer``/``JSONParser`` against ``common.fastjson`` on
+the serializer output, and on the raw rows (UUIDs and datetimes left for the
+encoder, as with ``.values()`` querysets).
+
+    python -m benchmarks.json_rendering --rows 10000
+"""
+import argparse
+import io
+import time
+
+from benchmarks import setup_django
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from datetime import timedelta
+
+    from django.utils import timezone
+    from rest_framework.parsers import JSONParser
+    from rest_framework.renderers import JSONRenderer
+
+    from accounts.models import User
+    from accounts.serializers import UserSerializer
+    from common import fastjson
+    from common.fastjson import FastJSONParser, FastJSONRenderer
+
+    if fastjson.orjson is None:
+        print('orjson is not installed: FastJSONRenderer falls back to the stdlib')
+
+    now = timezone.now()
+    users = [User(email=f'user{i}@example.com', username=f'user{i}',
+                  date_joined=now - timedelta(seconds=i)) for i in range(args.rows)]
+    serialized = UserSerializer(users, many=True).data
+    raw = [{'id': user.id, 'email': user.email, 'username': user.username,
+            'date_joined': user.date_joined} for user in users]
+
+    print(f'{args.rows} rows, best of {args.repeat}')
+    print(f'{"serializer":>24}: {best_of(args.repeat, lambda: UserSerializer(users, many=True).data):8.1f}ms')
+    for name, data in (('serializer output', serialized), ('raw rows', raw)):
+        for label, renderer in (('stdlib', JSONRenderer()), ('orjson', FastJSONRenderer())):
+            elapsed = best_of(args.repeat, lambda: renderer.render(data))
+            print(f'{"render " + name:>24} {label}: {elapsed:8.1f}ms')
+
+    content = FastJSONRenderer().render(serialized)
+    for label, parser_class in (('stdlib', JSONParser), ('orjson', FastJSONParser)):
+        elapsed = best_of(args.repeat, lambda: parser_class().parse(io.BytesIO(content)))
+        print(f'{"parse":>24} {label}: {elapsed:8.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
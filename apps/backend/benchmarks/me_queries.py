@@ -0,0 +1,76 @@
+"""
+Queries and throughput for ``GET /api/auth/me/`` in each authentication mode.
+
+- ``uncached``: simplejwt's JWTAuthentication, one user query per request
+- ``cached``: CachedJWTAuthentication with the two-tier user cache
+- ``snapshot``: CachedJWTAuthentication with JWT_USER_SNAPSHOT tokens
+
+    DB_ENGINE=django.db.backends.sqlite3 python -m benchmarks.me_queries
+"""
+import argparse
+import time
+
+from benchmarks import create_user, setup_django, setup_test_database
+
+MODES = {
+    'uncached': ('rest_framework_simplejwt.authentication.JWTAuthentication', False),
+    'cached': ('accounts.authentication.CachedJWTAuthentication', False),
+    'snapshot': ('accounts.authentication.CachedJWTAuthentication', True),
+}
+
+
+def run(client, requests):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        for _ in range(requests):
+            response = client.get('/api/auth/me/')
+            assert response.status_code == 200, response.content
+        elapsed = time.perf_counter() - start
+    return len(queries), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=1000)
+    args = parser.parse_args()
+
+    setup_django()
+    teardown = setup_test_database()
+
+    from unittest import mock
+    from django.conf import settings
+    from django.test import override_settings
+    from django.utils.module_loading import import_string
+    from rest_framework.test import APIClient
+    from accounts.tokens import RefreshToken
+    from accounts.user_cache import get_user_cache
+    from accounts.views import UserDetailsView
+
+    user = create_user()
+
+    print(f'{args.requests} requests to /api/auth/me/')
+    # One process, so its in-memory cache is as shared as Redis would be
+    user_cache = {**settings.USER_CACHE, 'SHARED': True}
+    for name, (auth_class, snapshot) in MODES.items():
+        # View classes capture their API settings at import time
+        with override_settings(JWT_USER_SNAPSHOT=snapshot, USER_CACHE=user_cache), \
+                mock.patch.object(UserDetailsView, 'authentication_classes',
+                                  [import_string(auth_class)]), \
+                mock.patch.object(UserDetailsView, 'throttle_classes', []):
+            client = APIClient()
+            client.credentials(
+                HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+            get_user_cache().reset_stats()
+            queries, elapsed = run(client, args.requests)
+            stats = get_user_cache().stats
+        print(f'{name:>9}: {queries / args.requests:.3f} queries/request, '
+              f'{args.requests / elapsed:8.1f} req/s  cache={stats}')
+
+    teardown()
+
+
+if __name__ == '__main__':
+    main()
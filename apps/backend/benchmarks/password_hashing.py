@@ -0,0 +1,92 @@
+"""
+Login password checks per second for each hasher, executor and pool size.
+
+Each run verifies ``--logins`` passwords through ``HashingService`` from
+``--clients`` concurrent request threads, which is the CPU-bound part of a
+login. Throughput is also shown per core actually used (the smaller of the
+pool size and the machine's core count).
+
+    python -m benchmarks.password_hashing --workers 1 2 4 --executor thread process
+
+Argon2 is only measured when argon2-cffi is installed.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import setup_django
+
+HASHERS = {
+    'pbkdf2': 'common.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'common.hashers.ScryptPasswordHasher',
+    'argon2': 'common.hashers.Argon2PasswordHasher',
+}
+
+
+def available_hashers():
+    names = ['pbkdf2', 'scrypt']
+    try:
+        import argon2  # noqa: F401
+        names.append('argon2')
+    except ImportError:
+        pass
+    return names
+
+
+def run(service, encoded, logins, clients):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as requests:
+        results = list(requests.map(
+            lambda _: service.check_password('12345678', encoded), range(logins)))
+    elapsed = time.perf_counter() - start
+    assert all(results)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--executor', nargs='+', default=['thread', 'process'],
+                        choices=['inline', 'thread', 'process'])
+    parser.add_argument('--hashers', nargs='+', choices=list(HASHERS),
+                        default=None)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.hashers import make_password
+    from django.test.utils import override_settings
+
+    from common.hashers import HashingService, get_hashing_settings
+
+    cores = os.cpu_count() or 1
+    print(f'{args.logins} logins from {args.clients} clients, {cores} core(s)')
+    for name in args.hashers or available_hashers():
+        with override_settings(PASSWORD_HASHERS=[HASHERS[name]]):
+            encoded = make_password('12345678')
+            for executor in args.executor:
+                # Inline hashing runs on the client threads themselves
+                pool_sizes = [args.clients] if executor == 'inline' else args.workers
+                for workers in pool_sizes:
+                    service = HashingService({
+                        **get_hashing_settings(),
+                        'EXECUTOR': executor,
+                        'WORKERS': workers,
+                        'MAX_PENDING': args.clients,
+                        'WAIT_TIMEOUT': None,
+                    })
+                    try:
+                        elapsed = run(service, encoded, args.logins, args.clients)
+                    finally:
+                        service.shutdown()
+
+                    rate = args.logins / elapsed
+                    used = min(workers, cores)
+                    print(f'{name:>7} {executor:>8} workers={workers:<3} '
+                          f'{rate:9.1f} logins/s  {rate / used:9.1f} per core')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Refresh latency with a large number of revoked tokens.
+
+Fills the blacklist tables (and the revocation cache) with ``--revoked`` JTIs,
+then times chained refreshes through simplejwt's stock serializer (blacklist
+join per refresh) and through accounts.serializers.TokenRefreshSerializer
+(cache lookup per refresh).
+
+    DB_ENGINE=django.db.backends.sqlite3 python -m benchmarks.refresh_revocation --revoked 1000000
+"""
+import argparse
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from benchmarks import create_user, setup_django, setup_test_database
+
+SERIALIZERS = {
+    'stock': 'rest_framework_simplejwt.serializers.TokenRefreshSerializer',
+    'cached': 'accounts.serializers.TokenRefreshSerializer',
+}
+
+
+def populate(user, count, batch_size=10000):
+    from django.utils import timezone
+    from rest_framework_simplejwt.token_blacklist.models import (
+        BlacklistedToken,
+        OutstandingToken,
+    )
+
+    expires_at = timezone.now() + timedelta(days=1)
+    for start in range(0, count, batch_size):
+        outstanding = OutstandingToken.objects.bulk_create([
+            OutstandingToken(user=user, jti=uuid.uuid4().hex, token='',
+                             expires_at=expires_at)
+            for _ in range(min(batch_size, count - start))
+        ])
+        BlacklistedToken.objects.bulk_create(
+            [BlacklistedToken(token=token) for token in outstanding])
+
+
+def time_refreshes(serializer_class, token, refreshes):
+    timings = []
+    for _ in range(refreshes):
+        start = time.perf_counter()
+        serializer = serializer_class(data={'refresh': token})
+        serializer.is_valid(raise_exception=True)
+        timings.append(time.perf_counter() - start)
+        token = serializer.validated_data['refresh']
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--revoked', type=int, default=1000000)
+    parser.add_argument('--refreshes', type=int, default=500)
+    args = parser.parse_args()
+
+    setup_django()
+    teardown = setup_test_database()
+
+    from django.test import override_settings
+    from django.utils.module_loading import import_string
+    from accounts.revocation import warm
+    from accounts.tokens import RefreshToken
+
+    caches = {'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': args.revoked * 2},
+    }}
+    with override_settings(CACHES=caches, TOKEN_REVOCATION={'TRUST_CACHE': True}):
+        user = create_user()
+
+        start = time.perf_counter()
+        populate(user, args.revoked)
+        loaded = warm(batch_size=10000)
+        print(f'{loaded} revoked tokens loaded in {time.perf_counter() - start:.1f}s')
+
+        for name, path in SERIALIZERS.items():
+            timings = time_refreshes(
+                import_string(path), str(RefreshToken.for_user(user)), args.refreshes)
+            timings.sort()
+            print(f'{name:>7}: p50 {statistics.median(timings) * 1000:.2f}ms  '
+                  f'p99 {timings[int(len(timings) * 0.99) - 1] * 1000:.2f}ms  '
+                  f'({args.refreshes} refreshes)')
+
+    teardown()
+
+
+if __name__ == '__main__':
+    main()
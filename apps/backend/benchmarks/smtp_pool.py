@@ -0,0 +1,151 @@
+"""
+Messages per second with and without the pooled SMTP backend.
+
+Starts a local SMTP stand-in (aiosmtpd when installed and requested, otherwise
+a tiny asyncio responder) and sends the same messages three ways:
+
+- ``plain``: Django's stock SMTP backend, one connection per message
+- ``pooled``: PooledSMTPEmailBackend, one ``send_mail`` call per message
+- ``batched``: PooledSMTPEmailBackend, one ``send_messages`` call per batch
+
+``--connect-delay`` simulates the TCP + STARTTLS + AUTH handshake cost of a
+real relay; the built-in responder waits that long before its greeting.
+
+    python -m benchmarks.smtp_pool --messages 500 --connect-delay 0.05
+"""
+import argparse
+import asyncio
+import socket
+import threading
+import time
+
+from benchmarks import setup_django
+
+
+async def _handle_client(reader, writer, connect_delay):
+    await asyncio.sleep(connect_delay)
+    writer.write(b'220 localhost ESMTP stand-in\r\n')
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        command = line[:4].upper()
+        if command == b'EHLO':
+            writer.write(b'250-localhost\r\n250 SIZE 10485760\r\n')
+        elif command == b'DATA':
+            writer.write(b'354 End data with <CR><LF>.<CR><LF>\r\n')
+            await writer.drain()
+            while (await reader.readline()) not in (b'.\r\n', b''):
+                pass
+            writer.write(b'250 OK queued\r\n')
+        elif command == b'QUIT':
+            writer.write(b'221 Bye\r\n')
+            await writer.drain()
+            break
+        else:
+            writer.write(b'250 OK\r\n')
+        await writer.drain()
+    writer.close()
+
+
+def start_builtin_server(port, connect_delay):
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(asyncio.start_server(
+            lambda r, w: _handle_client(r, w, connect_delay), '127.0.0.1', port))
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+
+
+def start_aiosmtpd_server(port):
+    from aiosmtpd.controller import Controller
+    from aiosmtpd.handlers import Sink
+
+    controller = Controller(Sink(), hostname='127.0.0.1', port=port)
+    controller.start()
+    return controller
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def make_messages(count):
+    from django.core.mail import EmailMultiAlternatives
+
+    messages = []
+    for i in range(count):
+        message = EmailMultiAlternatives(
+            'Password Reset OTP', f'Your code is {i:06d}',
+            'noreply@example.com', [f'user{i}@example.com'])
+        message.attach_alternative(f'<p>Your code is <b>{i:06d}</b></p>', 'text/html')
+        messages.append(message)
+    return messages
+
+
+def run_one_per_message(backend_path, messages):
+    from django.core.mail import get_connection
+
+    start = time.perf_counter()
+    for message in messages:
+        get_connection(backend_path).send_messages([message])
+    return time.perf_counter() - start
+
+
+def run_batched(backend_path, messages, batch_size):
+    from django.core.mail import get_connection
+
+    start = time.perf_counter()
+    for i in range(0, len(messages), batch_size):
+        get_connection(backend_path).send_messages(messages[i:i + batch_size])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--connect-delay', type=float, default=0.02,
+                        help='Simulated handshake latency in seconds')
+    parser.add_argument('--server', choices=['builtin', 'aiosmtpd'],
+                        default='builtin')
+    args = parser.parse_args()
+
+    port = free_port()
+    if args.server == 'aiosmtpd':
+        start_aiosmtpd_server(port)
+    else:
+        start_builtin_server(port, args.connect_delay)
+
+    setup_django(EMAIL_HOST='127.0.0.1', EMAIL_PORT=port, EMAIL_USE_TLS='False',
+                 EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='')
+    from common.email_backends import pool
+
+    messages = make_messages(args.messages)
+    runs = [
+        ('plain', lambda: run_one_per_message(
+            'django.core.mail.backends.smtp.EmailBackend', messages)),
+        ('pooled', lambda: run_one_per_message(
+            'common.email_backends.PooledSMTPEmailBackend', messages)),
+        ('batched', lambda: run_batched(
+            'common.email_backends.PooledSMTPEmailBackend', messages, args.batch_size)),
+    ]
+
+    print(f'{args.messages} messages, server={args.server}, '
+          f'connect delay={args.connect_delay * 1000:.0f}ms')
+    for name, run in runs:
+        pool.clear()
+        elapsed = run()
+        print(f'{name:>8}: {args.messages / elapsed:10.1f} msg/s  ({elapsed:.2f}s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Per-request overhead of rate limiting.
+
+Runs ``--requests`` throttle checks spread over ``--clients`` IP addresses,
+with a limit high enough that nothing is ever rejected, for:
+
+- ``drf``: DRF's stock ``AnonRateThrottle`` (a list of timestamps per key)
+- ``shared``: ``common.ratelimit.AnonRateThrottle`` with the local pre-check off
+- ``local``: ``common.ratelimit.AnonRateThrottle`` with the local pre-check on
+- ``django-ratelimit``: the stock ``@ratelimit`` decorator
+- ``decorator``: ``common.ratelimit.ratelimit``
+
+Pass ``--redis redis://localhost:6379/0`` to measure against a shared Redis
+cache (requires the ``redis`` package) instead of local memory.
+
+    python -m benchmarks.throttle_overhead --requests 20000 --clients 100
+"""
+import argparse
+import time
+
+from benchmarks import setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--limit', type=int, default=10 ** 6,
+                        help='Requests allowed per client per hour')
+    parser.add_argument('--redis', default='', help='Redis URL for the shared cache')
+    args = parser.parse_args()
+
+    setup_django(REDIS_URL=args.redis)
+    from django.contrib.auth.models import AnonymousUser
+    from django.core.cache import cache
+    from django.http import HttpResponse
+    from django.test import RequestFactory
+    from django.test.utils import override_settings
+    from django_ratelimit.decorators import ratelimit as stock_ratelimit
+    from rest_framework import throttling
+
+    from common import ratelimit
+
+    rate = f'{args.limit}/h'
+
+    class StockThrottle(throttling.AnonRateThrottle):
+        pass
+
+    class LimiterThrottle(ratelimit.AnonRateThrottle):
+        pass
+
+    StockThrottle.rate = LimiterThrottle.rate = rate
+
+    def view(request):
+        return HttpResponse()
+
+    factory = RequestFactory()
+    requests = []
+    for i in range(args.requests):
+        client = i % args.clients
+        request = factory.post('/', REMOTE_ADDR=f'10.0.{client // 256}.{client % 256}')
+        request.user = AnonymousUser()
+        requests.append(request)
+
+    def throttle_run(throttle_class):
+        return lambda request: throttle_class().allow_request(request, None)
+
+    runs = [
+        ('drf', {}, throttle_run(StockThrottle)),
+        ('shared', {'LOCAL_MIN_LIMIT': float('inf')}, throttle_run(LimiterThrottle)),
+        ('local', {}, throttle_run(LimiterThrottle)),
+        ('django-ratelimit', {}, stock_ratelimit(key='ip', rate=rate)(view)),
+        ('decorator', {}, ratelimit.ratelimit(key='ip', rate=rate)(view)),
+    ]
+
+    print(f'{args.requests} requests from {args.clients} clients, '
+          f"cache={'redis' if args.redis else 'locmem'}")
+    for name, limiter_options, check in runs:
+        cache.clear()
+        with override_settings(RATE_LIMITER=limiter_options, RATELIMIT_ENABLE=True):
+            start = time.perf_counter()
+            for request in requests:
+                check(request)
+            elapsed = time.perf_counter() - start
+        print(f'{name:>17}: {elapsed / args.requests * 1e6:8.1f}us/request')
+
+
+if __name__ == '__main__':
+    main()
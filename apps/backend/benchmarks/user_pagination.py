@@ -0,0 +1,109 @@
+"""
+Admin user list latency at increasing page depth.
+
+Seeds ``--depths``' deepest page worth of users, then requests pages 1, 1k and
+100k (by default) of ``GET /api/auth/users/`` as an admin with:
+
+- ``offset``: DRF's ``PageNumberPagination`` (``OFFSET`` plus ``COUNT(*)``)
+- ``keyset``: ``common.pagination.KeysetPagination`` without a count
+- ``keyset+count``: keyset pages plus an exact ``COUNT(*)``
+- ``keyset+estimate``: keyset pages plus the ``pg_class.reltuples`` estimate
+  (an exact count on SQLite and on tables below ``ESTIMATE_MIN_ROWS``)
+
+and reports the median latency and the number of queries per request.
+
+    DB_HOST=localhost DB_USER=postgres python -m benchmarks.user_pagination
+    DB_ENGINE=django.db.backends.sqlite3 python -m benchmarks.user_pagination --depths 1 100 1000
+"""
+import argparse
+import statistics
+import time
+from datetime import timedelta
+
+from benchmarks import setup_django, setup_test_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--depths', type=int, nargs='+', default=[1, 1000, 100000])
+    parser.add_argument('--page-size', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django(RATELIMIT_ENABLE='False')
+    teardown = setup_test_database()
+    try:
+        from django.db import connection
+        from django.utils import timezone
+        from rest_framework.pagination import PageNumberPagination
+        from rest_framework.test import APIRequestFactory, force_authenticate
+
+        from accounts.models import User
+        from accounts.views import UserViewSet
+        from common.pagination import KeysetPagination
+
+        total = max(args.depths) * args.page_size
+        joined = timezone.now() - timedelta(seconds=total)
+        for start in range(0, total, 10000):
+            User.objects.bulk_create(
+                User(email=f'user{i}@example.com', username=f'user{i}', password='!',
+                     date_joined=joined + timedelta(seconds=i))
+                for i in range(start, min(start + 10000, total)))
+        admin = User.objects.create_superuser(
+            email='admin@example.com', username='admin', password='Secret-pass-1')
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {User._meta.db_table}')
+
+        class OffsetPagination(PageNumberPagination):
+            page_size = args.page_size
+
+        factory = APIRequestFactory()
+        view = UserViewSet.as_view({'get': 'list'})
+        ordered = User.objects.order_by('-date_joined', '-id')
+
+        def url_for(mode, depth):
+            if mode == 'offset':
+                return f'/api/auth/users/?page={depth}'
+            base = f'/api/auth/users/?page_size={args.page_size}'
+            if depth == 1:
+                return base
+            # The cursor a client would hold after reading the previous page
+            paginator = KeysetPagination()
+            paginator.base_url = 'http://testserver' + base
+            return paginator.encode_cursor(ordered[(depth - 1) * args.page_size - 1], False)
+
+        runs = [
+            ('offset', OffsetPagination, 'exact'),
+            ('keyset', KeysetPagination, 'none'),
+            ('keyset+count', KeysetPagination, 'exact'),
+            ('keyset+estimate', KeysetPagination, 'estimate'),
+        ]
+
+        print(f'{total + 1} users, {args.page_size} per page, {connection.vendor}')
+        for name, pagination_class, count_mode in runs:
+            UserViewSet.pagination_class = pagination_class
+            UserViewSet.count_mode = count_mode
+            for depth in args.depths:
+                url = url_for(name, depth)
+                latencies, queries = [], []
+                for _ in range(args.repeat):
+                    request = factory.get(url)
+                    force_authenticate(request, user=admin)
+                    executed = []
+                    with connection.execute_wrapper(
+                            lambda execute, *params: executed.append(1) or execute(*params)):
+                        start = time.perf_counter()
+                        response = view(request)
+                        latencies.append(time.perf_counter() - start)
+                    assert response.status_code == 200, response.data
+                    assert len(response.data['results']) == args.page_size
+                    queries.append(len(executed))
+                print(f'{name:>16} page {depth:>7}: '
+                      f'{statistics.median(latencies) * 1000:9.2f}ms  {max(queries)} queries')
+    finally:
+        teardown()
+
+
+if __name__ == '__main__':
+    main()
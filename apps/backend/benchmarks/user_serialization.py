@@ -0,0 +1,83 @@
+"""
+User payload build time: ``UserSerializer`` against the compiled read path.
+
+Seeds the largest of ``--rows`` users, then for each row count times:
+
+- ``serializer``: model instances from the queryset, ``UserSerializer(many=True)``
+- ``compiled``: ``values_list`` rows through ``common.serializers.compile_serializer``
+
+both including the query, as the list endpoint runs them, and asserts the two
+render to the same JSON. ``instance`` rows time a single already loaded user
+(``/me/``), without the query.
+
+    DB_ENGINE=django.db.backends.sqlite3 python -m benchmarks.user_serialization --rows 1 100 10000
+"""
+import argparse
+import time
+from datetime import timedelta
+
+from benchmarks import setup_django, setup_test_database
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1, 100, 10000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    teardown = setup_test_database()
+    try:
+        from django.db import connection
+        from django.utils import timezone
+
+        from accounts.models import User
+        from accounts.serializers import UserSerializer
+        from common.fastjson import FastJSONRenderer
+        from common.serializers import compile_serializer
+
+        total = max(args.rows)
+        joined = timezone.now() - timedelta(seconds=total)
+        for start in range(0, total, 10000):
+            User.objects.bulk_create(
+                User(email=f'user{i}@example.com', username=f'user{i}', password='!',
+                     date_joined=joined + timedelta(seconds=i, microseconds=i))
+                for i in range(start, min(start + 10000, total)))
+
+        compiled = compile_serializer(UserSerializer)
+        ordered = User.objects.order_by('-date_joined', '-id')
+        render = FastJSONRenderer().render
+
+        print(f'{total} users, best of {args.repeat}, {connection.vendor}')
+        for rows in args.rows:
+            queryset = ordered[:rows]
+            runs = [
+                ('serializer', lambda: UserSerializer(list(queryset), many=True).data),
+                ('compiled', lambda: compiled.to_representation_rows(compiled.values(queryset))),
+            ]
+            assert render(runs[0][1]()) == render(runs[1][1]())
+            for name, func in runs:
+                elapsed = best_of(args.repeat, func)
+                print(f'{rows:>7} rows {name:>10}: {elapsed:9.2f}ms {elapsed / rows * 1000:8.2f}us/row')
+
+        user = ordered.first()
+        assert render(UserSerializer(user).data) == render(compiled.to_representation(user))
+        for name, func in (('serializer', lambda: UserSerializer(user).data),
+                           ('compiled', lambda: compiled.to_representation(user))):
+            elapsed = best_of(args.repeat, lambda: [func() for _ in range(1000)])
+            print(f'{"instance":>12} {name:>10}: {elapsed:9.2f}us')
+    finally:
+        teardown()
+
+
+if __name__ == '__main__':
+    main()
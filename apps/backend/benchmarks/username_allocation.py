@@ -0,0 +1,85 @@
+"""
+Username allocation for a batch of sign-ups with heavily overlapping prefixes.
+
+Generates ``--emails`` addresses drawn from only ``--prefixes`` distinct local
+parts, seeds ``--existing`` users that already hold some of those names, then
+allocates usernames two ways:
+
+- ``per-email``: the old approach, one ``exists()`` query per email and an
+  unchecked random suffix on collision
+- ``batched``: ``common.utils.allocate_usernames``, one ``username__in``
+  query per round
+
+and reports time, queries and how many usernames are still duplicated.
+
+    DB_ENGINE=django.db.backends.sqlite3 python -m benchmarks.username_allocation --emails 10000
+"""
+import argparse
+import random
+import re
+import string
+import time
+
+from benchmarks import setup_django, setup_test_database
+
+
+def per_email(emails, model):
+    from django.utils.crypto import get_random_string
+
+    usernames = []
+    for email in emails:
+        username = re.sub(r'[^a-zA-Z0-9_.]', '', email.split('@')[0])
+        if model.objects.filter(username=username).exists():
+            suffix = get_random_string(
+                length=5, allowed_chars=string.ascii_lowercase + string.digits)
+            username = f"{username}_{suffix}"
+        usernames.append(username)
+    return usernames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--emails', type=int, default=10000)
+    parser.add_argument('--prefixes', type=int, default=50)
+    parser.add_argument('--existing', type=int, default=30)
+    args = parser.parse_args()
+
+    setup_django()
+    teardown = setup_test_database()
+    try:
+        from django.db import connection
+
+        from accounts.models import User
+        from common.utils import allocate_usernames
+
+        rng = random.Random(0)
+        prefixes = [f'john.smith{i}' if i else 'john.smith' for i in range(args.prefixes)]
+        emails = [f'{rng.choice(prefixes)}@example{i}.com' for i in range(args.emails)]
+
+        existing = allocate_usernames(
+            [f'{rng.choice(prefixes)}@seed.com' for _ in range(args.existing)], User)
+        User.objects.bulk_create(
+            User(email=f'seed{i}@seed.com', username=username, password='!')
+            for i, username in enumerate(existing))
+
+        print(f'{args.emails} emails over {args.prefixes} prefixes, '
+              f'{args.existing} existing users')
+        for name, allocate in [('per-email', per_email), ('batched', allocate_usernames)]:
+            queries = []
+            with connection.execute_wrapper(
+                    lambda execute, *params: queries.append(1) or execute(*params)):
+                start = time.perf_counter()
+                usernames = allocate(emails, User)
+                elapsed = time.perf_counter() - start
+
+            taken = set(existing)
+            duplicates = len(usernames) - len(set(usernames)) + sum(
+                username in taken for username in set(usernames))
+            print(f'{name:>10}: {elapsed * 1000:8.1f}ms  '
+                  f'{len(queries):6d} queries  {duplicates:5d} duplicates')
+    finally:
+        teardown()
+
+
+if __name__ == '__main__':
+    main()
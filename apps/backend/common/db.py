@@ -0,0 +1,71 @@
+"""
+Database connection statistics.
+
+Counts the connections Django opens per alias (via ``connection_created``),
+which shows whether ``CONN_MAX_AGE`` or the pool is actually reusing them,
+and the queries run per alias, which shows how reads are split between the
+primary and replicas. Also reads psycopg's pool stats (checkouts, wait time,
+pool size) when ``OPTIONS['pool']`` is configured. Queries in requests
+sampled by ``common.instrumentation`` are timed as well.
+"""
+import threading
+import time
+from collections import Counter
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .instrumentation import is_sampled, record_query
+
+_lock = threading.Lock()
+_opened = Counter()
+_queries = Counter()
+
+
+def _count_query(alias):
+    def wrapper(execute, sql, params, many, context):
+        with _lock:
+            _queries[alias] += 1
+        if not is_sampled():
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            record_query(time.perf_counter() - start)
+    return wrapper
+
+
+@receiver(connection_created)
+def _count_connection(sender, connection, **kwargs):
+    with _lock:
+        _opened[connection.alias] += 1
+    # The wrapper object outlives reconnects; only install the counter once
+    if not getattr(connection, '_counting_queries', False):
+        connection.execute_wrappers.append(_count_query(connection.alias))
+        connection._counting_queries = True
+
+
+def _pool(connection):
+    if connection.vendor != 'postgresql' or not connection.settings_dict['OPTIONS'].get('pool'):
+        return None
+    return connection.pool
+
+
+def connection_stats():
+    """Return ``{alias: stats}`` for every configured database."""
+    stats = {}
+    for alias in connections:
+        with _lock:
+            alias_stats = {
+                'connections_opened': _opened[alias],
+                'queries': _queries[alias],
+            }
+        pool = _pool(connections[alias])
+        if pool is not None:
+            # get_stats() includes requests_num (checkouts),
+            # requests_wait_ms, pool_size, pool_available, requests_waiting...
+            alias_stats['pool'] = pool.get_stats()
+        stats[alias] = alias_stats
+    return stats
@@ -0,0 +1,150 @@
+"""
+SMTP email backend that reuses warm, authenticated connections.
+
+Every ``send_mail`` call normally opens a fresh SMTP connection and pays for
+the TCP connect, STARTTLS and AUTH round trips. ``PooledSMTPEmailBackend``
+returns connections to a process-wide pool on ``close()`` instead of quitting,
+and hands them out again on the next ``open()``.
+"""
+import smtplib
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail.backends.smtp import EmailBackend as SMTPEmailBackend
+
+DEFAULTS = {
+    'SIZE': 4,
+    'IDLE_TIMEOUT': 60,
+    'HEALTH_CHECK_INTERVAL': 10,
+}
+
+
+def get_pool_settings():
+    """Return the EMAIL_POOL settings merged over the defaults."""
+    return {**DEFAULTS, **getattr(settings, 'EMAIL_POOL', {})}
+
+
+def _quit(connection):
+    try:
+        connection.quit()
+    except (smtplib.SMTPException, OSError):
+        connection.close()
+
+
+def _is_open(connection):
+    # smtplib drops the socket when it notices the server went away
+    return getattr(connection, 'sock', None) is not None
+
+
+class SMTPConnectionPool:
+    """Thread-safe LIFO pool of idle SMTP connections, keyed by server."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle = {}
+        self.stats = {'created': 0, 'reused': 0, 'discarded': 0}
+
+    def acquire(self, key):
+        """Return a healthy idle connection for ``key``, or None."""
+        options = get_pool_settings()
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                if not idle:
+                    return None
+                connection, released_at = idle.pop()
+
+            idle_for = time.monotonic() - released_at
+            if idle_for > options['IDLE_TIMEOUT'] or not _is_open(connection):
+                self._discard(connection)
+                continue
+            if idle_for > options['HEALTH_CHECK_INTERVAL'] and not self._healthy(connection):
+                self._discard(connection)
+                continue
+
+            self.count('reused')
+            return connection
+
+    def release(self, key, connection):
+        """Return a connection to the pool, or quit it if the pool is full."""
+        if not _is_open(connection):
+            self._discard(connection)
+            return
+
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < get_pool_settings()['SIZE']:
+                idle.append((connection, time.monotonic()))
+                return
+        self._discard(connection)
+
+    def clear(self):
+        """Quit and forget every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection, _ in connections:
+                _quit(connection)
+
+    def count(self, event):
+        with self._lock:
+            self.stats[event] += 1
+
+    def _healthy(self, connection):
+        try:
+            return connection.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _discard(self, connection):
+        self.count('discarded')
+        _quit(connection)
+
+
+pool = SMTPConnectionPool()
+
+
+class PooledSMTPEmailBackend(SMTPEmailBackend):
+    """
+    SMTP backend that borrows connections from ``pool``.
+
+    Use ``send_messages`` (or keep the backend open across several sends) to
+    flush many messages over one connection.
+    """
+
+    @property
+    def pool_key(self):
+        return (self.host, self.port, self.username, self.use_tls, self.use_ssl)
+
+    def open(self):
+        if self.connection:
+            return False
+
+        self._broken = False
+        self.connection = pool.acquire(self.pool_key)
+        if self.connection is not None:
+            return True
+
+        opened = super().open()
+        if self.connection is not None:
+            pool.count('created')
+        return opened
+
+    def close(self):
+        if self.connection is None:
+            return
+
+        if getattr(self, '_broken', False):
+            super().close()
+            return
+
+        connection, self.connection = self.connection, None
+        pool.release(self.pool_key, connection)
+
+    def _send(self, email_message):
+        try:
+            return super()._send(email_message)
+        except (smtplib.SMTPServerDisconnected, OSError):
+            self._broken = True
+            raise
@@ -1,9 +1,16 @@
-from django.core.exceptions import ValidationError as DjangoValidationError
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied, ValidationError as DjangoValidationError
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 from django.http import Http404
-from rest_framework import status
+from django.utils.translation import get_language
+from rest_framework import exceptions, status
 from rest_framework.exceptions import APIException, ValidationError as DRFValidationError
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-from rest_framework.views import exception_handler
+from rest_framework.views import set_rollback
 
 
 class ServiceUnavailable(APIException):
@@ -12,49 +19,133 @@ class ServiceUnavailable(APIException):
     default_code = 'service_unavailable'
 
 
+class Conflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The resource was changed by another request.'
+    default_code = 'conflict'
+
+
 class InvalidInput(APIException):
     status_code = status.HTTP_400_BAD_REQUEST
     default_detail = 'Invalid input provided.'
     default_code = 'invalid_input'
 
 
-def custom_exception_handler(exc, context):
+class EnvelopeResponse(Response):
     """
-    Custom exception handler for DRF to standardize error responses.
+    An error response whose JSON body was rendered once and cached; other
+    renderers (e.g. the browsable API) still render ``data``.
     """
-    # Call DRF's default exception handler first to get the standard error response
-    response = exception_handler(exc, context)
 
-    # If this is a Django validation error, convert it to DRF validation error
-    if isinstance(exc, DjangoValidationError):
-        exc = DRFValidationError(detail=exc.message_dict)
-        response = exception_handler(exc, context)
+    def __init__(self, data, content, **kwargs):
+        super().__init__(data, **kwargs)
+        self.prerendered = content
 
-    # If no response is generated yet, let Django handle it
-    if response is None:
-        return None
+    @property
+    def rendered_content(self):
+        renderer = getattr(self, 'accepted_renderer', None)
+        # Plain JSON only: media type parameters (e.g. indent=4) change the output
+        if (not isinstance(renderer, JSONRenderer)
+                or getattr(self, 'accepted_media_type', None) != renderer.media_type):
+            return super().rendered_content
+        content_type = self.content_type or renderer.media_type
+        if self.content_type is None and renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        self['Content-Type'] = content_type
+        return self.prerendered
 
-    # Add more context to the error response
-    if isinstance(exc, Http404):
-        response.data = {
+
+@lru_cache(maxsize=None)
+def _atomic_requests():
+    return any(db.get('ATOMIC_REQUESTS') for db in settings.DATABASES.values())
+
+
+@receiver(setting_changed)
+def _reset_atomic_requests(setting, **kwargs):
+    if setting == 'DATABASES':
+        _atomic_requests.cache_clear()
+
+
+def _set_rollback():
+    # DRF's set_rollback(), without its scan of the connections when no
+    # database has ATOMIC_REQUESTS (the usual case)
+    if _atomic_requests():
+        set_rollback()
+
+
+def _validation_response(errors):
+    return Response({
+        'success': False,
+        'message': 'Validation error.',
+        'errors': errors,
+        'code': 'validation_error'
+    }, status=status.HTTP_400_BAD_REQUEST)
+
+
+@lru_cache(maxsize=512)
+def _static_envelope(exc_class, detail, language):
+    """The envelope and its JSON for an error that only depends on its class and message."""
+    if exc_class is Http404:
+        envelope = {
             'success': False,
             'message': 'Not found.',
-            'detail': str(exc),
+            'detail': detail,
             'code': 'not_found'
         }
-    elif isinstance(exc, DRFValidationError):
-        response.data = {
-            'success': False,
-            'message': 'Validation error.',
-            'errors': response.data,
-            'code': 'validation_error'
-        }
     else:
-        response.data = {
+        envelope = {
             'success': False,
-            'message': getattr(exc, 'default_detail', str(exc)),
-            'detail': response.data.get('detail', str(exc)),
-            'code': getattr(exc, 'default_code', 'error')
+            'message': str(getattr(exc_class, 'default_detail', detail)),
+            'detail': detail,
+            'code': getattr(exc_class, 'default_code', 'error')
         }
+    return envelope, JSONRenderer().render(envelope)
+
+
+def custom_exception_handler(exc, context):
+    """
+    Custom exception handler for DRF to standardize error responses.
+
+    Validation errors, the most common, are wrapped directly. Other errors
+    whose body only depends on the exception class and message (not found,
+    throttled, authentication, permission denied) reuse a cached, pre-rendered
+    envelope. Anything else gets the same envelope built per request.
+    """
+    if isinstance(exc, DRFValidationError):
+        _set_rollback()
+        return _validation_response(exc.detail)
+
+    if isinstance(exc, DjangoValidationError):
+        _set_rollback()
+        return _validation_response(
+            exc.message_dict if hasattr(exc, 'error_dict') else {'non_field_errors': exc.messages})
+
+    if isinstance(exc, Http404):
+        status_code, headers = status.HTTP_404_NOT_FOUND, None
+        exc_class, detail = Http404, str(exc)
+    else:
+        if isinstance(exc, PermissionDenied):
+            exc = exceptions.PermissionDenied(*exc.args)
+        if not isinstance(exc, APIException):
+            # Let Django handle it
+            return None
+
+        status_code, headers = exc.status_code, {}
+        if getattr(exc, 'auth_header', None):
+            headers['WWW-Authenticate'] = exc.auth_header
+        if getattr(exc, 'wait', None):
+            headers['Retry-After'] = '%d' % exc.wait
+        exc_class, detail = type(exc), exc.detail
+
+    _set_rollback()
+    if isinstance(detail, str):
+        envelope, content = _static_envelope(exc_class, str(detail), get_language())
+        return EnvelopeResponse(dict(envelope), content, status=status_code, headers=headers)
 
-    return response
+    # Structured details (e.g. simplejwt's token errors) carry their own "detail"
+    return Response({
+        'success': False,
+        'message': getattr(exc, 'default_detail', str(exc)),
+        'detail': detail.get('detail', str(exc)) if isinstance(detail, dict) else str(exc),
+        'code': getattr(exc, 'default_code', 'error')
+    }, status=status_code, headers=headers)
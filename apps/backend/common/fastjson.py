@@ -0,0 +1,65 @@
+"""
+orjson-backed JSON renderer and parser for DRF.
+
+``FastJSONRenderer`` and ``FastJSONParser`` are drop-in replacements for DRF's
+``JSONRenderer``/``JSONParser`` (see ``API_JSON_BACKEND`` in settings). UUIDs,
+datetimes, dates and times are encoded natively by orjson instead of through
+``json.JSONEncoder.default``; other types DRF knows (lazy strings, decimals,
+timedeltas, querysets...) go through DRF's own encoder, so the output matches
+the stdlib renderer's.
+
+Without orjson installed, and for requests asking for indented output (the
+browsable API renders its JSON with ``indent=4``), both fall back to DRF's
+stdlib implementation.
+"""
+from rest_framework import renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # UTC datetimes end in "Z", as with DRF's encoder; dicts may have non-str keys
+    OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+_encoder = JSONEncoder()
+
+# U+2028/U+2029 are valid JSON but not valid JavaScript; DRF escapes them
+LINE_SEPARATOR = b'\xe2\x80\xa8'
+PARAGRAPH_SEPARATOR = b'\xe2\x80\xa9'
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """DRF's ``JSONRenderer`` on orjson."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+
+        content = orjson.dumps(data, default=_encoder.default, option=OPTIONS)
+        if b'\xe2\x80' in content:
+            content = (content.replace(LINE_SEPARATOR, b'\\u2028')
+                       .replace(PARAGRAPH_SEPARATOR, b'\\u2029'))
+        return content
+
+
+class FastJSONParser(JSONParser):
+    """DRF's ``JSONParser`` on orjson."""
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            # orjson only reads UTF-8, the encoding JSON requires; it also
+            # rejects NaN and Infinity, like DRF's strict parsing
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
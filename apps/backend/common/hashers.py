@@ -0,0 +1,177 @@
+"""
+Password hashing off the request thread, with a cap on concurrent work.
+
+Hashing a password is by far the most CPU-expensive thing a login, signup or
+password reset does. ``HashingService`` runs it on a bounded pool
+(``settings.PASSWORD_HASHING['EXECUTOR']``):
+
+- ``inline``: in the calling thread.
+- ``thread``: on a thread pool. PBKDF2, scrypt and Argon2 release the GIL
+  while hashing, so threads use every core.
+- ``process``: on a process pool.
+
+At most ``MAX_PENDING`` hashes may be queued or running. Callers wait up to
+``WAIT_TIMEOUT`` seconds for a slot and are then turned away with
+``ServiceUnavailable`` (503) instead of piling up behind the pool.
+
+The hashers below read their work factors from the same settings, so a change
+is picked up by ``must_update`` and stored hashes are upgraded on next login.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .instrumentation import timed
+
+DEFAULTS = {
+    'EXECUTOR': 'thread',
+    'WORKERS': os.cpu_count() or 1,
+    'MAX_PENDING': 32,
+    'WAIT_TIMEOUT': 0.5,
+    'PBKDF2_ITERATIONS': hashers.PBKDF2PasswordHasher.iterations,
+    'SCRYPT_WORK_FACTOR': hashers.ScryptPasswordHasher.work_factor,
+    'ARGON2_TIME_COST': hashers.Argon2PasswordHasher.time_cost,
+    'ARGON2_MEMORY_COST': hashers.Argon2PasswordHasher.memory_cost,
+    'ARGON2_PARALLELISM': hashers.Argon2PasswordHasher.parallelism,
+}
+
+
+def get_hashing_settings():
+    """Return the PASSWORD_HASHING settings merged over the defaults."""
+    return {**DEFAULTS, **getattr(settings, 'PASSWORD_HASHING', {})}
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """PBKDF2-SHA256 with ``PBKDF2_ITERATIONS`` iterations."""
+
+    @property
+    def iterations(self):
+        return get_hashing_settings()['PBKDF2_ITERATIONS']
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    """scrypt with a work factor (N) of ``SCRYPT_WORK_FACTOR``."""
+
+    @property
+    def work_factor(self):
+        return get_hashing_settings()['SCRYPT_WORK_FACTOR']
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """Argon2id tuned by the ``ARGON2_*`` settings (requires argon2-cffi)."""
+
+    @property
+    def time_cost(self):
+        return get_hashing_settings()['ARGON2_TIME_COST']
+
+    @property
+    def memory_cost(self):
+        return get_hashing_settings()['ARGON2_MEMORY_COST']
+
+    @property
+    def parallelism(self):
+        return get_hashing_settings()['ARGON2_PARALLELISM']
+
+
+def _setup_worker():
+    # Spawned worker processes need their own configured Django
+    import django
+
+    django.setup()
+
+
+class HashingService:
+    """Run password hashing on a bounded pool, shedding load when it is full."""
+
+    def __init__(self, options):
+        self.options = options
+        self.slots = threading.BoundedSemaphore(options['MAX_PENDING'])
+        if options['EXECUTOR'] == 'process':
+            self.executor = ProcessPoolExecutor(
+                max_workers=options['WORKERS'], initializer=_setup_worker)
+        elif options['EXECUTOR'] == 'thread':
+            self.executor = ThreadPoolExecutor(
+                max_workers=options['WORKERS'], thread_name_prefix='hashing')
+        else:
+            self.executor = None
+
+    def _acquire(self, timeout):
+        if not self.slots.acquire(timeout=timeout):
+            # Imported here: common.exceptions pulls in DRF's views, which
+            # import the authentication classes and with them the User model
+            from .exceptions import ServiceUnavailable
+
+            raise ServiceUnavailable()
+
+    def run(self, fn, *args):
+        """Run ``fn(*args)`` on the pool and wait for the result."""
+        with timed('hash'):
+            self._acquire(self.options['WAIT_TIMEOUT'])
+            try:
+                if self.executor is None:
+                    return fn(*args)
+                return self.executor.submit(fn, *args).result()
+            finally:
+                self.slots.release()
+
+    async def arun(self, fn, *args):
+        """Async version of ``run``; the event loop is never blocked."""
+        with timed('hash'):
+            # Don't wait for a slot on the event loop thread
+            self._acquire(0)
+            try:
+                if self.executor is None:
+                    return await asyncio.to_thread(fn, *args)
+                return await asyncio.wrap_future(self.executor.submit(fn, *args))
+            finally:
+                self.slots.release()
+
+    def make_password(self, password):
+        return self.run(hashers.make_password, password)
+
+    async def amake_password(self, password):
+        return await self.arun(hashers.make_password, password)
+
+    def check_password(self, password, encoded, setter=None):
+        """Like Django's ``check_password``, with the hashing on the pool."""
+        is_correct, must_update = self.run(hashers.verify_password, password, encoded)
+        if setter and is_correct and must_update:
+            setter(password)
+        return is_correct
+
+    async def acheck_password(self, password, encoded, setter=None):
+        """See ``check_password``; ``setter`` is a coroutine function."""
+        is_correct, must_update = await self.arun(
+            hashers.verify_password, password, encoded)
+        if setter and is_correct and must_update:
+            await setter(password)
+        return is_correct
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+
+_service = None
+
+
+def get_hashing_service():
+    """Return the process-wide hashing service."""
+    global _service
+    if _service is None:
+        _service = HashingService(get_hashing_settings())
+    return _service
+
+
+@receiver(setting_changed)
+def _reset_service(setting, **kwargs):
+    global _service
+    if setting == 'PASSWORD_HASHING' and _service is not None:
+        _service.shutdown()
+        _service = None
@@ -0,0 +1,36 @@
+from django.db import models
+from django.db.models.functions import Cast, Upper
+
+
+class PrefixSearchIndex(models.Index):
+    """
+    Index for case-insensitive prefix search (``istartswith``, or ``^field`` in
+    an admin's ``search_fields``) on a text column.
+
+    On PostgreSQL that lookup compiles to ``UPPER("field"::text) LIKE UPPER('x%')``,
+    which only an expression index with ``text_pattern_ops`` can serve under a
+    non-C collation. Other databases get the same expression without the
+    operator class.
+    """
+
+    def __init__(self, field, *, name):
+        self.field = field
+        super().__init__(Upper(Cast(field, models.TextField())), name=name)
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor == 'postgresql':
+            from django.contrib.postgres.indexes import OpClass
+
+            index = models.Index(
+                OpClass(Upper(Cast(self.field, models.TextField())), name='text_pattern_ops'),
+                name=self.name,
+            )
+            return index.create_sql(model, schema_editor, using=using, **kwargs)
+        return super().create_sql(model, schema_editor, using=using, **kwargs)
+
+    def deconstruct(self):
+        path = f'{self.__class__.__module__}.{self.__class__.__name__}'
+        return path, (self.field,), {'name': self.name}
+
+    def clone(self):
+        return self.__class__(self.field, name=self.name)
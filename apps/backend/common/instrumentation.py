@@ -0,0 +1,351 @@
+"""
+Per-request performance instrumentation.
+
+``InstrumentationMiddleware`` times every request and, for a sampled fraction
+(``SAMPLE_RATE``), breaks that time down into the components it was spent in:
+
+- ``db``: query count and time, recorded by the execute wrapper that
+  ``common.db`` installs on every connection
+- ``cache``: hits and misses of the user and revocation caches
+- ``template``, ``email``, ``hash``: recorded by ``timed()`` around template
+  rendering, SMTP sends and password hashing
+
+Sampled responses carry a ``Server-Timing`` header (when ``SERVER_TIMING`` is
+on) and all measurements feed per-view histograms served in Prometheus' text
+format by ``metrics_view``. Work done outside a request (queued emails) is
+recorded under the view ``background``.
+
+Unsampled requests cost two clock reads and one histogram update; hooks cost
+one context variable lookup when there is nothing to record. Metrics are per
+process: scrape every worker.
+"""
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+
+DEFAULTS = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 1.0,
+    'SERVER_TIMING': False,
+    # Seconds; the same buckets serve requests and their components
+    'BUCKETS': (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    'QUERY_BUCKETS': (0, 1, 2, 5, 10, 20, 50, 100),
+    # /metrics is open to these addresses, or to "Bearer <METRICS_TOKEN>"
+    'METRICS_TOKEN': '',
+    'METRICS_ALLOWED_IPS': ('127.0.0.1', '::1'),
+}
+
+COMPONENTS = ('db', 'template', 'email', 'hash')
+BACKGROUND = 'background'
+
+
+def get_instrumentation_settings():
+    """Return the INSTRUMENTATION settings merged over the defaults."""
+    return {**DEFAULTS, **getattr(settings, 'INSTRUMENTATION', {})}
+
+
+class Histogram:
+    """A labelled Prometheus histogram."""
+
+    def __init__(self, name, help_text, labels, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {labels: list(values) for labels, values in self.series.items()}
+        for label_values, values in sorted(series.items()):
+            labels = ','.join(f'{name}="{label}"'
+                              for name, label in zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {values[-1]}')
+            lines.append(f'{self.name}_count{{{labels}}} {cumulative}')
+        return lines
+
+
+class Counter:
+    """A labelled Prometheus counter."""
+
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.series = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self.series[label_values] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            series = dict(self.series)
+        for label_values, value in sorted(series.items()):
+            labels = ','.join(f'{name}="{label}"'
+                              for name, label in zip(self.labels, label_values))
+            lines.append(f'{self.name}{{{labels}}} {value}')
+        return lines
+
+
+# (name, type, psycopg pool stat, scale, help) for pooled database aliases
+POOL_METRICS = (
+    ('db_pool_size', 'gauge', 'pool_size', 1, 'Connections in the pool, in use or idle.'),
+    ('db_pool_available', 'gauge', 'pool_available', 1, 'Idle connections in the pool.'),
+    ('db_pool_max_size', 'gauge', 'pool_max', 1, 'Maximum pool size.'),
+    ('db_pool_requests_waiting', 'gauge', 'requests_waiting', 1,
+     'Requests waiting for a connection.'),
+    ('db_pool_checkouts_total', 'counter', 'requests_num', 1, 'Connections checked out.'),
+    ('db_pool_checkouts_queued_total', 'counter', 'requests_queued', 1,
+     'Checkouts that had to wait for a connection.'),
+    ('db_pool_checkout_wait_seconds_total', 'counter', 'requests_wait_ms', 0.001,
+     'Time spent waiting for a connection.'),
+    ('db_pool_checkout_errors_total', 'counter', 'requests_errors', 1,
+     'Checkouts that timed out or failed.'),
+    ('db_pool_connections_lost_total', 'counter', 'connections_lost', 1,
+     'Pooled connections found broken.'),
+)
+
+
+class Metrics:
+    """The process-wide metric families."""
+
+    def __init__(self, options):
+        buckets = options['BUCKETS']
+        self.requests = Histogram(
+            'http_request_duration_seconds', 'Request wall time.',
+            ('view', 'method', 'status'), buckets)
+        self.components = Histogram(
+            'http_request_component_seconds', 'Time spent per component in sampled requests.',
+            ('view', 'component'), buckets)
+        self.queries = Histogram(
+            'http_request_db_queries', 'Database queries per sampled request.',
+            ('view',), options['QUERY_BUCKETS'])
+        self.cache = Counter(
+            'http_request_cache_total', 'Cache lookups in sampled requests.',
+            ('view', 'result'))
+
+    def render(self):
+        from .db import connection_stats
+
+        lines = []
+        for family in (self.requests, self.components, self.queries, self.cache):
+            lines += family.render()
+
+        stats = connection_stats()
+        for name, key, help_text in (
+                ('db_connections_opened_total', 'connections_opened', 'Connections opened.'),
+                ('db_queries_total', 'queries', 'Queries run.')):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            lines += [f'{name}{{alias="{alias}"}} {alias_stats[key]}'
+                      for alias, alias_stats in stats.items()]
+
+        pools = {alias: alias_stats['pool'] for alias, alias_stats in stats.items()
+                 if 'pool' in alias_stats}
+        if pools:
+            for name, kind, key, scale, help_text in POOL_METRICS:
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+                # psycopg leaves counters out of get_stats() until they are non-zero
+                lines += [f'{name}{{alias="{alias}"}} {pool_stats.get(key, 0) * scale}'
+                          for alias, pool_stats in pools.items()]
+        return '\n'.join(lines) + '\n'
+
+
+_metrics = None
+
+
+def get_metrics():
+    """Return the process-wide metrics."""
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics(get_instrumentation_settings())
+    return _metrics
+
+
+@receiver(setting_changed)
+def _reset_metrics(setting, **kwargs):
+    global _metrics
+    if setting == 'INSTRUMENTATION':
+        _metrics = None
+
+
+class _Sample:
+    """What one sampled request spent its time on."""
+
+    __slots__ = ('seconds', 'queries', 'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.seconds = dict.fromkeys(COMPONENTS, 0.0)
+        self.queries = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+# None outside requests, False in unsampled ones
+_sample = ContextVar('instrumentation_sample', default=None)
+
+
+def record(component, seconds):
+    """Add ``seconds`` spent in ``component`` to the current request, if sampled."""
+    sample = _sample.get()
+    if sample:
+        sample.seconds[component] += seconds
+    elif sample is None and get_instrumentation_settings()['ENABLED']:
+        get_metrics().components.observe(seconds, BACKGROUND, component)
+
+
+def record_query(seconds):
+    """Count a query that took ``seconds`` against the current request, if sampled."""
+    sample = _sample.get()
+    if sample:
+        sample.queries += 1
+        sample.seconds['db'] += seconds
+
+
+def record_cache(hit):
+    """Count a cache hit or miss against the current request, if sampled."""
+    sample = _sample.get()
+    if sample:
+        if hit:
+            sample.cache_hits += 1
+        else:
+            sample.cache_misses += 1
+
+
+def is_sampled():
+    """Whether the current request is being broken down; hooks can skip timing if not."""
+    return bool(_sample.get())
+
+
+@contextmanager
+def timed(component):
+    """Record the time spent in the block under ``component``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(component, time.perf_counter() - start)
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else 'unresolved'
+
+
+def server_timing(total, sample):
+    """Format a ``Server-Timing`` header value."""
+    parts = [f'total;dur={total * 1000:.1f}',
+             f'db;dur={sample.seconds["db"] * 1000:.1f};desc="{sample.queries} queries"']
+    parts += [f'{component};dur={sample.seconds[component] * 1000:.1f}'
+              for component in COMPONENTS[1:] if sample.seconds[component]]
+    parts.append(f'cache;desc="{sample.cache_hits} hits, {sample.cache_misses} misses"')
+    return ', '.join(parts)
+
+
+class InstrumentationMiddleware:
+    """Time requests, break sampled ones down by component and export the results."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _start(self):
+        options = get_instrumentation_settings()
+        if not options['ENABLED']:
+            return None, None
+        sample = _Sample() if random.random() < options['SAMPLE_RATE'] else None
+        return options, sample
+
+    def _finish(self, options, request, response, sample, total):
+        metrics = get_metrics()
+        view = _view_name(request)
+        metrics.requests.observe(total, view, request.method, f'{response.status_code // 100}xx')
+        if sample is None:
+            return
+
+        for component, seconds in sample.seconds.items():
+            metrics.components.observe(seconds, view, component)
+        metrics.queries.observe(sample.queries, view)
+        if sample.cache_hits:
+            metrics.cache.inc(view, 'hit', amount=sample.cache_hits)
+        if sample.cache_misses:
+            metrics.cache.inc(view, 'miss', amount=sample.cache_misses)
+        if options['SERVER_TIMING']:
+            response['Server-Timing'] = server_timing(total, sample)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        options, sample = self._start()
+        if options is None:
+            return self.get_response(request)
+
+        token = _sample.set(sample or False)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _sample.reset(token)
+        self._finish(options, request, response, sample, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        options, sample = self._start()
+        if options is None:
+            return await self.get_response(request)
+
+        token = _sample.set(sample or False)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _sample.reset(token)
+        self._finish(options, request, response, sample, time.perf_counter() - start)
+        return response
+
+
+def metrics_view(request):
+    """Serve the metrics in Prometheus' text exposition format."""
+    options = get_instrumentation_settings()
+    token = options['METRICS_TOKEN']
+    if token:
+        allowed = request.META.get('HTTP_AUTHORIZATION') == f'Bearer {token}'
+    else:
+        allowed = request.META.get('REMOTE_ADDR') in options['METRICS_ALLOWED_IPS']
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(get_metrics().render(),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
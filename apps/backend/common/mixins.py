@@ -2,6 +2,8 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.core.exceptions import ValidationError
 
+from .pagination import estimated_count, get_pagination_settings
+
 
 class ValidateModelMixin:
     """
@@ -29,8 +31,22 @@ class ValidateModelMixin:
 class ResponseWithMetadataMixin:
     """
     Mixin to add metadata to list responses.
+
+    ``count_mode`` (default: ``settings.PAGINATION['COUNT']``) selects how the
+    ``count`` is computed: ``'exact'``, ``'estimate'`` (planner statistics on
+    PostgreSQL, see ``common.pagination.estimated_count``) or ``'none'``.
     """
 
+    count_mode = None
+
+    def get_count(self, queryset):
+        mode = self.count_mode or get_pagination_settings()['COUNT']
+        if mode == 'none':
+            return None
+        if mode == 'estimate':
+            return estimated_count(queryset)
+        return queryset.count()
+
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
 
@@ -38,10 +54,16 @@ class ResponseWithMetadataMixin:
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
+            response = self.get_paginated_response(serializer.data)
+            # Keyset pages don't count; add it unless disabled
+            if 'count' not in response.data:
+                count = self.get_count(queryset)
+                if count is not None:
+                    response.data = {'count': count, **response.data}
+            return response
 
         serializer = self.get_serializer(queryset, many=True)
         return Response({
-            'count': queryset.count(),
+            'count': self.get_count(queryset),
             'results': serializer.data
         })
@@ -0,0 +1,178 @@
+"""
+Keyset pagination and cheap row counts for large tables.
+
+``KeysetPagination`` pages through a queryset ordered by a unique compound
+key, ``(date_joined, id)`` by default. Each page is fetched with a ``WHERE``
+on the last row seen instead of an ``OFFSET``, so page 100,000 costs the same
+index range scan as page 1. Cursors are opaque; clients follow the ``next``
+and ``previous`` links.
+
+``estimated_count`` reads PostgreSQL's planner statistics
+(``pg_class.reltuples``) instead of running ``COUNT(*)`` for unfiltered
+querysets on large tables, and counts exactly everywhere else;
+``EstimatedCountPaginator`` does the same for Django's paginator (the admin).
+"""
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+DEFAULTS = {
+    'PAGE_SIZE': 50,
+    'MAX_PAGE_SIZE': 500,
+    # 'exact', 'estimate' or 'none'
+    'COUNT': 'exact',
+    # Below this many rows the estimate is not worth the inaccuracy
+    'ESTIMATE_MIN_ROWS': 10000,
+}
+
+
+def get_pagination_settings():
+    """Return the PAGINATION settings merged over the defaults."""
+    return {**DEFAULTS, **getattr(settings, 'PAGINATION', {})}
+
+
+def estimated_count(queryset):
+    """
+    Return the planner's row estimate for an unfiltered queryset on PostgreSQL,
+    or the exact count when there is no usable estimate.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql' and not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                           [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        # reltuples is -1 (or stale and tiny) until the table has been analyzed
+        if row and row[0] >= get_pagination_settings()['ESTIMATE_MIN_ROWS']:
+            return row[0]
+    return queryset.count()
+
+
+class EstimatedCountPaginator(Paginator):
+    """Django paginator that estimates the total for large unfiltered querysets."""
+
+    @cached_property
+    def count(self):
+        if isinstance(self.object_list, QuerySet):
+            return estimated_count(self.object_list)
+        return super().count
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination on a unique compound key, without OFFSET or COUNT."""
+
+    # Both fields sort the same way; the last one must be unique
+    ordering = ('-date_joined', '-id')
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor.'
+
+    def get_page_size(self, request):
+        options = get_pagination_settings()
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return options['PAGE_SIZE']
+        return max(1, min(page_size, options['MAX_PAGE_SIZE']))
+
+    def _fields(self, reverse=False):
+        descending = self.ordering[0].startswith('-')
+        names = [field.lstrip('-') for field in self.ordering]
+        return names, descending != reverse
+
+    def _position(self, names, descending, values):
+        # (a, b) < (x, y)  <=>  a <= x AND (a < x OR (a = x AND b < y));
+        # the redundant leading bound lets the index serve it as a range scan
+        lookup = 'lt' if descending else 'gt'
+        condition = Q()
+        for i, name in enumerate(names):
+            condition |= Q(**{name: value for name, value in zip(names[:i], values)},
+                           **{f'{name}__{lookup}': values[i]})
+        return Q(**{f'{names[0]}__{lookup}e': values[0]}) & condition
+
+    def encode_cursor(self, row, reverse):
+        names, _ = self._fields()
+        values = [str(getattr(row, name)) for name in names]
+        payload = json.dumps([int(reverse), *values], separators=(',', ':'))
+        cursor = urlsafe_b64encode(payload.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return False, None
+        names, _ = self._fields()
+        try:
+            reverse, *raw = json.loads(urlsafe_b64decode(encoded.encode()))
+            if len(raw) != len(names):
+                raise ValueError
+            values = [model._meta.get_field(name).to_python(value)
+                      for name, value in zip(names, raw)]
+        except (binascii.Error, TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return bool(reverse), values
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        reverse, values = self.decode_cursor(request, queryset.model)
+
+        names, descending = self._fields(reverse)
+        queryset = queryset.order_by(*[('-' if descending else '') + name for name in names])
+        if values is not None:
+            queryset = queryset.filter(self._position(names, descending, values))
+
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        # Coming from a cursor means there is a page on the side we came from
+        has_next = has_more if not reverse else values is not None
+        has_previous = has_more if reverse else values is not None
+
+        self.next_link = self.encode_cursor(rows[-1], False) if rows and has_next else None
+        self.previous_link = self.encode_cursor(rows[0], True) if rows and has_previous else None
+        if has_previous and not rows:
+            # Past the end: point back to the first page
+            self.previous_link = remove_query_param(self.base_url, self.cursor_query_param)
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.next_link,
+            'previous': self.previous_link,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {'name': self.cursor_query_param, 'required': False, 'in': 'query',
+             'description': 'The pagination cursor value.', 'schema': {'type': 'string'}},
+            {'name': self.page_size_query_param, 'required': False, 'in': 'query',
+             'description': 'Number of results to return per page.',
+             'schema': {'type': 'integer'}},
+        ]
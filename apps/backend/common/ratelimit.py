@@ -0,0 +1,299 @@
+"""
+One rate-limit engine for the view decorators and the DRF throttles.
+
+Counts are kept as sliding windows: one integer per key and fixed window in
+the shared cache (``settings.RATE_LIMITER['CACHE_ALIAS']``), bumped with an
+atomic ``incr``. A client's usage is the current window's count plus the
+previous window's count weighted by how much of it still overlaps the
+sliding window. With Redis configured the limits hold across every process;
+with the local-memory cache they are per process.
+
+Clients that are clearly under a large limit are counted locally first and
+flushed to the shared cache in one ``incr`` every ``LOCAL_FLUSH`` hits, so
+most of their requests cost no network round trip. A process can therefore
+under-report by at most ``LOCAL_FLUSH`` hits per key, which is why limits
+below ``LOCAL_MIN_LIMIT`` are always checked against the shared count.
+
+``ratelimit`` and ``is_ratelimited`` accept django-ratelimit's key and rate
+syntax (parsed by the small helpers below rather than the library's private
+ones, so its upgrades can't break them); the throttle classes are drop-in
+replacements for DRF's.
+"""
+import ipaddress
+import re
+import threading
+import time
+from collections import namedtuple
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from django_ratelimit import ALL
+from django_ratelimit.exceptions import Ratelimited
+from rest_framework import throttling
+
+from .cache import LocalLRUCache
+
+DEFAULTS = {
+    'CACHE_ALIAS': 'default',
+    'KEY_PREFIX': 'rl:',
+    'LOCAL_SIZE': 10000,
+    'LOCAL_FRACTION': 0.5,
+    'LOCAL_MIN_LIMIT': 100,
+    'LOCAL_FLUSH': 10,
+}
+
+
+def get_limiter_settings():
+    """Return the RATE_LIMITER settings merged over the defaults."""
+    return {**DEFAULTS, **getattr(settings, 'RATE_LIMITER', {})}
+
+
+Usage = namedtuple('Usage', ['allowed', 'count', 'wait'])
+
+
+class _Window:
+    """What this process knows about one key's current window."""
+
+    __slots__ = ('window', 'previous', 'count', 'pending')
+
+    def __init__(self, window):
+        self.window = window
+        self.previous = None
+        self.count = 0
+        self.pending = 0
+
+
+def _wait(limit, period, offset, previous, count):
+    """Seconds until a sliding-window count of ``count`` drops to ``limit``."""
+    if count > limit:
+        # Wait out this window, then for it to slide far enough off
+        return (period - offset) + period * (1 - limit / count)
+    if previous:
+        return max(0.0, period * (1 - (limit - count) / previous) - offset)
+    return 0.0
+
+
+class SlidingWindowLimiter:
+    """Sliding-window counters in the shared cache with a local pre-check."""
+
+    def __init__(self, options):
+        self.options = options
+        self.cache = caches[options['CACHE_ALIAS']]
+        self.local = LocalLRUCache(options['LOCAL_SIZE'], ttl=24 * 60 * 60)
+        self._lock = threading.Lock()
+
+    def _key(self, key, period, window):
+        return f"{self.options['KEY_PREFIX']}{key}:{period}:{window}"
+
+    def _incr(self, cache_key, delta, timeout):
+        try:
+            return self.cache.incr(cache_key, delta)
+        except ValueError:
+            if self.cache.add(cache_key, delta, timeout):
+                return delta
+            return self.cache.incr(cache_key, delta)
+
+    def hit(self, key, limit, period, increment=True):
+        """Record a request for ``key`` (if ``increment``) and check ``limit`` per ``period``."""
+        now = time.time()
+        window, offset = divmod(now, period)
+        window = int(window)
+        weight = 1 - offset / period
+
+        local_key = (key, period)
+        with self._lock:
+            state = self.local.get(local_key)
+            if state is None or state.window != window:
+                state = _Window(window)
+                self.local.set(local_key, state)
+
+            if (increment and state.previous is not None
+                    and limit >= self.options['LOCAL_MIN_LIMIT']
+                    and state.pending + 1 < self.options['LOCAL_FLUSH']):
+                estimate = state.previous * weight + state.count + state.pending + 1
+                if estimate <= limit * self.options['LOCAL_FRACTION']:
+                    state.pending += 1
+                    return Usage(True, estimate, 0.0)
+
+            delta = state.pending + (1 if increment else 0)
+            state.pending = 0
+            previous = state.previous
+
+        if previous is None:
+            # The previous window no longer changes; fetch it once per window
+            previous = self.cache.get(self._key(key, period, window - 1), 0)
+
+        cache_key = self._key(key, period, window)
+        if delta:
+            # Kept for two periods so it can serve as the next "previous"
+            count = self._incr(cache_key, delta, timeout=2 * period + 5)
+        else:
+            count = self.cache.get(cache_key, 0)
+
+        with self._lock:
+            state.previous = previous
+            state.count = max(state.count, count)
+
+        estimate = previous * weight + count
+        if estimate <= limit:
+            return Usage(True, estimate, 0.0)
+        return Usage(False, estimate, _wait(limit, period, offset, previous, count))
+
+
+_limiter = None
+
+
+def get_limiter():
+    """Return the process-wide rate limiter."""
+    global _limiter
+    if _limiter is None:
+        _limiter = SlidingWindowLimiter(get_limiter_settings())
+    return _limiter
+
+
+@receiver(setting_changed)
+def _reset_limiter(setting, **kwargs):
+    global _limiter
+    if setting in ('RATE_LIMITER', 'CACHES'):
+        _limiter = None
+
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+RATE_RE = re.compile(r'(\d+)/(\d*)([smhd])?')
+
+
+def split_rate(rate):
+    """Return ``(limit, seconds)`` for a rate like ``'10/m'`` or ``'100/5m'``."""
+    if isinstance(rate, tuple):
+        return rate
+    count, multiplier, period = RATE_RE.match(rate).groups()
+    seconds = PERIODS[(period or 's').lower()]
+    return int(count), seconds * int(multiplier) if multiplier else seconds
+
+
+def client_ip(request):
+    """
+    The client's address (``RATELIMIT_IP_META_KEY``), masked to its network
+    with ``RATELIMIT_IPV4_MASK``/``RATELIMIT_IPV6_MASK``.
+    """
+    ip_meta = getattr(settings, 'RATELIMIT_IP_META_KEY', None)
+    if not ip_meta:
+        ip = request.META['REMOTE_ADDR']
+        if not ip:
+            raise ImproperlyConfigured(
+                'REMOTE_ADDR is empty (a reverse proxy on a Unix socket?); '
+                'set RATELIMIT_IP_META_KEY.')
+    elif callable(ip_meta):
+        ip = ip_meta(request)
+    elif '.' in ip_meta:
+        ip = import_string(ip_meta)(request)
+    elif ip_meta in request.META:
+        ip = request.META[ip_meta]
+    else:
+        raise ImproperlyConfigured(f'Could not get IP address from "{ip_meta}"')
+
+    if ':' in ip:
+        mask = getattr(settings, 'RATELIMIT_IPV6_MASK', 64)
+    else:
+        mask = getattr(settings, 'RATELIMIT_IPV4_MASK', 32)
+    return str(ipaddress.ip_network(f'{ip}/{mask}', strict=False).network_address)
+
+
+def _user_or_ip(request):
+    if request.user.is_authenticated:
+        return str(request.user.pk)
+    return client_ip(request)
+
+
+SIMPLE_KEYS = {
+    'ip': client_ip,
+    'user': lambda request: str(request.user.pk),
+    'user_or_ip': _user_or_ip,
+}
+
+ACCESSOR_KEYS = {
+    'get': lambda request, name: request.GET.get(name, ''),
+    'post': lambda request, name: request.POST.get(name, ''),
+    'header': lambda request, name: request.META.get(
+        'HTTP_' + name.replace('-', '_').upper(), ''),
+}
+
+
+def _method_match(request, method):
+    if method == ALL:
+        return True
+    if not isinstance(method, (list, tuple)):
+        method = [method]
+    return request.method in [m.upper() for m in method]
+
+
+def _key_value(key, group, request):
+    if callable(key):
+        return key(group, request)
+    if key in SIMPLE_KEYS:
+        return SIMPLE_KEYS[key](request)
+    if ':' in key:
+        accessor, name = key.split(':', 1)
+        return ACCESSOR_KEYS[accessor](request, name)
+    return import_string(key)(group, request)
+
+
+def is_ratelimited(request, group, key, rate, method=ALL, increment=False):
+    """Like django-ratelimit's ``is_ratelimited``, backed by the sliding-window limiter."""
+    if not getattr(settings, 'RATELIMIT_ENABLE', True) or not _method_match(request, method):
+        return False
+
+    limit, period = split_rate(rate)
+    value = _key_value(key, group, request)
+    usage = get_limiter().hit(f'{group}:{value}', limit, period, increment=increment)
+    return not usage.allowed
+
+
+def ratelimit(group=None, key=None, rate=None, method=ALL, block=True):
+    """Drop-in for django-ratelimit's ``ratelimit`` decorator."""
+
+    def decorator(fn):
+        fn_group = group or f'{fn.__module__}.{fn.__qualname__}'
+
+        @wraps(fn)
+        def _wrapped(request, *args, **kwargs):
+            limited = is_ratelimited(request, fn_group, key, rate, method, increment=True)
+            request.limited = limited or getattr(request, 'limited', False)
+            if limited and block:
+                raise Ratelimited()
+            return fn(request, *args, **kwargs)
+        return _wrapped
+    return decorator
+
+
+class LimiterThrottleMixin:
+    """Check DRF throttle rates with the shared limiter instead of timestamp lists."""
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+
+        usage = get_limiter().hit(key, self.num_requests, self.duration)
+        self._wait = usage.wait
+        return usage.allowed
+
+    def wait(self):
+        return getattr(self, '_wait', None)
+
+
+class AnonRateThrottle(LimiterThrottleMixin, throttling.AnonRateThrottle):
+    pass
+
+
+class UserRateThrottle(LimiterThrottleMixin, throttling.UserRateThrottle):
+    pass
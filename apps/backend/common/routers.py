@@ -0,0 +1,143 @@
+"""
+Send reads to read replicas, keeping anything that must be fresh on the primary.
+
+``ReplicaRouter`` reads from a random alias in ``settings.DATABASE_REPLICAS``
+unless the current request is pinned to the primary. ``ReplicaRoutingMiddleware``
+pins a request when:
+
+- its method is not safe (POST, PATCH, ...),
+- it has written anything (reads after a write must see it), or
+- the same client wrote within the last ``DATABASE_STICKY_SECONDS`` seconds,
+  so it reads its own writes despite replication lag.
+
+Authenticated clients are identified by the user id in their access token,
+so every token of a user (a refreshed one, another device) shares the mark.
+Anonymous writes (registration, login, token refresh) mark the client's IP
+address instead, and reads check both, so a client reading with the token it
+just obtained still sees its write. The sticky marks live in the default
+cache.
+
+Code that can tolerate lag may read from a replica inside an unsafe request
+with ``read_from_replica()``, unless the client is sticky or has written.
+"""
+import contextvars
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+
+class _RequestState:
+    __slots__ = ('unsafe', 'sticky', 'wrote', 'prefer_replica')
+
+    def __init__(self, unsafe=False, sticky=False):
+        self.unsafe = unsafe
+        self.sticky = sticky
+        self.wrote = False
+        self.prefer_replica = False
+
+    @property
+    def use_primary(self):
+        if self.sticky or self.wrote:
+            return True
+        return self.unsafe and not self.prefer_replica
+
+
+_state = contextvars.ContextVar('replica_routing', default=None)
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+@contextmanager
+def read_from_replica():
+    """Allow replica reads inside an unsafe request (e.g. existence checks)."""
+    state = _state.get()
+    if state is None:
+        yield
+        return
+    previous, state.prefer_replica = state.prefer_replica, True
+    try:
+        yield
+    finally:
+        state.prefer_replica = previous
+
+
+class ReplicaRouter:
+    """Route reads to ``DATABASE_REPLICAS`` and writes to the primary."""
+
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+        state = _state.get()
+        if not replicas or (state is not None and state.use_primary):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        return db not in get_replicas()
+
+
+class ReplicaRoutingMiddleware:
+    """Pin requests to the primary when they, or recent ones, write."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def user_id(self, request):
+        """Return the user id of the request's access token, or None if it has no valid one."""
+        # Runs before DRF authenticates; validating the token needs no query
+        authenticator = JWTAuthentication()
+        header = authenticator.get_header(request)
+        raw_token = header and authenticator.get_raw_token(header)
+        if not raw_token:
+            return None
+        try:
+            return authenticator.get_validated_token(raw_token).get(api_settings.USER_ID_CLAIM)
+        except InvalidToken:
+            return None
+
+    def sticky_keys(self, request):
+        """Return the (user, IP) sticky keys; the user key is None for anonymous requests."""
+        user_id = self.user_id(request)
+        user_key = f'primary-sticky:user:{user_id}' if user_id is not None else None
+        return user_key, 'primary-sticky:ip:' + request.META.get('REMOTE_ADDR', '')
+
+    def __call__(self, request):
+        if not get_replicas():
+            return self.get_response(request)
+
+        user_key, ip_key = self.sticky_keys(request)
+        state = _RequestState(
+            unsafe=request.method not in SAFE_METHODS,
+            sticky=bool(cache.get_many([key for key in (user_key, ip_key) if key])),
+        )
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.wrote:
+            cache.set(user_key or ip_key, True,
+                      timeout=getattr(settings, 'DATABASE_STICKY_SECONDS', 5))
+        return response
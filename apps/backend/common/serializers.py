@@ -0,0 +1,177 @@
+"""
+Compiled read-only serializers.
+
+``compile_serializer(UserSerializer)`` returns a ``CompiledSerializer`` that
+produces the same output as the serializer for reads, without the per-field
+``get_attribute``/``to_representation`` calls: the fields are resolved once
+per class into (name, source, converter) triples, and each row is a single
+dict comprehension over them. Converters are only kept where the database
+value differs from its JSON form (datetimes, UUIDs); strings, numbers and
+booleans are copied as they are.
+
+List pages are built from ``values_list`` rows (``CompiledSerializer.values``),
+so no model instances are created either. ``CompiledReadMixin`` uses it for
+the ``list`` and ``retrieve`` actions of a view.
+
+Only serializers whose readable fields are all concrete, non-relational
+model fields can be compiled (no nested serializers, method fields, related
+or dotted sources); ``compile_serializer`` returns None for other
+serializers, and callers fall back to the serializer itself.
+"""
+import datetime
+from functools import lru_cache
+from operator import attrgetter
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.settings import ISO_8601, api_settings
+
+# Numbers and strings come from the database as int and str already, which
+# these return unchanged (BooleanField maps its truthy/falsy spellings to bools)
+PLAIN_REPRESENTATIONS = {
+    serializers.CharField.to_representation,
+    serializers.IntegerField.to_representation,
+    serializers.BooleanField.to_representation,
+}
+
+
+def _uuid_converter(field):
+    if field.uuid_format != 'hex_verbose':
+        return field.to_representation
+    return str
+
+
+def _datetime_converter(field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if output_format is None or output_format.lower() != ISO_8601:
+        return field.to_representation
+    # The current time zone can change per request (timezone.activate)
+    tz = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if tz is None:
+        return field.to_representation
+
+    def convert(value):
+        if value.__class__ is not datetime.datetime or value.tzinfo is None:
+            # Naive datetimes, strings (snapshot claims)...
+            return field.to_representation(value)
+        value = value.astimezone(tz).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+
+    return convert
+
+
+def _converter(field):
+    """Return a factory for the field's converter, or None if it copies values."""
+    if isinstance(field, serializers.UUIDField):
+        return lambda: _uuid_converter(field)
+    if isinstance(field, serializers.DateTimeField):
+        return lambda: _datetime_converter(field)
+    if type(field).to_representation in PLAIN_REPRESENTATIONS:
+        return None
+    field_to_representation = field.to_representation
+    return lambda: field_to_representation
+
+
+class CompiledSerializer:
+    """Read-only output of a serializer class, from instances or value rows."""
+
+    def __init__(self, fields):
+        self.names = tuple(field.field_name for field in fields)
+        self.sources = tuple(field.source for field in fields)
+        self._factories = tuple(_converter(field) for field in fields)
+        self._getter = attrgetter(*self.sources)
+        if len(self.sources) == 1:
+            getter = self._getter
+            self._getter = lambda instance: (getter(instance),)
+
+    def _converters(self):
+        return tuple(factory and factory() for factory in self._factories)
+
+    def values(self, queryset):
+        """Return ``queryset`` as rows for ``to_representation_rows``."""
+        # Named rows, so attribute access (cursor pagination) still works
+        return queryset.values_list(*self.sources, named=True)
+
+    def to_representation_rows(self, rows):
+        """Serialize ``values`` rows, in the serializer's field order."""
+        items = tuple(zip(self.names, self._converters()))
+        return [
+            {name: value if convert is None or value is None else convert(value)
+             for (name, convert), value in zip(items, row)}
+            for row in rows
+        ]
+
+    def to_representation(self, instance):
+        """Serialize a single object."""
+        return self.to_representation_rows([self._getter(instance)])[0]
+
+
+@lru_cache(maxsize=None)
+def compile_serializer(serializer_class):
+    """Return a ``CompiledSerializer`` for ``serializer_class``, or None."""
+    model = getattr(getattr(serializer_class, 'Meta', None), 'model', None)
+    if model is None:
+        return None
+    fields = []
+    for field in serializer_class().fields.values():
+        if field.write_only:
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            # Properties, methods, '*' and dotted sources
+            return None
+        if (not model_field.concrete or model_field.is_relation
+                or isinstance(field, serializers.BaseSerializer)):
+            return None
+        fields.append(field)
+    if not fields:
+        return None
+    return CompiledSerializer(fields)
+
+
+class CompiledReadMixin:
+    """
+    Serve ``list`` and ``retrieve`` from a compiled copy of the view's
+    serializer (see ``compile_serializer``); list pages are read with
+    ``values_list``. Other actions, and serializers that cannot be compiled,
+    go through the serializer as usual.
+    """
+
+    compiled = None
+
+    def get_compiled_serializer(self):
+        return compile_serializer(self.get_serializer_class())
+
+    def list(self, request, *args, **kwargs):
+        self.compiled = self.get_compiled_serializer()
+        return super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        self.compiled = self.get_compiled_serializer()
+        return super().retrieve(request, *args, **kwargs)
+
+    def paginate_queryset(self, queryset):
+        if self.compiled is not None:
+            queryset = self.compiled.values(queryset)
+        return super().paginate_queryset(queryset)
+
+    def get_serializer(self, *args, **kwargs):
+        if self.compiled is None or not args:
+            return super().get_serializer(*args, **kwargs)
+        return CompiledData(self.compiled, args[0], kwargs.get('many', False))
+
+
+class CompiledData:
+    """Stand-in for a bound serializer in ``CompiledReadMixin``; only has ``data``."""
+
+    def __init__(self, compiled, instance, many):
+        if not many:
+            self.data = compiled.to_representation(instance)
+        elif isinstance(instance, list):
+            self.data = compiled.to_representation_rows(instance)
+        else:
+            # An unpaginated queryset
+            self.data = compiled.to_representation_rows(compiled.values(instance))
@@ -4,18 +4,59 @@ from django.utils import timezone
 from django.utils.crypto import get_random_string
 
 
-def generate_unique_username(email, model):
-    """Generate a unique username based on the email."""
-    # Extract the part before @ in the email
-    username = re.sub(r'[^a-zA-Z0-9_.]', '', email.split('@')[0])
+USERNAME_SUFFIX_LENGTH = 5
+USERNAME_MAX_ROUNDS = 10
+
+
+def username_from_email(email, max_length=150):
+    """Derive a username candidate from the part of the email before the @."""
+    username = re.sub(r'[^a-zA-Z0-9_.]', '', email.split('@')[0]) or 'user'
+    # Leave room for a "_<suffix>" on collision
+    return username[:max_length - USERNAME_SUFFIX_LENGTH - 1]
+
+
+def allocate_usernames(emails, model, reserved=()):
+    """
+    Return a unique username for each email, in order.
+
+    Candidates are checked with one ``username__in`` query per round; names
+    that are taken (or claimed earlier in the batch, or in ``reserved``) get a
+    random suffix and go into the next round. This only sees committed rows,
+    so callers must still rely on the unique constraint and retry on
+    ``IntegrityError`` when creating users concurrently.
+    """
+    bases = [username_from_email(email) for email in emails]
+    usernames = [None] * len(bases)
+    candidates = dict(enumerate(bases))
+    claimed = set(reserved)
 
-    # If the username is already taken, append random characters
-    if model.objects.filter(username=username).exists():
-        random_suffix = get_random_string(
-            length=5, allowed_chars=string.ascii_lowercase + string.digits)
-        username = f"{username}_{random_suffix}"
+    for _ in range(USERNAME_MAX_ROUNDS):
+        taken = set(model.objects.filter(
+            username__in=set(candidates.values())).values_list('username', flat=True))
+        taken |= claimed
 
-    return username
+        collisions = {}
+        for index, candidate in candidates.items():
+            if candidate in taken:
+                suffix = get_random_string(
+                    length=USERNAME_SUFFIX_LENGTH,
+                    allowed_chars=string.ascii_lowercase + string.digits)
+                collisions[index] = f"{bases[index]}_{suffix}"
+            else:
+                usernames[index] = candidate
+                taken.add(candidate)
+                claimed.add(candidate)
+
+        if not collisions:
+            return usernames
+        candidates = collisions
+
+    raise RuntimeError('Could not allocate unique usernames')
+
+
+def generate_unique_username(email, model):
+    """Generate a unique username based on the email."""
+    return allocate_usernames([email], model)[0]
 
 
 def is_password_expired(password_changed_date, days=90):
@@ -56,6 +56,7 @@ INSTALLED_APPS = [
     # Third-party apps
     'rest_framework',
     'rest_framework_simplejwt',
+    'rest_framework_simplejwt.token_blacklist',
     'djoser',
     'corsheaders',
     'drf_yasg',
@@ -66,7 +67,9 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    'common.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'common.routers.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,13 +85,19 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Compile each template once per process (email templates included)
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
@@ -100,7 +109,7 @@ WSGI_APPLICATION = 'core.wsgi.application'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': os.getenv('DB_ENGINE', 'django.db.backends.postgresql'),
         'NAME': os.getenv('DB_NAME', 'auth_db'),
         'USER': os.getenv('DB_USER', 'postgres'),
         'PASSWORD': os.getenv('DB_PASSWORD', 'postgres'),
@@ -109,6 +118,92 @@ DATABASES = {
     }
 }
 
+# Connection reuse. DB_POOL=True uses psycopg 3's connection pool (requires
+# `psycopg[pool]`); otherwise connections persist for DB_CONN_MAX_AGE seconds
+# and are health-checked before reuse. That defaults to 0 (a connection per
+# request): under ASGI each request may run in a different thread, so
+# persistent connections pile up instead of being reused; use DB_POOL there.
+# Pool stats: /api/auth/db/pool/, and /metrics as db_pool_* (see
+# common/instrumentation.py)
+DB_POOL = os.getenv('DB_POOL', 'False') == 'True'
+if DB_POOL:
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+            'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', 3600)),
+            'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', 600)),
+        },
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', 0))
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# Read replicas: comma-separated hosts (or database files for SQLite) that
+# mirror the primary. Safe requests read from them; see common/routers.py.
+DATABASE_REPLICAS = []
+for _index, _replica in enumerate(filter(None, os.getenv('DB_REPLICAS', '').split(',')), 1):
+    _alias = f'replica{_index}'
+    _location = 'NAME' if 'sqlite' in DATABASES['default']['ENGINE'] else 'HOST'
+    DATABASES[_alias] = {
+        **DATABASES['default'],
+        _location: _replica.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(_alias)
+
+DATABASE_ROUTERS = ['common.routers.ReplicaRouter']
+
+# Seconds a client keeps reading from the primary after it writes
+DATABASE_STICKY_SECONDS = int(os.getenv('DB_STICKY_SECONDS', 5))
+
+
+# Cache
+# Set REDIS_URL (requires the `redis` package) to share the cache between
+# processes; otherwise each process keeps its own in-memory cache.
+REDIS_URL = os.getenv('REDIS_URL', '')
+
+# Cached users live in their own cache, so culling them can never evict the
+# security state in the default one (rate-limit counters, OTPs, revoked JTIs,
+# idempotency keys)
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'auth',
+        },
+        'users': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'auth-users',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'auth-api',
+            'OPTIONS': {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 100000))},
+        },
+        'users': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'auth-api-users',
+            'OPTIONS': {'MAX_ENTRIES': int(os.getenv('USER_CACHE_MAX_ENTRIES', 20000))},
+        },
+    }
+
+# Users loaded by CachedJWTAuthentication (see accounts/user_cache.py)
+USER_CACHE = {
+    'CACHE_ALIAS': 'users',
+    # Per-process caches would miss other processes' invalidations
+    'SHARED': bool(REDIS_URL),
+    'TIMEOUT': int(os.getenv('USER_CACHE_TIMEOUT', 300)),
+    'LOCAL_SIZE': int(os.getenv('USER_CACHE_LOCAL_SIZE', 1024)),
+    'LOCAL_TTL': int(os.getenv('USER_CACHE_LOCAL_TTL', 5)),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -131,6 +226,33 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing
+# PASSWORD_HASHER picks the hasher for new hashes (pbkdf2, scrypt or argon2;
+# argon2 requires the `argon2-cffi` package). The others stay installed so
+# existing hashes still verify and are upgraded on the user's next login.
+PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', 'pbkdf2')
+_PASSWORD_HASHER_CLASSES = {
+    'pbkdf2': 'common.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'common.hashers.ScryptPasswordHasher',
+    'argon2': 'common.hashers.Argon2PasswordHasher',
+}
+PASSWORD_HASHERS = [_PASSWORD_HASHER_CLASSES[PASSWORD_HASHER]] + [
+    path for name, path in _PASSWORD_HASHER_CLASSES.items() if name != PASSWORD_HASHER
+]
+
+# Hashing runs on a bounded pool (see common/hashers.py); requests that
+# cannot get a slot within WAIT_TIMEOUT seconds get a 503
+PASSWORD_HASHING = {
+    'EXECUTOR': os.getenv('PASSWORD_HASHING_EXECUTOR', 'thread'),
+    'WORKERS': int(os.getenv('PASSWORD_HASHING_WORKERS', os.cpu_count() or 1)),
+    'MAX_PENDING': int(os.getenv('PASSWORD_HASHING_MAX_PENDING', 32)),
+    'WAIT_TIMEOUT': float(os.getenv('PASSWORD_HASHING_WAIT_TIMEOUT', 0.5)),
+}
+for _option in ('PBKDF2_ITERATIONS', 'SCRYPT_WORK_FACTOR', 'ARGON2_TIME_COST',
+                'ARGON2_MEMORY_COST', 'ARGON2_PARALLELISM'):
+    if os.getenv(_option):
+        PASSWORD_HASHING[_option] = int(os.getenv(_option))
+
 # Use custom user model
 AUTH_USER_MODEL = 'accounts.User'
 
@@ -165,14 +287,14 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle',
+        'common.ratelimit.AnonRateThrottle',
+        'common.ratelimit.UserRateThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '100/day',
@@ -183,6 +305,55 @@ REST_FRAMEWORK = {
     'EXCEPTION_HANDLER': 'common.exceptions.custom_exception_handler',
 }
 
+# JSON encoding of API requests and responses: 'orjson' (common/fastjson.py,
+# which falls back to the stdlib when orjson isn't installed) or 'stdlib' (DRF's own)
+API_JSON_BACKEND = os.getenv('API_JSON_BACKEND', 'orjson')
+if API_JSON_BACKEND == 'orjson':
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = [
+        'common.fastjson.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ]
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'] = [
+        'common.fastjson.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ]
+
+# Per-IP rate limits on the password reset endpoints (django-ratelimit) and
+# DRF's default throttles; disable for load testing only
+RATELIMIT_ENABLE = os.getenv('RATELIMIT_ENABLE', 'True') == 'True'
+if not RATELIMIT_ENABLE:
+    REST_FRAMEWORK['DEFAULT_THROTTLE_CLASSES'] = []
+
+# Both are counted by common/ratelimit.py in the default cache, so limits are
+# cluster-wide once REDIS_URL is set
+RATE_LIMITER = {
+    'LOCAL_MIN_LIMIT': int(os.getenv('RATE_LIMITER_LOCAL_MIN_LIMIT', 100)),
+    'LOCAL_FLUSH': int(os.getenv('RATE_LIMITER_LOCAL_FLUSH', 10)),
+}
+
+# Request timing, per-component breakdown of sampled requests (Server-Timing
+# header) and Prometheus metrics at /metrics; see common/instrumentation.py
+INSTRUMENTATION = {
+    'ENABLED': os.getenv('INSTRUMENTATION_ENABLED', 'True') == 'True',
+    'SAMPLE_RATE': float(os.getenv('INSTRUMENTATION_SAMPLE_RATE', 0.1)),
+    'SERVER_TIMING': os.getenv('INSTRUMENTATION_SERVER_TIMING', str(DEBUG)) == 'True',
+    'METRICS_TOKEN': os.getenv('METRICS_TOKEN', ''),
+    'METRICS_ALLOWED_IPS': os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(','),
+}
+
+# Keyset pagination of the admin user list; COUNT is 'exact', 'estimate'
+# (pg_class.reltuples on large unfiltered tables) or 'none'
+PAGINATION = {
+    'PAGE_SIZE': int(os.getenv('PAGINATION_PAGE_SIZE', 50)),
+    'MAX_PAGE_SIZE': int(os.getenv('PAGINATION_MAX_PAGE_SIZE', 500)),
+    'COUNT': os.getenv('PAGINATION_COUNT', 'estimate'),
+}
+
+# Serve the password reset and user details endpoints with the async views in
+# accounts/async_views.py (run under an ASGI server such as uvicorn)
+ASYNC_AUTH_VIEWS = os.getenv('ASYNC_AUTH_VIEWS', 'False') == 'True'
+
 # Simple JWT settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=30),
@@ -198,8 +369,21 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
+    'TOKEN_OBTAIN_SERIALIZER': 'accounts.serializers.TokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'accounts.serializers.TokenRefreshSerializer',
+}
+
+# Revoked refresh tokens are checked in the cache first (see
+# accounts/revocation.py); cache misses are only trusted when it is shared
+TOKEN_REVOCATION = {
+    'TRUST_CACHE': bool(REDIS_URL),
 }
 
+# Embed a user snapshot in access tokens so safe requests skip the user
+# lookup entirely (see accounts/tokens.py); only honoured with REDIS_URL set,
+# since invalidations must reach every process
+JWT_USER_SNAPSHOT = os.getenv('JWT_USER_SNAPSHOT', 'False') == 'True'
+
 # Djoser settings
 DJOSER = {
     'PASSWORD_RESET_CONFIRM_URL': 'password/reset/confirm/{uid}/{token}',
@@ -218,7 +402,8 @@ DJOSER = {
 }
 
 # Email settings
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+EMAIL_BACKEND = os.getenv(
+    'EMAIL_BACKEND', 'common.email_backends.PooledSMTPEmailBackend')
 EMAIL_HOST = os.getenv('EMAIL_HOST', 'smtp.gmail.com')
 EMAIL_PORT = int(os.getenv('EMAIL_PORT', 587))
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
@@ -226,6 +411,45 @@ EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
 EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'True') == 'True'
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'noreply@example.com')
 
+# Password reset OTP storage (see accounts/otp_store.py)
+# BACKEND is 'model' (database rows) or 'cache' (TTL entries keyed by email)
+OTP_STORE = {
+    'BACKEND': os.getenv('OTP_STORE_BACKEND', 'model'),
+    'TTL': int(os.getenv('OTP_TTL', 600)),
+    # Repeat requests within this many seconds keep the live code, no new email
+    'RESEND_COOLDOWN': int(os.getenv('OTP_RESEND_COOLDOWN', 60)),
+    'IDEMPOTENCY_TTL': int(os.getenv('OTP_IDEMPOTENCY_TTL', 3600)),
+    # Seconds a verified OTP's reset token stays valid
+    'RESET_TOKEN_TTL': int(os.getenv('OTP_RESET_TOKEN_TTL', 600)),
+}
+
+# Batched deletion of expired/used OTPs (manage.py cleanup_otps)
+OTP_CLEANUP = {
+    'BATCH_SIZE': int(os.getenv('OTP_CLEANUP_BATCH_SIZE', 1000)),
+    'SLEEP': float(os.getenv('OTP_CLEANUP_SLEEP', 0.1)),
+    'LOCK_BUDGET': float(os.getenv('OTP_CLEANUP_LOCK_BUDGET', 0.5)),
+}
+
+# Warm SMTP connections kept per process by PooledSMTPEmailBackend
+EMAIL_POOL = {
+    'SIZE': int(os.getenv('EMAIL_POOL_SIZE', 4)),
+    'IDLE_TIMEOUT': int(os.getenv('EMAIL_POOL_IDLE_TIMEOUT', 60)),
+    'HEALTH_CHECK_INTERVAL': int(os.getenv('EMAIL_POOL_HEALTH_CHECK_INTERVAL', 10)),
+}
+
+# Background email delivery (see accounts/mail_queue.py)
+# BACKEND is one of 'sync', 'thread' or 'database'; the database backend
+# needs `python manage.py run_email_worker` running alongside the app.
+EMAIL_QUEUE = {
+    'BACKEND': os.getenv('EMAIL_QUEUE_BACKEND', 'thread'),
+    'CONCURRENCY': int(os.getenv('EMAIL_QUEUE_CONCURRENCY', 4)),
+    'MAX_RETRIES': int(os.getenv('EMAIL_QUEUE_MAX_RETRIES', 5)),
+    'RETRY_BACKOFF': int(os.getenv('EMAIL_QUEUE_RETRY_BACKOFF', 2)),
+    'BATCH_SIZE': int(os.getenv('EMAIL_QUEUE_BATCH_SIZE', 50)),
+    # Days sent jobs are kept before the worker deletes them
+    'RETENTION_DAYS': int(os.getenv('EMAIL_QUEUE_RETENTION_DAYS', 7)),
+}
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = os.getenv('CORS_ALLOW_ALL_ORIGINS', 'False') == 'True'
 CORS_ALLOWED_ORIGINS = os.getenv(
@@ -5,6 +5,7 @@ from django.conf.urls.static import static
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+from common.instrumentation import metrics_view
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -23,6 +24,9 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/', include('accounts.urls')),
 
+    # Prometheus metrics (see INSTRUMENTATION)
+    path('metrics', metrics_view, name='metrics'),
+
     # API documentation
     path('swagger/', schema_view.with_ui('swagger',
          cache_timeout=0), name='schema-swagger-ui'),